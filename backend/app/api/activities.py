@@ -1,19 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional, Union
 from datetime import date
 from ..core.database import get_db
-from ..schemas.schemas import Activity, ActivityCreate, ActivityUpdate
+from ..core.responses import FastJSONResponse
+from ..schemas.schemas import (
+    Activity, ActivityCreate, ActivityUpdate, ActivityNearby, ActivityWithCosts, DistanceMatrix,
+    ActivityCalendarPage, GeocodeBackfill, ImportResult, GeocodeResult, ItineraryOptimization, ItineraryOptimizeRequest
+)
+from ..schemas.serializers import serialize_activity, serialize_activity_with_costs
 from ..services.activity_service import ActivityService
+from ..services.activity_ics_service import ActivityIcsService
+from ..services.geocoding_service import GeocodingError, GeocodingService, geocode_activities_in_background
+from ..services.itinerary_service import ItineraryService
+from ..services.trip_service import TripService
 
 router = APIRouter()
 
+@router.get("/activities/nearby", response_model=List[ActivityNearby])
+async def get_nearby_activities_across_trips(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=50),
+    trip_ids: Optional[List[int]] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """Lấy hoạt động trong bán kính quanh một vị trí trên nhiều chuyến đi (trip_ids) hoặc tất cả chuyến đi"""
+    activity_service = ActivityService(db)
+    nearby = activity_service.find_nearby_activities(latitude, longitude, radius_km, trip_ids=trip_ids, limit=limit)
+    return FastJSONResponse([
+        {**serialize_activity(activity), "distance_km": distance} for activity, distance in nearby
+    ])
+
+@router.get("/activities/geocode", response_model=GeocodeResult)
+def geocode_location(q: str = Query(..., min_length=1, max_length=255), db: Session = Depends(get_db)):
+    """Tra tọa độ của một địa điểm (kết quả được lưu cache)"""
+    # Hàm đồng bộ: các request cùng địa điểm chạy song song trong threadpool và dùng chung một lượt tra cứu
+    geocoding_service = GeocodingService(db)
+    try:
+        result = geocoding_service.geocode(q)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except GeocodingError as e:
+        # Lỗi tra cứu (không phải "không tìm thấy"): client có thể thử lại
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy địa điểm"
+        )
+    return result
+
 @router.post("/{trip_id}/activities", response_model=Activity, status_code=status.HTTP_201_CREATED)
-async def create_activity(trip_id: int, activity: ActivityCreate, db: Session = Depends(get_db)):
+async def create_activity(
+    trip_id: int,
+    activity: ActivityCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """Tạo hoạt động mới cho chuyến đi"""
     try:
         activity_service = ActivityService(db)
-        return activity_service.create_activity(trip_id, activity)
+        db_activity = activity_service.create_activity(trip_id, activity)
+        # Có địa điểm nhưng không có tọa độ: tra cứu sau khi đã trả response
+        if db_activity.location and db_activity.latitude is None:
+            background_tasks.add_task(geocode_activities_in_background, activity_ids=[db_activity.id])
+        return db_activity
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -25,11 +86,176 @@ async def create_activity(trip_id: int, activity: ActivityCreate, db: Session =
             detail=f"Không thể tạo hoạt động: {str(e)}"
         )
 
-@router.get("/{trip_id}/activities", response_model=List[Activity])
-async def get_activities(trip_id: int, date_filter: date = None, db: Session = Depends(get_db)):
-    """Lấy danh sách hoạt động của chuyến đi"""
+@router.get("/{trip_id}/activities", response_model=Union[List[ActivityWithCosts], List[Activity]])
+async def get_activities(
+    trip_id: int,
+    date_filter: date = None,
+    date_to: Optional[date] = None,
+    include_costs: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Lấy danh sách hoạt động của chuyến đi (include_costs=true để kèm tổng chi phí của từng hoạt động)"""
+    activity_service = ActivityService(db)
+    activities = activity_service.get_activities_by_trip(trip_id, date_filter, date_to)
+    if include_costs:
+        # Cả chuyến đi thì gom nhóm toàn bộ, lọc theo ngày thì chỉ lấy các hoạt động đã tải
+        activity_ids = [activity.id for activity in activities] if date_filter or date_to else None
+        costs = activity_service.get_activity_costs(trip_id, activity_ids)
+        return FastJSONResponse([serialize_activity_with_costs(activity, costs) for activity in activities])
+    return FastJSONResponse([serialize_activity(activity) for activity in activities])
+
+@router.get(
+    "/{trip_id}/activities/by-date",
+    response_model=Union[Dict[str, List[ActivityWithCosts]], Dict[str, List[Activity]]]
+)
+async def get_activities_by_date(
+    trip_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    include_costs: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Lấy hoạt động nhóm theo ngày"""
+    activity_service = ActivityService(db)
+    grouped = activity_service.get_activities_grouped_by_date(trip_id, date_from, date_to)
+    if include_costs:
+        activity_ids = [activity.id for activities in grouped.values() for activity in activities] if date_from or date_to else None
+        costs = activity_service.get_activity_costs(trip_id, activity_ids)
+        return FastJSONResponse({
+            day: [serialize_activity_with_costs(activity, costs) for activity in activities]
+            for day, activities in grouped.items()
+        })
+    return FastJSONResponse({
+        day: [serialize_activity(activity) for activity in activities] for day, activities in grouped.items()
+    })
+
+@router.get("/{trip_id}/activities/calendar", response_model=ActivityCalendarPage)
+async def get_activity_calendar(
+    trip_id: int,
+    cursor: Optional[date] = None,
+    days: int = Query(14, ge=1, le=62),
+    include_activities: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Lấy danh sách ngày của chuyến đi kèm số hoạt động mỗi ngày (phân trang theo cursor là ngày)"""
+    activity_service = ActivityService(db)
+    page = activity_service.get_activity_calendar(trip_id, cursor=cursor, days=days, include_activities=include_activities)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy chuyến đi"
+        )
+    return FastJSONResponse({
+        "days": [
+            {
+                "day": calendar_day.day,
+                "activity_count": calendar_day.activity_count,
+                "activities": [serialize_activity(activity) for activity in calendar_day.activities]
+                if calendar_day.activities is not None else None
+            }
+            for calendar_day in page.days
+        ],
+        "next_cursor": page.next_cursor
+    })
+
+@router.get("/{trip_id}/activities/nearby", response_model=List[ActivityNearby])
+async def get_nearby_activities(
+    trip_id: int,
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=50),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """Lấy hoạt động của chuyến đi trong bán kính quanh một vị trí"""
     activity_service = ActivityService(db)
-    return activity_service.get_activities_by_trip(trip_id, date_filter)
+    nearby = activity_service.find_nearby_activities(latitude, longitude, radius_km, trip_ids=[trip_id], limit=limit)
+    return FastJSONResponse([
+        {**serialize_activity(activity), "distance_km": distance} for activity, distance in nearby
+    ])
+
+@router.get("/{trip_id}/activities/distance-matrix", response_model=DistanceMatrix)
+async def get_distance_matrix(
+    trip_id: int,
+    day: Optional[date] = None,
+    activity_ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Lấy ma trận khoảng cách giữa các hoạt động của chuyến đi (lọc theo ngày hoặc danh sách id)"""
+    activity_service = ActivityService(db)
+    matrix = activity_service.get_distance_matrix(trip_id, day=day, activity_ids=activity_ids)
+    return FastJSONResponse(matrix.model_dump())
+
+@router.post("/{trip_id}/activities/optimize-itinerary", response_model=ItineraryOptimization)
+def optimize_itinerary(trip_id: int, request: ItineraryOptimizeRequest, db: Session = Depends(get_db)):
+    """Đề xuất thứ tự hoạt động ngắn nhất cho từng ngày và quãng đường tiết kiệm được"""
+    # Hàm đồng bộ: việc tính toán chạy trong threadpool, không chặn event loop
+    itinerary_service = ItineraryService(db)
+    try:
+        result = itinerary_service.optimize(trip_id, request)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return FastJSONResponse(result.model_dump())
+
+@router.get("/{trip_id}/activities/export")
+async def export_activities(trip_id: int, db: Session = Depends(get_db)):
+    """Xuất hoạt động của chuyến đi ra file iCalendar (.ics, truyền theo luồng)"""
+    trip = TripService(db).get_trip(trip_id)
+    if not trip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy chuyến đi"
+        )
+    return StreamingResponse(
+        ActivityIcsService(db).export_activities(trip),
+        media_type="text/calendar",
+        headers={"Content-Disposition": f'attachment; filename="trip-{trip_id}-activities.ics"'}
+    )
+
+@router.post("/{trip_id}/activities/import", response_model=ImportResult)
+async def import_activities(
+    trip_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Nhập hoạt động hàng loạt từ file iCalendar (.ics, đọc theo luồng)"""
+    try:
+        # Phần ghi DB chạy trong threadpool để không chặn event loop khi file lớn
+        import_service = ActivityIcsService(db)
+        await run_in_threadpool(import_service.start_import, trip_id)
+        async for chunk in request.stream():
+            await run_in_threadpool(import_service.feed, chunk)
+        result = await run_in_threadpool(import_service.finish)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể nhập hoạt động: {str(e)}"
+        )
+    
+    # Sự kiện có LOCATION nhưng không có GEO: tra tọa độ sau khi đã trả response
+    if result.imported:
+        background_tasks.add_task(geocode_activities_in_background, trip_id=trip_id)
+    return result
+
+@router.post("/{trip_id}/activities/geocode", response_model=GeocodeBackfill, status_code=status.HTTP_202_ACCEPTED)
+async def geocode_trip_activities(trip_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Điền tọa độ (chạy nền) cho các hoạt động của chuyến đi có địa điểm nhưng chưa có tọa độ"""
+    activity_service = ActivityService(db)
+    queued = activity_service.count_activities_missing_coordinates(trip_id)
+    if queued:
+        background_tasks.add_task(geocode_activities_in_background, trip_id=trip_id)
+    return GeocodeBackfill(queued=queued)
 
 @router.get("/{trip_id}/activities/{activity_id}", response_model=Activity)
 async def get_activity(trip_id: int, activity_id: int, db: Session = Depends(get_db)):
@@ -44,15 +270,23 @@ async def get_activity(trip_id: int, activity_id: int, db: Session = Depends(get
     return activity
 
 @router.put("/{trip_id}/activities/{activity_id}", response_model=Activity)
-async def update_activity(trip_id: int, activity_id: int, activity_update: ActivityUpdate, db: Session = Depends(get_db)):
+async def update_activity(
+    trip_id: int,
+    activity_id: int,
+    activity_update: ActivityUpdate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """Cập nhật thông tin hoạt động"""
     activity_service = ActivityService(db)
-    activity = activity_service.update_activity(activity_id, activity_update)
-    if not activity or activity.trip_id != trip_id:
+    activity = activity_service.update_activity(activity_id, trip_id, activity_update)
+    if not activity:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy hoạt động"
         )
+    if activity.location and activity.latitude is None:
+        background_tasks.add_task(geocode_activities_in_background, activity_ids=[activity.id])
     return activity
 
 @router.delete("/{trip_id}/activities/{activity_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -65,9 +299,3 @@ async def delete_activity(trip_id: int, activity_id: int, db: Session = Depends(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy hoạt động"
         )
-
-@router.get("/{trip_id}/activities/by-date", response_model=dict)
-async def get_activities_by_date(trip_id: int, db: Session = Depends(get_db)):
-    """Lấy hoạt động nhóm theo ngày"""
-    activity_service = ActivityService(db)
-    return activity_service.get_activities_grouped_by_date(trip_id)
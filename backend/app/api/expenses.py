@@ -1,20 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import date
 from ..core.database import get_db
-from ..schemas.schemas import Expense, ExpenseCreate, ExpenseUpdate, ExpenseCategory, ExpenseCategoryCreate
+from ..core.responses import FastJSONResponse
+from ..schemas.schemas import Expense, ExpenseCreate, ExpenseUpdate, ExpenseCategory, ExpenseCategoryCreate, ImportResult, ExpenseAnalytics, ExpenseBatchSelection, ExpenseBatchUpdate, ExpenseBatchResult
+from ..schemas.serializers import serialize_expense, serialize_expenses, serialize_member
 from ..services.expense_service import ExpenseService
+from ..services.member_directory import MemberDirectory
+from ..services.expense_import_service import ExpenseImportService
+from ..services.expense_export_service import ExpenseExportService
+from ..services.trip_service import TripService
 from ..models.models import ExpenseCategoryEnum
 
 router = APIRouter()
 
+def _member_payloads(db: Session, trip_id: int) -> Dict[int, Dict]:
+    """Người trả tiền lấy từ danh bạ thành viên (một truy vấn), không lazy-load quan hệ paid_by_member"""
+    return {
+        member_id: serialize_member(member)
+        for member_id, member in MemberDirectory(db).get_members(trip_id).items()
+    }
+
 @router.post("/{trip_id}/expenses", response_model=Expense, status_code=status.HTTP_201_CREATED)
 async def create_expense(trip_id: int, expense: ExpenseCreate, db: Session = Depends(get_db)):
     """Tạo chi phí mới cho chuyến đi"""
     try:
         expense_service = ExpenseService(db)
-        return expense_service.create_expense(trip_id, expense)
+        db_expense = expense_service.create_expense(trip_id, expense)
+        return FastJSONResponse(
+            serialize_expense(db_expense, _member_payloads(db, trip_id)),
+            status_code=status.HTTP_201_CREATED
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -26,6 +45,108 @@ async def create_expense(trip_id: int, expense: ExpenseCreate, db: Session = Dep
             detail=f"Không thể tạo chi phí: {str(e)}"
         )
 
+@router.post("/{trip_id}/expenses/import", response_model=ImportResult)
+async def import_expenses(
+    trip_id: int,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: Session = Depends(get_db)
+):
+    """Nhập chi phí hàng loạt từ CSV hoặc NDJSON (đọc theo luồng)"""
+    if not format:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "json" in content_type else "csv"
+    
+    try:
+        # Phần ghi DB chạy trong threadpool để không chặn event loop khi file lớn
+        import_service = ExpenseImportService(db)
+        await run_in_threadpool(import_service.start_import, trip_id, format)
+        async for chunk in request.stream():
+            await run_in_threadpool(import_service.feed, chunk)
+        return await run_in_threadpool(import_service.finish)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể nhập chi phí: {str(e)}"
+        )
+
+@router.post("/{trip_id}/expenses/batch-update", response_model=ExpenseBatchResult)
+async def batch_update_expenses(trip_id: int, batch: ExpenseBatchUpdate, db: Session = Depends(get_db)):
+    """Cập nhật hàng loạt chi phí theo danh sách id hoặc bộ lọc"""
+    try:
+        expense_service = ExpenseService(db)
+        selection = ExpenseBatchSelection(ids=batch.ids, filter=batch.filter)
+        return expense_service.batch_update_expenses(trip_id, selection, batch.patch)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể cập nhật chi phí: {str(e)}"
+        )
+
+@router.post("/{trip_id}/expenses/batch-delete", response_model=ExpenseBatchResult)
+async def batch_delete_expenses(trip_id: int, selection: ExpenseBatchSelection, db: Session = Depends(get_db)):
+    """Xóa hàng loạt chi phí theo danh sách id hoặc bộ lọc"""
+    try:
+        expense_service = ExpenseService(db)
+        return expense_service.batch_delete_expenses(trip_id, selection)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể xóa chi phí: {str(e)}"
+        )
+
+@router.get("/{trip_id}/expenses/export")
+async def export_expenses(
+    trip_id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    category: Optional[ExpenseCategoryEnum] = None,
+    paid_by: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    is_shared: Optional[bool] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    db: Session = Depends(get_db)
+):
+    """Xuất chi phí của chuyến đi ra CSV hoặc NDJSON (truyền theo luồng)"""
+    if not TripService(db).get_trip(trip_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy chuyến đi"
+        )
+    
+    conditions = ExpenseService(db).build_expense_filters(
+        trip_id,
+        category=category,
+        paid_by=paid_by,
+        date_from=date_from,
+        date_to=date_to,
+        is_shared=is_shared,
+        q=q
+    )
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        ExpenseExportService(db).export_expenses(conditions, format),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="trip-{trip_id}-expenses.{format}"'}
+    )
+
 @router.get("/{trip_id}/expenses", response_model=List[Expense])
 async def get_expenses(
     trip_id: int, 
@@ -36,11 +157,13 @@ async def get_expenses(
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     is_shared: Optional[bool] = None,
+    q: Optional[str] = Query(None, max_length=200),
+    with_totals: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Lấy danh sách chi phí của chuyến đi với bộ lọc"""
+    """Lấy danh sách chi phí của chuyến đi với bộ lọc (with_totals: trả tổng số dòng và tổng tiền qua header)"""
     expense_service = ExpenseService(db)
-    return expense_service.get_expenses_by_trip(
+    expenses, totals = expense_service.get_expenses_by_trip(
         trip_id=trip_id,
         skip=skip,
         limit=limit,
@@ -48,8 +171,33 @@ async def get_expenses(
         paid_by=paid_by,
         date_from=date_from,
         date_to=date_to,
-        is_shared=is_shared
+        is_shared=is_shared,
+        q=q,
+        with_totals=with_totals
     )
+    headers = {}
+    if totals:
+        headers["X-Total-Count"] = str(totals.total_count)
+        headers["X-Total-Amount"] = str(totals.total_amount)
+    return FastJSONResponse(serialize_expenses(expenses, _member_payloads(db, trip_id)), headers=headers)
+
+@router.get("/{trip_id}/expenses/analytics", response_model=ExpenseAnalytics)
+async def get_expense_analytics(trip_id: int, db: Session = Depends(get_db)):
+    """Lấy thống kê chi phí theo danh mục, ngày, thành viên, danh mục×ngày và hoạt động"""
+    expense_service = ExpenseService(db)
+    return expense_service.get_expense_analytics(trip_id)
+
+@router.get("/{trip_id}/expenses/summary", response_model=dict)
+async def get_expense_summary(trip_id: int, db: Session = Depends(get_db)):
+    """Lấy tóm tắt chi phí theo danh mục và ngày"""
+    expense_service = ExpenseService(db)
+    return expense_service.get_expense_summary(trip_id)
+
+@router.get("/{trip_id}/expenses/by-member", response_model=dict)
+async def get_expenses_by_member(trip_id: int, db: Session = Depends(get_db)):
+    """Lấy chi phí theo từng thành viên"""
+    expense_service = ExpenseService(db)
+    return expense_service.get_expenses_by_member(trip_id)
 
 @router.get("/{trip_id}/expenses/{expense_id}", response_model=Expense)
 async def get_expense(trip_id: int, expense_id: int, db: Session = Depends(get_db)):
@@ -61,19 +209,19 @@ async def get_expense(trip_id: int, expense_id: int, db: Session = Depends(get_d
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy chi phí"
         )
-    return expense
+    return FastJSONResponse(serialize_expense(expense, _member_payloads(db, trip_id)))
 
 @router.put("/{trip_id}/expenses/{expense_id}", response_model=Expense)
 async def update_expense(trip_id: int, expense_id: int, expense_update: ExpenseUpdate, db: Session = Depends(get_db)):
     """Cập nhật thông tin chi phí"""
     expense_service = ExpenseService(db)
-    expense = expense_service.update_expense(expense_id, expense_update)
-    if not expense or expense.trip_id != trip_id:
+    expense = expense_service.update_expense(expense_id, trip_id, expense_update)
+    if not expense:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy chi phí"
         )
-    return expense
+    return FastJSONResponse(serialize_expense(expense, _member_payloads(db, trip_id)))
 
 @router.delete("/{trip_id}/expenses/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_expense(trip_id: int, expense_id: int, db: Session = Depends(get_db)):
@@ -86,18 +234,6 @@ async def delete_expense(trip_id: int, expense_id: int, db: Session = Depends(ge
             detail="Không tìm thấy chi phí"
         )
 
-@router.get("/{trip_id}/expenses/summary", response_model=dict)
-async def get_expense_summary(trip_id: int, db: Session = Depends(get_db)):
-    """Lấy tóm tắt chi phí theo danh mục và ngày"""
-    expense_service = ExpenseService(db)
-    return expense_service.get_expense_summary(trip_id)
-
-@router.get("/{trip_id}/expenses/by-member", response_model=dict)
-async def get_expenses_by_member(trip_id: int, db: Session = Depends(get_db)):
-    """Lấy chi phí theo từng thành viên"""
-    expense_service = ExpenseService(db)
-    return expense_service.get_expenses_by_member(trip_id)
-
 # Expense Categories
 @router.post("/{trip_id}/categories", response_model=ExpenseCategory, status_code=status.HTTP_201_CREATED)
 async def create_expense_category(trip_id: int, category: ExpenseCategoryCreate, db: Session = Depends(get_db)):
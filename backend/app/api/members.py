@@ -2,8 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 from ..core.database import get_db
-from ..schemas.schemas import TripMember, TripMemberCreate, TripMemberUpdate
+from ..core.responses import FastJSONResponse
+from ..schemas.schemas import (
+    TripMember, TripMemberCreate, TripMemberBulkCreate, TripMemberUpdate, TripMemberMerge, TripMemberMergeResult
+)
+from ..schemas.serializers import serialize_member
 from ..services.member_service import MemberService
+from ..services.member_directory import MemberDirectory
 
 router = APIRouter()
 
@@ -24,11 +29,29 @@ async def create_member(trip_id: int, member: TripMemberCreate, db: Session = De
             detail=f"Không thể thêm thành viên: {str(e)}"
         )
 
+@router.post("/{trip_id}/members/bulk", response_model=List[TripMember], status_code=status.HTTP_201_CREATED)
+async def create_members(trip_id: int, roster: TripMemberBulkCreate, db: Session = Depends(get_db)):
+    """Thêm nhiều thành viên vào chuyến đi trong một lần (tất cả hoặc không thành viên nào)"""
+    try:
+        member_service = MemberService(db)
+        members = member_service.create_members(trip_id, roster.members)
+        return FastJSONResponse([serialize_member(member) for member in members], status_code=status.HTTP_201_CREATED)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể thêm thành viên: {str(e)}"
+        )
+
 @router.get("/{trip_id}/members", response_model=List[TripMember])
 async def get_members(trip_id: int, db: Session = Depends(get_db)):
     """Lấy danh sách thành viên của chuyến đi"""
-    member_service = MemberService(db)
-    return member_service.get_members_by_trip(trip_id)
+    members = MemberDirectory(db).get_members(trip_id)
+    return FastJSONResponse([serialize_member(member) for member in members.values()])
 
 @router.get("/{trip_id}/members/{member_id}", response_model=TripMember)
 async def get_member(trip_id: int, member_id: int, db: Session = Depends(get_db)):
@@ -46,8 +69,14 @@ async def get_member(trip_id: int, member_id: int, db: Session = Depends(get_db)
 async def update_member(trip_id: int, member_id: int, member_update: TripMemberUpdate, db: Session = Depends(get_db)):
     """Cập nhật thông tin thành viên"""
     member_service = MemberService(db)
-    member = member_service.update_member(member_id, member_update)
-    if not member or member.trip_id != trip_id:
+    try:
+        member = member_service.update_member(member_id, trip_id, member_update)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if not member:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy thành viên"
@@ -65,6 +94,25 @@ async def delete_member(trip_id: int, member_id: int, db: Session = Depends(get_
             detail="Không tìm thấy thành viên"
         )
 
+@router.post("/{trip_id}/members/{member_id}/merge", response_model=TripMemberMergeResult)
+async def merge_member(trip_id: int, member_id: int, merge: TripMemberMerge, db: Session = Depends(get_db)):
+    """Gộp thành viên trùng (member_id) vào thành viên into_member_id và xóa thành viên trùng"""
+    member_service = MemberService(db)
+    try:
+        result = member_service.merge_members(trip_id, member_id, merge.into_member_id, merge.factor_policy)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy thành viên"
+        )
+    member, moved = result
+    return FastJSONResponse({"member": serialize_member(member), "moved_expenses": moved})
+
 @router.post("/{trip_id}/join", response_model=TripMember)
 async def join_trip(trip_id: int, member: TripMemberCreate, db: Session = Depends(get_db)):
     """Tham gia chuyến đi bằng mã mời"""
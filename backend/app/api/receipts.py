@@ -0,0 +1,94 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import List
+from ..core.database import get_db
+from ..core.responses import file_response
+from ..schemas.schemas import Receipt
+from ..services.receipt_service import ReceiptService
+from ..services.receipt_thumbnails import generate_thumbnails, thumbnail_key
+
+router = APIRouter()
+
+@router.post("/{trip_id}/expenses/{expense_id}/receipts", response_model=List[Receipt], status_code=status.HTTP_201_CREATED)
+async def upload_receipts(
+    trip_id: int,
+    expense_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Tải hóa đơn lên cho chi phí (multipart/form-data, ghi theo luồng)"""
+    receipt_service = ReceiptService(db)
+    try:
+        # Ghi file và truy vấn DB chạy trong threadpool để không chặn event loop
+        await run_in_threadpool(receipt_service.start_upload, trip_id, expense_id, request.headers.get("content-type"))
+        async for chunk in request.stream():
+            await run_in_threadpool(receipt_service.feed, chunk)
+        receipts = await run_in_threadpool(receipt_service.finish)
+    except ValueError as e:
+        await run_in_threadpool(receipt_service.abort)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        await run_in_threadpool(receipt_service.abort)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Không thể tải hóa đơn lên: {str(e)}"
+        )
+
+    # Ảnh thu nhỏ được tạo sau khi đã trả response, trong process pool
+    background_tasks.add_task(generate_thumbnails, [receipt.id for receipt in receipts if not receipt.has_thumbnail])
+    return receipts
+
+@router.get("/{trip_id}/expenses/{expense_id}/receipts", response_model=List[Receipt])
+async def get_receipts(trip_id: int, expense_id: int, db: Session = Depends(get_db)):
+    """Lấy danh sách hóa đơn của chi phí"""
+    receipt_service = ReceiptService(db)
+    return receipt_service.get_receipts(trip_id, expense_id)
+
+@router.get("/{trip_id}/expenses/{expense_id}/receipts/{receipt_id}")
+async def download_receipt(
+    trip_id: int,
+    expense_id: int,
+    receipt_id: int,
+    request: Request,
+    thumbnail: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Tải hóa đơn (hỗ trợ Range request) hoặc ảnh thu nhỏ"""
+    receipt_service = ReceiptService(db)
+    receipt = receipt_service.get_receipt(trip_id, expense_id, receipt_id)
+    if not receipt or (thumbnail and not receipt.has_thumbnail):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy hóa đơn"
+        )
+
+    key = thumbnail_key(receipt.sha256) if thumbnail else receipt.sha256
+    if not receipt_service.store.exists(key):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy file hóa đơn"
+        )
+
+    return file_response(
+        receipt_service.store.path(key),
+        "image/jpeg" if thumbnail else receipt.content_type,
+        range_header=request.headers.get("range"),
+        filename=None if thumbnail else receipt.filename,
+        etag=key
+    )
+
+@router.delete("/{trip_id}/expenses/{expense_id}/receipts/{receipt_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_receipt(trip_id: int, expense_id: int, receipt_id: int, db: Session = Depends(get_db)):
+    """Xóa hóa đơn"""
+    receipt_service = ReceiptService(db)
+    success = receipt_service.delete_receipt(trip_id, expense_id, receipt_id)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy hóa đơn"
+        )
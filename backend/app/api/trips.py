@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..core.database import get_db
+from ..core.responses import FastJSONResponse
 from ..models.models import Trip as TripModel, TripMember as TripMemberModel
-from ..schemas.schemas import Trip, TripCreate, TripUpdate, TripWithDetails, TripSummary
+from ..schemas.schemas import Trip, TripCreate, TripUpdate, TripWithDetails, TripSummary, SearchResults, TripOverviewPage
+from ..schemas.serializers import serialize_trip, serialize_trip_details
 from ..services.trip_service import TripService
 from ..services.settlement_service import SettlementService
+from ..services.search_service import SearchService
 import random
 import string
 import logging
@@ -46,7 +49,7 @@ async def get_trips(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
         trip_service = TripService(db)
         trips = trip_service.get_trips(skip=skip, limit=limit)
         logger.info(f"[get_trips] Retrieved {len(trips)} trips")
-        return trips
+        return FastJSONResponse([serialize_trip(trip) for trip in trips])
     except Exception as e:
         logger.error(
             f"[get_trips] Failed. skip={skip}, limit={limit}, err={e!r}, type={type(e)}"
@@ -57,6 +60,33 @@ async def get_trips(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
             detail=f"Lỗi khi lấy danh sách chuyến đi: {str(e)}"
         )
 
+@router.get("/overview", response_model=TripOverviewPage)
+async def get_trips_overview(
+    cursor: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Lấy danh sách chuyến đi kèm thống kê cho dashboard (phân trang theo cursor)"""
+    trip_service = TripService(db)
+    return trip_service.get_trips_overview(cursor=cursor, limit=limit)
+
+@router.get("/search", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=255),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Tìm kiếm chuyến đi và hoạt động theo tên, điểm đến, mô tả, địa điểm"""
+    try:
+        search_service = SearchService(db)
+        return search_service.search(q, skip=skip, limit=limit)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get("/{trip_id}", response_model=TripWithDetails)
 async def get_trip(trip_id: int, db: Session = Depends(get_db)):
     """Lấy thông tin chi tiết chuyến đi"""
@@ -68,7 +98,7 @@ async def get_trip(trip_id: int, db: Session = Depends(get_db)):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Không tìm thấy chuyến đi"
             )
-        return trip
+        return FastJSONResponse(serialize_trip_details(trip))
     except HTTPException:
         raise
     except Exception as e:
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from typing import List
 import os
+import tempfile
 
 class Settings(BaseSettings):
     # Database
@@ -17,6 +18,21 @@ class Settings(BaseSettings):
     
     # External APIs
     google_maps_api_key: str = ""
+    exchange_rates_file: str = ""  # CSV tỷ giá (date,currency,rate theo USD)
+    geocoding_provider: str = ""  # "google", "gazetteer" hoặc để trống (tự chọn theo cấu hình)
+    gazetteer_file: str = ""  # CSV địa danh (name,latitude,longitude[,address]) dùng khi không có API
+    geocode_cache_ttl_days: int = 90
+    geocode_miss_ttl_days: int = 7  # Thời hạn lưu kết quả "không tìm thấy"
+    
+    # Receipts
+    # Thư mục lưu file hóa đơn; mặc định trong thư mục tạm (ghi được trên Vercel nhưng mất khi instance bị thu hồi)
+    receipts_dir: str = os.path.join(tempfile.gettempdir(), "tripeasy-receipts")
+    max_receipt_size_mb: int = 20
+    thumbnail_workers: int = 2  # Số process tạo ảnh thu nhỏ
+    
+    # Itinerary
+    optimizer_workers: int = 2  # Số process tối ưu lộ trình khi yêu cầu nhiều ngày
+    activity_timezone: str = "Asia/Ho_Chi_Minh"  # Giờ hoạt động được lưu là giờ địa phương theo múi giờ này
     
     # CORS - Handle as string and split
     cors_origins: str = "http://localhost:3000"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, update
 from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -63,4 +63,36 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def commit_keep_loaded(db) -> None:
+    """Commit mà không expire các đối tượng trong session (chỉ dùng trong các hàm ghi)
+
+    Response được dựng từ giá trị vừa ghi thay vì SELECT lại từng dòng; cột do server sinh
+    (created_at, updated_at) vẫn được nạp lại khi truy cập.
+    """
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
+
+def update_returning(db, model, values: dict, *criteria):
+    """UPDATE một dòng theo điều kiện (vd. id và trip_id) và trả về dòng sau khi cập nhật, None nếu không có dòng nào khớp
+
+    Trên MySQL (database đang dùng) vẫn là hai câu lệnh: UPDATE rồi một SELECT theo cùng điều kiện.
+    """
+    if not values:
+        return db.query(model).filter(*criteria).first()
+    if "updated_at" in model.__table__.c:
+        # Thời điểm cập nhật lấy theo đồng hồ của database, giống server_default của created_at
+        values = {**values, "updated_at": func.now()}
+    stmt = update(model).where(*criteria).values(**values).execution_options(synchronize_session=False)
+    if db.get_bind().dialect.update_returning:
+        # SQLite/PostgreSQL: đọc lại dòng ngay trong câu UPDATE (MariaDB chỉ có RETURNING cho INSERT/DELETE)
+        return db.scalars(stmt.returning(model), execution_options={"populate_existing": True}).first()
+    # MySQL không hỗ trợ RETURNING: kiểm tra rowcount (số dòng khớp điều kiện, CLIENT_FOUND_ROWS) rồi SELECT lại dòng
+    if db.execute(stmt).rowcount == 0:
+        return None
+    return db.query(model).filter(*criteria).populate_existing().first()
@@ -0,0 +1,98 @@
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+import enum
+import json
+import os
+import re
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """Chuyển các kiểu không có sẵn trong JSON giống cách Pydantic xuất (Decimal -> chuỗi)"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Không thể chuyển kiểu {type(value).__name__} sang JSON")
+
+def dumps(content: Any) -> bytes:
+    """Chuyển dữ liệu (dict/list chứa Decimal, datetime, Enum) thành JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng orjson (nếu có), nhận trực tiếp Decimal/datetime mà không qua jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def parse_range_header(range_header: str, size: int) -> Tuple[int, int]:
+    """Phân tích header Range (một khoảng byte), trả về (start, end) bao gồm cả end"""
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not match or match.group(1) == match.group(2) == "":
+        raise RangeNotSatisfiable("Range không hợp lệ")
+
+    first, last = match.groups()
+    if first == "":
+        # bytes=-N: N byte cuối
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable("Range vượt quá kích thước file")
+    return start, end
+
+def _iter_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def file_response(
+    path: str,
+    content_type: str,
+    range_header: Optional[str] = None,
+    filename: Optional[str] = None,
+    etag: Optional[str] = None
+) -> StreamingResponse:
+    """Trả file theo từng phần, hỗ trợ Range request (206 Partial Content)"""
+    size = os.path.getsize(path)
+    headers: Dict[str, str] = {"Accept-Ranges": "bytes"}
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+
+    if not range_header or size == 0:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size - 1), media_type=content_type, headers=headers)
+
+    try:
+        start, end = parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{size}"
+        return StreamingResponse(iter(()), status_code=416, headers=headers)
+
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_file(path, start, end), status_code=206, media_type=content_type, headers=headers)
@@ -3,7 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from .core.config import settings
 from .core.database import engine, Base
-from .api import trips, members, activities, expenses
+from .core.responses import FastJSONResponse
+from .api import trips, members, activities, expenses, receipts
+from .services.member_service import set_member_unique_keys_enforced
 import logging
 from sqlalchemy import text
 
@@ -31,14 +33,112 @@ try:
         # Basic indexes if missing (ignore errors if exist)
         "CREATE INDEX IF NOT EXISTS idx_invite_code ON trips(invite_code)",
     ]
+    # Cột expenses cần cho tính năng mới (tỷ giá cần nhiều chữ số thập phân hơn, ví dụ VND -> USD)
+    ensure_expense_columns_sql = [
+        "ALTER TABLE expenses MODIFY COLUMN exchange_rate DECIMAL(18,8) DEFAULT 1.0",
+    ]
+    # Cột geohash cho tìm kiếm hoạt động lân cận (giá trị được tính bằng Python ở bước backfill bên dưới)
+    ensure_activity_columns_sql = [
+        "ALTER TABLE activities ADD COLUMN geohash VARCHAR(12) NULL",
+    ]
+    # Cột mới kèm dữ liệu backfill: backfill chỉ chạy ngay khi cột vừa được thêm thành công
+    ensure_backfill_columns_sql = {
+        "ALTER TABLE expenses ADD COLUMN base_amount DECIMAL(20,2) NULL": [
+            "UPDATE expenses SET base_amount = ROUND(amount * exchange_rate, 2) WHERE base_amount IS NULL",
+        ],
+    }
+    # Indexes (lỗi "Duplicate key name" nếu đã tồn tại sẽ bị bỏ qua)
+    ensure_index_sql = [
+        # Đổi tên index cũ của schema.sql theo tên khai báo trong models
+        "ALTER TABLE expenses RENAME INDEX idx_trip_date TO idx_expenses_trip_date",
+        "ALTER TABLE activities RENAME INDEX idx_trip_date TO idx_activities_trip_date",
+        # FULLTEXT indexes cho tìm kiếm
+        "CREATE FULLTEXT INDEX ft_trips_search ON trips(name, destination, description)",
+        "CREATE FULLTEXT INDEX ft_activities_search ON activities(name, location)",
+        "CREATE FULLTEXT INDEX ft_expenses_description ON expenses(description)",
+        # Indexes theo các bộ lọc thực tế của service
+        "CREATE INDEX idx_expenses_trip_date ON expenses(trip_id, date)",
+        "CREATE INDEX idx_expenses_trip_payer_shared ON expenses(trip_id, paid_by, is_shared)",
+        "CREATE INDEX idx_expenses_trip_category ON expenses(trip_id, category)",
+        "CREATE INDEX idx_activities_trip_date ON activities(trip_id, date)",
+        "CREATE INDEX idx_activities_geohash ON activities(geohash)",
+        # Form tham gia cũ gửi email rỗng: đổi thành NULL để nhiều thành viên không có email không vi phạm unique key
+        "UPDATE trip_members SET email = NULL WHERE email = ''",
+        "ALTER TABLE trip_members ADD UNIQUE KEY unique_name_per_trip (trip_id, name)",
+        "ALTER TABLE trip_members ADD UNIQUE KEY unique_email_per_trip (trip_id, email)",
+        "ALTER TABLE expense_categories ADD UNIQUE KEY unique_category_per_trip (trip_id, name)",
+    ]
+    # Indexes thừa hoặc độ chọn lọc thấp (chạy sau khi đã có index thay thế cho khóa ngoại)
+    ensure_drop_index_sql = [
+        "DROP INDEX idx_shared ON expenses",
+        "DROP INDEX idx_category ON expenses",
+        "DROP INDEX idx_expenses_amount ON expenses",
+        "DROP INDEX idx_expenses_exchange_rate ON expenses",
+        "DROP INDEX idx_expenses_shared_payer_amount ON expenses",
+        "DROP INDEX idx_expenses_shared_category_amount ON expenses",
+        "DROP INDEX idx_location ON activities",
+        "DROP INDEX idx_trip_id ON trip_members",
+        "DROP INDEX idx_email ON trip_members",
+        "DROP INDEX idx_members_factor ON trip_members",
+        "DROP INDEX idx_trip_id ON expense_categories",
+        # Index trùng với khóa chính do create_all tạo trước đây (index=True trên cột id)
+        "DROP INDEX ix_trips_id ON trips",
+        "DROP INDEX ix_trip_members_id ON trip_members",
+        "DROP INDEX ix_activities_id ON activities",
+        "DROP INDEX ix_expenses_id ON expenses",
+        "DROP INDEX ix_expense_categories_id ON expense_categories",
+        "DROP INDEX ix_exchange_rates_id ON exchange_rates",
+    ]
+    
+    def ensure_step(conn, stmt) -> bool:
+        try:
+            conn.execute(text(stmt))
+            return True
+        except Exception as sub_e:
+            # Some MySQL variants may not support IF NOT EXISTS on certain clauses; ignore if already exists
+            logger.warning(f"Schema ensure step ignored/failed: {stmt} -> {sub_e}")
+            return False
+    
     with engine.begin() as conn:
-        for stmt in ensure_trip_columns_sql:
-            try:
-                conn.execute(text(stmt))
-            except Exception as sub_e:
-                # Some MySQL variants may not support IF NOT EXISTS on certain clauses; ignore if already exists
-                logger.warning(f"Schema ensure step ignored/failed: {stmt} -> {sub_e}")
+        for stmt in ensure_trip_columns_sql + ensure_expense_columns_sql + ensure_activity_columns_sql:
+            ensure_step(conn, stmt)
+        for stmt, backfill_stmts in ensure_backfill_columns_sql.items():
+            if ensure_step(conn, stmt):
+                for backfill_stmt in backfill_stmts:
+                    ensure_step(conn, backfill_stmt)
+        for stmt in ensure_index_sql + ensure_drop_index_sql:
+            ensure_step(conn, stmt)
+        
+        # Kiểm tra trùng tên/email thành viên dựa vào unique key: thiếu key thì báo lỗi và bật kiểm tra bằng truy vấn
+        member_keys = {"unique_name_per_trip", "unique_email_per_trip"}
+        present_keys = {row[0] for row in conn.execute(text(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'trip_members'"
+        ))}
+        missing_keys = member_keys - present_keys
+        set_member_unique_keys_enforced(not missing_keys)
+        if missing_keys:
+            logger.error(
+                f"trip_members thiếu unique key {sorted(missing_keys)} (dữ liệu trùng?): "
+                f"kiểm tra trùng tên/email thành viên bằng truy vấn cho đến khi sửa dữ liệu"
+            )
     logger.info("Schema ensure: trips columns verified")
+    
+    # Lần đầu có bảng tổng hợp chi phí theo ngày: dựng lại từ dữ liệu chi phí hiện có
+    from .core.database import SessionLocal
+    from .models.models import Expense, ExpenseDailyRollup
+    from .services.expense_rollup_service import ExpenseRollupService
+    from .services.activity_service import ActivityService
+    with SessionLocal() as db:
+        if db.query(ExpenseDailyRollup.trip_id).first() is None and db.query(Expense.id).first() is not None:
+            ExpenseRollupService(db).rebuild()
+            db.commit()
+            logger.info("Expense daily rollups rebuilt")
+        
+        # Hoạt động có tọa độ nhưng chưa có geohash (dữ liệu cũ)
+        backfilled = ActivityService(db).backfill_geohashes()
+        if backfilled:
+            logger.info(f"Activity geohashes backfilled: {backfilled}")
 except Exception as e:
     logger.error(f"Error creating/ensuring database tables: {e}")
     # Continue anyway, tables might already exist
@@ -49,7 +149,8 @@ app = FastAPI(
     description="API cho ứng dụng quản lý du lịch TripEasy",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -59,6 +160,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Total-Amount", "Content-Disposition"],
 )
 
 # Exception handlers
@@ -145,6 +247,7 @@ app.include_router(trips.router, prefix="/api/trips", tags=["Trips"])
 app.include_router(members.router, prefix="/api/trips", tags=["Members"])
 app.include_router(activities.router, prefix="/api/trips", tags=["Activities"])
 app.include_router(expenses.router, prefix="/api/trips", tags=["Expenses"])
+app.include_router(receipts.router, prefix="/api/trips", tags=["Receipts"])
 
 if __name__ == "__main__":
     import uvicorn
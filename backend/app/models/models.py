@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DECIMAL, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, Date, DateTime, Boolean, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -23,7 +23,7 @@ class ExpenseCategoryEnum(str, enum.Enum):
 class Trip(Base):
     __tablename__ = "trips"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)  # Re-enabled after database schema setup
     destination = Column(String(255), nullable=False)
@@ -40,11 +40,17 @@ class Trip(Base):
     members = relationship("TripMember", back_populates="trip", cascade="all, delete-orphan")
     activities = relationship("Activity", back_populates="trip", cascade="all, delete-orphan")
     expenses = relationship("Expense", back_populates="trip", cascade="all, delete-orphan")
+    expense_rollups = relationship("ExpenseDailyRollup", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # FULLTEXT index phục vụ tìm kiếm chuyến đi
+        Index("ft_trips_search", "name", "destination", "description", mysql_prefix="FULLTEXT"),
+    )
 
 class TripMember(Base):
     __tablename__ = "trip_members"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     trip_id = Column(Integer, ForeignKey("trips.id"), nullable=False)
     name = Column(String(255), nullable=False)
     email = Column(String(255), nullable=True)
@@ -55,11 +61,17 @@ class TripMember(Base):
     # Relationships
     trip = relationship("Trip", back_populates="members")
     expenses_paid = relationship("Expense", back_populates="paid_by_member")
+    
+    __table_args__ = (
+        # Tiền tố trip_id phục vụ luôn việc lấy thành viên theo chuyến đi
+        UniqueConstraint("trip_id", "name", name="unique_name_per_trip"),
+        UniqueConstraint("trip_id", "email", name="unique_email_per_trip"),
+    )
 
 class Activity(Base):
     __tablename__ = "activities"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     trip_id = Column(Integer, ForeignKey("trips.id"), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
@@ -67,24 +79,35 @@ class Activity(Base):
     location = Column(String(500), nullable=True)
     latitude = Column(DECIMAL(10, 8), nullable=True)
     longitude = Column(DECIMAL(11, 8), nullable=True)
+    geohash = Column(String(12), nullable=True)  # Tính từ latitude/longitude, dùng cho tìm kiếm lân cận
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # Relationships
     trip = relationship("Trip", back_populates="activities")
     expenses = relationship("Expense", back_populates="activity")
+    
+    __table_args__ = (
+        # Lấy hoạt động theo chuyến đi, sắp xếp/lọc theo ngày
+        Index("idx_activities_trip_date", "trip_id", "date"),
+        # Tìm hoạt động lân cận: lọc theo tiền tố geohash (LIKE 'abc%' dùng được index)
+        Index("idx_activities_geohash", "geohash"),
+        # FULLTEXT index phục vụ tìm kiếm hoạt động
+        Index("ft_activities_search", "name", "location", mysql_prefix="FULLTEXT"),
+    )
 
 class Expense(Base):
     __tablename__ = "expenses"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     trip_id = Column(Integer, ForeignKey("trips.id"), nullable=False)
     activity_id = Column(Integer, ForeignKey("activities.id"), nullable=True)
     paid_by = Column(Integer, ForeignKey("trip_members.id"), nullable=False)
     description = Column(String(500), nullable=False)
     amount = Column(DECIMAL(15, 2), nullable=False)
     currency = Column(Enum(CurrencyEnum), nullable=False)
-    exchange_rate = Column(DECIMAL(10, 4), default=1.0)  # Tỷ giá quy đổi về tiền tệ chính
+    exchange_rate = Column(DECIMAL(18, 8), default=1.0)  # Tỷ giá quy đổi về tiền tệ chính
+    base_amount = Column(DECIMAL(20, 2), nullable=True)  # amount * exchange_rate, lưu sẵn cho các truy vấn tổng hợp
     category = Column(Enum(ExpenseCategoryEnum), default=ExpenseCategoryEnum.OTHER)
     is_shared = Column(Boolean, default=True)  # Chi phí chung hay riêng
     date = Column(DateTime, nullable=False)
@@ -95,12 +118,89 @@ class Expense(Base):
     trip = relationship("Trip", back_populates="expenses")
     activity = relationship("Activity", back_populates="expenses")
     paid_by_member = relationship("TripMember", back_populates="expenses_paid")
+    receipts = relationship("Receipt", back_populates="expense", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Theo các bộ lọc của danh sách chi phí: ngày (kèm sắp xếp), người trả (+ chung/riêng), danh mục
+        Index("idx_expenses_trip_date", "trip_id", "date"),
+        Index("idx_expenses_trip_payer_shared", "trip_id", "paid_by", "is_shared"),
+        Index("idx_expenses_trip_category", "trip_id", "category"),
+        # FULLTEXT index cho tìm kiếm theo mô tả chi phí
+        Index("ft_expenses_description", "description", mysql_prefix="FULLTEXT"),
+    )
+
+class Receipt(Base):
+    __tablename__ = "receipts"
+    
+    id = Column(Integer, primary_key=True)
+    expense_id = Column(Integer, ForeignKey("expenses.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(Integer, nullable=False)  # Bytes
+    sha256 = Column(String(64), nullable=False)  # Cũng là khóa lưu trữ: file trùng nội dung chỉ lưu một lần
+    has_thumbnail = Column(Boolean, default=False)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    # Relationships
+    expense = relationship("Expense", back_populates="receipts")
+    
+    __table_args__ = (
+        UniqueConstraint("expense_id", "sha256", name="unique_receipt_per_expense"),
+        Index("idx_receipts_sha256", "sha256"),
+    )
 
 class ExpenseCategory(Base):
     __tablename__ = "expense_categories"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     trip_id = Column(Integer, ForeignKey("trips.id"), nullable=False)
     name = Column(String(255), nullable=False)
     color = Column(String(7), default="#6B7280")  # Hex color code
     created_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("trip_id", "name", name="unique_category_per_trip"),
+    )
+
+class ExchangeRate(Base):
+    __tablename__ = "exchange_rates"
+    
+    id = Column(Integer, primary_key=True)
+    currency = Column(Enum(CurrencyEnum), nullable=False)
+    rate_date = Column(Date, nullable=False)
+    rate = Column(DECIMAL(20, 10), nullable=False)  # Số đơn vị tiền tệ đổi được 1 USD
+    created_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("currency", "rate_date", name="unique_currency_date"),
+    )
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+    
+    # Kết quả tra cứu địa điểm theo chuỗi đã chuẩn hóa; kết quả "không tìm thấy" cũng được lưu (found = False)
+    id = Column(Integer, primary_key=True)
+    query_key = Column(String(255), nullable=False)
+    provider = Column(String(50), nullable=False)
+    found = Column(Boolean, nullable=False, default=False)
+    latitude = Column(DECIMAL(10, 8), nullable=True)
+    longitude = Column(DECIMAL(11, 8), nullable=True)
+    formatted_address = Column(String(500), nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("query_key", name="unique_geocode_query"),
+    )
+
+class ExpenseDailyRollup(Base):
+    __tablename__ = "expense_daily_rollups"
+    
+    # Bảng tổng hợp chi phí theo ngày, được ExpenseService cập nhật tăng dần khi ghi chi phí
+    trip_id = Column(Integer, ForeignKey("trips.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    category = Column(Enum(ExpenseCategoryEnum), primary_key=True)
+    paid_by = Column(Integer, primary_key=True)
+    is_shared = Column(Boolean, primary_key=True)
+    total = Column(DECIMAL(20, 2), nullable=False, default=0)  # Tổng base_amount
+    expense_count = Column(Integer, nullable=False, default=0)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Dict
+from datetime import datetime, date
 from decimal import Decimal
 from ..models.models import CurrencyEnum, ExpenseCategoryEnum
 
@@ -46,6 +46,9 @@ class TripMemberBase(BaseModel):
 class TripMemberCreate(TripMemberBase):
     pass
 
+class TripMemberBulkCreate(BaseModel):
+    members: List[TripMemberCreate] = Field(..., min_length=1, max_length=500)
+
 class TripMemberUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     email: Optional[str] = None  # Changed from EmailStr to str
@@ -60,6 +63,14 @@ class TripMember(TripMemberBase):
     class Config:
         from_attributes = True
 
+class TripMemberMerge(BaseModel):
+    into_member_id: int  # Thành viên được giữ lại
+    factor_policy: str = Field("keep", pattern="^(keep|sum|max)$")  # Hệ số sau khi gộp: giữ nguyên, cộng, lấy lớn hơn
+
+class TripMemberMergeResult(BaseModel):
+    member: TripMember
+    moved_expenses: int
+
 # Activity schemas
 class ActivityBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
@@ -89,6 +100,64 @@ class Activity(ActivityBase):
     class Config:
         from_attributes = True
 
+class ActivityNearby(Activity):
+    distance_km: float
+
+class ActivityCosts(BaseModel):
+    expense_count: int = 0
+    total: Decimal = Decimal("0")  # Quy đổi về tiền tệ chính của chuyến đi
+    shared_total: Decimal = Decimal("0")
+    private_total: Decimal = Decimal("0")
+    by_payer: Dict[int, Decimal] = {}  # member_id -> tổng đã trả
+
+class ActivityWithCosts(Activity):
+    costs: ActivityCosts
+
+class GeocodeResult(BaseModel):
+    query: str  # Chuỗi địa điểm đã chuẩn hóa (khóa cache)
+    found: bool
+    latitude: Optional[Decimal] = None
+    longitude: Optional[Decimal] = None
+    formatted_address: Optional[str] = None
+    provider: str
+    cached: bool
+
+class GeocodeBackfill(BaseModel):
+    queued: int  # Số hoạt động chờ điền tọa độ
+
+class CalendarDay(BaseModel):
+    day: date
+    activity_count: int
+    activities: Optional[List[Activity]] = None  # Chỉ có khi include_activities=true
+
+class ActivityCalendarPage(BaseModel):
+    days: List[CalendarDay]
+    next_cursor: Optional[date] = None  # Ngày đầu của cửa sổ tiếp theo, truyền lại để lấy trang tiếp theo
+
+class DistanceMatrix(BaseModel):
+    activity_ids: List[int]  # Thứ tự hàng/cột của ma trận (theo ngày giờ hoạt động)
+    distances_km: List[List[float]]
+    skipped_ids: List[int] = []  # Id được yêu cầu nhưng không có tọa độ hoặc không thuộc chuyến đi
+
+class ItineraryOptimizeRequest(BaseModel):
+    days: List[date] = Field(..., min_length=1, max_length=31)
+    fixed_activity_ids: List[int] = []  # Hoạt động giữ nguyên thứ tự tương đối
+    respect_times: bool = True  # Hoạt động có giờ cụ thể (khác 00:00) được xem là cố định
+    keep_start: bool = True  # Giữ nguyên điểm xuất phát của mỗi ngày
+    time_budget_ms: int = Field(200, ge=10, le=5000)  # Thời gian tìm kiếm tối đa cho mỗi ngày
+
+class DayItinerary(BaseModel):
+    day: date
+    activity_ids: List[int]  # Thứ tự đề xuất
+    original_distance_km: float
+    optimized_distance_km: float
+    distance_saved_km: float
+    unrouted_ids: List[int] = []  # Hoạt động không có tọa độ, không được sắp xếp lại
+
+class ItineraryOptimization(BaseModel):
+    days: List[DayItinerary]
+    total_distance_saved_km: float
+
 # Expense schemas
 class ExpenseBase(BaseModel):
     description: str = Field(..., min_length=1, max_length=500)
@@ -118,6 +187,7 @@ class Expense(ExpenseBase):
     id: int
     trip_id: int
     paid_by: int
+    base_amount: Optional[Decimal] = None  # Số tiền đã quy đổi về tiền tệ chính
     created_at: datetime
     updated_at: datetime
     paid_by_member: TripMember
@@ -125,6 +195,43 @@ class Expense(ExpenseBase):
     class Config:
         from_attributes = True
 
+class ExpenseListTotals(BaseModel):
+    total_count: int  # Số chi phí khớp bộ lọc (không tính phân trang)
+    total_amount: Decimal = Decimal("0")  # Tổng base_amount của các chi phí khớp bộ lọc
+
+# Receipt schemas
+class Receipt(BaseModel):
+    id: int
+    expense_id: int
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    has_thumbnail: bool = False
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# Batch expense schemas
+class ExpenseFilter(BaseModel):
+    category: Optional[ExpenseCategoryEnum] = None
+    paid_by: Optional[int] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    is_shared: Optional[bool] = None
+    q: Optional[str] = Field(None, max_length=200)
+
+class ExpenseBatchSelection(BaseModel):
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=5000)
+    filter: Optional[ExpenseFilter] = None  # Bộ lọc rỗng {} = toàn bộ chi phí của chuyến đi
+
+class ExpenseBatchUpdate(ExpenseBatchSelection):
+    patch: ExpenseUpdate
+
+class ExpenseBatchResult(BaseModel):
+    affected: int
+
 # Expense Category schemas
 class ExpenseCategoryBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
@@ -169,4 +276,59 @@ class TripSummary(BaseModel):
     member_balances: List[MemberBalance]
     settlements: List[Settlement]
     expense_by_category: dict
-    expense_by_date: dict
\ No newline at end of file
+    expense_by_date: dict
+
+# Expense analytics schemas
+class ExpenseBreakdown(BaseModel):
+    total: Decimal = Decimal("0")
+    shared_total: Decimal = Decimal("0")
+    count: int = 0
+
+class MemberExpenseBreakdown(ExpenseBreakdown):
+    name: str
+
+class ExpenseAnalytics(BaseModel):
+    overall: ExpenseBreakdown
+    by_category: Dict[str, ExpenseBreakdown]
+    by_date: Dict[str, ExpenseBreakdown]
+    by_member: Dict[int, MemberExpenseBreakdown]
+    by_category_date: Dict[str, Dict[str, ExpenseBreakdown]]
+    by_activity: Dict[int, ExpenseBreakdown]  # Chỉ gồm chi phí có gắn hoạt động
+
+# Bulk import schemas
+class ImportRowError(BaseModel):
+    row: int  # Số dòng trong file nguồn (tính cả dòng tiêu đề)
+    error: str
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError] = []
+
+# Dashboard overview schemas
+class TripOverview(BaseModel):
+    trip: Trip
+    member_count: int
+    activity_count: int
+    expense_count: int
+    total_expenses: Decimal
+    total_shared_expenses: Decimal
+
+class TripOverviewPage(BaseModel):
+    items: List[TripOverview]
+    next_cursor: Optional[int] = None  # id chuyến đi cuối trang, truyền lại để lấy trang tiếp theo
+
+# Search schemas
+class SearchHit(BaseModel):
+    kind: str  # "trip" hoặc "activity"
+    id: int
+    trip_id: int
+    title: str
+    subtitle: Optional[str] = None
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    skip: int
+    limit: int
+    items: List[SearchHit]
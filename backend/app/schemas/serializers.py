@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional
+from ..models.models import (
+    Trip as TripModel,
+    TripMember as TripMemberModel,
+    Activity as ActivityModel,
+    Expense as ExpenseModel
+)
+from .schemas import ActivityCosts
+
+# Chuyển ORM object thành dict theo đúng các trường của schema tương ứng, không dựng Pydantic model cho
+# từng dòng. Giá trị Decimal/datetime giữ nguyên để FastJSONResponse xuất ra cùng định dạng với Pydantic.
+
+def serialize_trip(trip: TripModel) -> Dict:
+    """Tương ứng schema Trip"""
+    return {
+        "name": trip.name,
+        "description": trip.description,
+        "destination": trip.destination,
+        "start_date": trip.start_date,
+        "end_date": trip.end_date,
+        "currency": trip.currency,
+        "child_factor": trip.child_factor,
+        "rounding_rule": trip.rounding_rule,
+        "id": trip.id,
+        "invite_code": trip.invite_code,
+        "created_at": trip.created_at,
+        "updated_at": trip.updated_at
+    }
+
+def serialize_member(member: TripMemberModel) -> Dict:
+    """Tương ứng schema TripMember"""
+    return {
+        "name": member.name,
+        "email": member.email,
+        "factor": member.factor,
+        "id": member.id,
+        "trip_id": member.trip_id,
+        "is_admin": member.is_admin,
+        "created_at": member.created_at
+    }
+
+def serialize_activity(activity: ActivityModel) -> Dict:
+    """Tương ứng schema Activity"""
+    return {
+        "name": activity.name,
+        "description": activity.description,
+        "date": activity.date,
+        "location": activity.location,
+        "latitude": activity.latitude,
+        "longitude": activity.longitude,
+        "id": activity.id,
+        "trip_id": activity.trip_id,
+        "created_at": activity.created_at,
+        "updated_at": activity.updated_at
+    }
+
+def serialize_activity_with_costs(activity: ActivityModel, costs: Dict[int, ActivityCosts]) -> Dict:
+    """Tương ứng schema ActivityWithCosts; costs: chi phí đã tổng hợp theo activity_id"""
+    activity_costs = costs.get(activity.id) or ActivityCosts()
+    return {
+        **serialize_activity(activity),
+        "costs": {
+            "expense_count": activity_costs.expense_count,
+            "total": activity_costs.total,
+            "shared_total": activity_costs.shared_total,
+            "private_total": activity_costs.private_total,
+            "by_payer": activity_costs.by_payer
+        }
+    }
+
+def serialize_expense(expense: ExpenseModel, members: Dict[int, Dict]) -> Dict:
+    """Tương ứng schema Expense; members: thành viên đã serialize theo id (dùng chung cho cả danh sách)"""
+    member = members.get(expense.paid_by)
+    if member is None:
+        member = members[expense.paid_by] = serialize_member(expense.paid_by_member)
+    return {
+        "description": expense.description,
+        "amount": expense.amount,
+        "currency": expense.currency,
+        "exchange_rate": expense.exchange_rate,
+        "category": expense.category,
+        "is_shared": expense.is_shared,
+        "date": expense.date,
+        "activity_id": expense.activity_id,
+        "id": expense.id,
+        "trip_id": expense.trip_id,
+        "paid_by": expense.paid_by,
+        "base_amount": expense.base_amount,
+        "created_at": expense.created_at,
+        "updated_at": expense.updated_at,
+        "paid_by_member": member
+    }
+
+def serialize_expenses(expenses: List[ExpenseModel], members: Optional[Dict[int, Dict]] = None) -> List[Dict]:
+    """Tương ứng List[Expense]; mỗi thành viên trả tiền chỉ được serialize một lần"""
+    members = {} if members is None else members
+    return [serialize_expense(expense, members) for expense in expenses]
+
+def serialize_trip_details(trip: TripModel) -> Dict:
+    """Tương ứng schema TripWithDetails"""
+    members = {member.id: serialize_member(member) for member in trip.members}
+    data = serialize_trip(trip)
+    data["members"] = list(members.values())
+    data["activities"] = [serialize_activity(activity) for activity in trip.activities]
+    data["expenses"] = [serialize_expense(expense, members) for expense in trip.expenses]
+    return data
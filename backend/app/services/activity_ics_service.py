@@ -0,0 +1,316 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from pydantic import ValidationError
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import codecs
+import re
+from ..core.config import settings
+from ..models.models import Activity as ActivityModel, Trip as TripModel
+from ..schemas.schemas import ActivityCreate, ImportResult, ImportRowError
+from ..utils.geo import geohash_encode
+from .activity_service import clear_distance_cache
+
+PRODID = "-//TripEasy//Activities//VI"
+UID_DOMAIN = "tripeasy"
+_OWN_UID = re.compile(rf"^activity-(\d+)@{UID_DOMAIN}$")
+
+def _escape(text: str) -> str:
+    """Escape giá trị TEXT theo RFC 5545"""
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+def _fold(line: str) -> str:
+    """Gấp dòng dài hơn 75 byte (không cắt giữa ký tự UTF-8), kết thúc bằng CRLF"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    limit = 75
+    for ch in line:
+        if len((current + ch).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            limit = 74  # Dòng tiếp theo bắt đầu bằng một khoảng trắng
+        current += ch
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+def _format_utc(value: Optional[datetime]) -> str:
+    return (value or datetime.utcnow()).strftime("%Y%m%dT%H%M%SZ")
+
+def _zone(name: str) -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def _parse_ics_datetime(value: str, params: Dict[str, str]) -> datetime:
+    """DTSTART dạng ngày (VALUE=DATE) hoặc ngày giờ, đổi về giờ địa phương không kèm múi giờ như khi xuất
+
+    Giờ UTC (hậu tố Z, Google/Apple xuất dạng này) và giờ có TZID được đổi sang múi giờ activity_timezone;
+    giờ "floating" hoặc TZID không nhận ra được giữ nguyên.
+    """
+    value = value.strip()
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.combine(datetime.strptime(value, "%Y%m%d").date(), time.min)
+        parsed = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    except ValueError:
+        raise ValueError(f"Ngày giờ không hợp lệ: '{value}'")
+
+    if value.endswith("Z"):
+        source = timezone.utc
+    else:
+        source = _zone(params["TZID"].lstrip("/")) if params.get("TZID") else None
+    local = _zone(settings.activity_timezone)
+    if source is None or local is None:
+        return parsed
+    return parsed.replace(tzinfo=source).astimezone(local).replace(tzinfo=None)
+
+class ActivityIcsService:
+    # Giống nhập chi phí: sự kiện được đọc dần qua feed() và chèn theo lô
+    BATCH_SIZE = 500
+    MAX_REPORTED_ERRORS = 1000
+    CHUNK_SIZE = 1000
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def export_activities(self, trip: TripModel) -> Iterator[str]:
+        """Xuất hoạt động của chuyến đi ra iCalendar (truyền theo luồng)"""
+        yield "".join(_fold(line) for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:{_escape(trip.name)}",
+            f"X-WR-TIMEZONE:{settings.activity_timezone}"
+        ))
+
+        stmt = select(
+            ActivityModel.id,
+            ActivityModel.name,
+            ActivityModel.description,
+            ActivityModel.date,
+            ActivityModel.location,
+            ActivityModel.latitude,
+            ActivityModel.longitude,
+            ActivityModel.updated_at
+        ).where(ActivityModel.trip_id == trip.id).order_by(ActivityModel.date, ActivityModel.id)
+
+        result = self.db.execute(stmt.execution_options(stream_results=True, yield_per=self.CHUNK_SIZE))
+        for rows in result.partitions():
+            yield "".join(self._write_event(row) for row in rows)
+
+        yield _fold("END:VCALENDAR")
+
+    def _write_event(self, row) -> str:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:activity-{row.id}@{UID_DOMAIN}",
+            f"DTSTAMP:{_format_utc(row.updated_at)}"
+        ]
+        if row.date.time() == time.min:
+            # Chưa xếp giờ: sự kiện cả ngày
+            lines.append(f"DTSTART;VALUE=DATE:{row.date.strftime('%Y%m%d')}")
+            lines.append(f"DTEND;VALUE=DATE:{(row.date + timedelta(days=1)).strftime('%Y%m%d')}")
+        else:
+            lines.append(f"DTSTART:{row.date.strftime('%Y%m%dT%H%M%S')}")
+        lines.append(f"SUMMARY:{_escape(row.name)}")
+        if row.description:
+            lines.append(f"DESCRIPTION:{_escape(row.description)}")
+        if row.location:
+            lines.append(f"LOCATION:{_escape(row.location)}")
+        if row.latitude is not None and row.longitude is not None:
+            lines.append(f"GEO:{row.latitude};{row.longitude}")
+        lines.append("END:VEVENT")
+        return "".join(_fold(line) for line in lines)
+
+    def start_import(self, trip_id: int) -> None:
+        """Chuẩn bị phiên nhập: tải khoảng thời gian chuyến đi và id hoạt động hiện có một lần"""
+        trip = self.db.query(TripModel).filter(TripModel.id == trip_id).first()
+        if not trip:
+            raise ValueError("Chuyến đi không tồn tại")
+
+        activity_ids = self.db.query(ActivityModel.id).filter(ActivityModel.trip_id == trip_id).all()
+
+        self.trip_id = trip_id
+        self.start_day = trip.start_date.date()
+        self.end_day = trip.end_date.date()
+        self.activity_ids = {activity_id for (activity_id,) in activity_ids}
+
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._pending = ""
+        self._logical: Optional[str] = None
+        self._line_no = 0
+        self._logical_start = 0
+        self._components: List[str] = []
+        self._event: Optional[Dict[str, Tuple[Dict[str, str], str]]] = None
+        self._event_start = 0
+        self._seen_uids = set()
+        self._batch: List[Dict] = []
+        self._imported = 0
+        self._failed = 0
+        self._errors: List[ImportRowError] = []
+
+    def feed(self, chunk: bytes) -> None:
+        """Nhận thêm một phần dữ liệu và xử lý các dòng đã hoàn chỉnh"""
+        self._pending += self._decoder.decode(chunk)
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            self._consume_line(line)
+
+    def finish(self) -> ImportResult:
+        """Xử lý phần còn lại, chèn lô cuối và commit toàn bộ phiên nhập"""
+        self._pending += self._decoder.decode(b"", final=True)
+        if self._pending:
+            self._consume_line(self._pending)
+            self._pending = ""
+        self._flush_logical()
+        if self._event is not None:
+            self._record_error(self._event_start, "Sự kiện thiếu END:VEVENT")
+            self._event = None
+
+        try:
+            self._flush_batch()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        if self._imported:
+            clear_distance_cache(self.trip_id)
+
+        return ImportResult(
+            imported=self._imported,
+            failed=self._failed,
+            errors=self._errors
+        )
+
+    def _consume_line(self, line: str) -> None:
+        self._line_no += 1
+        line = line.rstrip("\r")
+        if line[:1] in (" ", "\t"):
+            # Dòng gấp: nối vào dòng logic trước đó
+            if self._logical is not None:
+                self._logical += line[1:]
+            return
+        self._flush_logical()
+        self._logical = line
+        self._logical_start = self._line_no
+
+    def _flush_logical(self) -> None:
+        if self._logical is None:
+            return
+        line, self._logical = self._logical, None
+        if line.strip():
+            self._handle_content_line(self._logical_start, line)
+
+    def _handle_content_line(self, line_no: int, line: str) -> None:
+        head, sep, value = line.partition(":")
+        if not sep:
+            return  # Dòng không đúng cú pháp (thường do công cụ khác gấp dòng sai): bỏ qua
+        name, *raw_params = head.split(";")
+        name = name.upper()
+        params = {}
+        for raw in raw_params:
+            key, _, param_value = raw.partition("=")
+            params[key.upper()] = param_value.strip('"')
+
+        if name == "BEGIN":
+            component = value.strip().upper()
+            self._components.append(component)
+            if component == "VEVENT" and len(self._components) == 2:
+                self._event = {}
+                self._event_start = line_no
+            return
+        if name == "END":
+            component = self._components.pop() if self._components else None
+            if component == "VEVENT" and self._event is not None:
+                event, self._event = self._event, None
+                self._handle_event(self._event_start, event)
+            return
+
+        # Chỉ lấy thuộc tính trực tiếp của VEVENT (bỏ qua VALARM lồng bên trong)
+        if self._event is not None and self._components[-1:] == ["VEVENT"]:
+            self._event.setdefault(name, (params, value))
+
+    def _handle_event(self, row_no: int, event: Dict[str, Tuple[Dict[str, str], str]]) -> None:
+        try:
+            activity = self._validate_event(event)
+        except ValueError as e:
+            self._record_error(row_no, str(e))
+            return
+
+        self._batch.append({
+            "trip_id": self.trip_id,
+            "name": activity.name,
+            "description": activity.description,
+            "date": activity.date,
+            "location": activity.location,
+            "latitude": activity.latitude,
+            "longitude": activity.longitude,
+            "geohash": geohash_encode(float(activity.latitude), float(activity.longitude))
+            if activity.latitude is not None and activity.longitude is not None else None
+        })
+        if len(self._batch) >= self.BATCH_SIZE:
+            self._flush_batch()
+
+    def _validate_event(self, event: Dict[str, Tuple[Dict[str, str], str]]) -> ActivityCreate:
+        """Chuyển một VEVENT thành ActivityCreate và kiểm tra theo dữ liệu chuyến đi đã tải sẵn"""
+        uid = event.get("UID", ({}, ""))[1].strip()
+        if uid:
+            if uid in self._seen_uids:
+                raise ValueError(f"Sự kiện bị lặp trong file (UID {uid})")
+            self._seen_uids.add(uid)
+            own = _OWN_UID.match(uid)
+            if own and int(own.group(1)) in self.activity_ids:
+                raise ValueError(f"Hoạt động đã có trong chuyến đi (UID {uid})")
+
+        if "DTSTART" not in event:
+            raise ValueError("Sự kiện thiếu DTSTART")
+        params, value = event["DTSTART"]
+        data = {
+            "name": _unescape(event.get("SUMMARY", ({}, ""))[1]).strip(),
+            "date": _parse_ics_datetime(value, params)
+        }
+        for prop, field in (("DESCRIPTION", "description"), ("LOCATION", "location")):
+            if prop in event and event[prop][1].strip():
+                data[field] = _unescape(event[prop][1]).strip()
+        if "GEO" in event:
+            latitude, _, longitude = event["GEO"][1].partition(";")
+            try:
+                data["latitude"] = Decimal(latitude.strip())
+                data["longitude"] = Decimal(longitude.strip())
+            except InvalidOperation:
+                raise ValueError(f"GEO không hợp lệ: '{event['GEO'][1]}'")
+
+        try:
+            activity = ActivityCreate(**data)
+        except ValidationError as e:
+            raise ValueError("; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+
+        if activity.date.date() < self.start_day or activity.date.date() > self.end_day:
+            raise ValueError("Ngày hoạt động phải trong thời gian chuyến đi")
+        return activity
+
+    def _flush_batch(self) -> None:
+        """Chèn lô hiện tại bằng một câu lệnh INSERT nhiều dòng"""
+        if not self._batch:
+            return
+        self.db.execute(insert(ActivityModel), self._batch)
+        self._imported += len(self._batch)
+        self._batch = []
+
+    def _record_error(self, row_no: int, message: str) -> None:
+        self._failed += 1
+        if len(self._errors) < self.MAX_REPORTED_ERRORS:
+            self._errors.append(ImportRowError(row=row_no, error=message))
@@ -1,8 +1,52 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict
-from datetime import date, datetime
-from ..models.models import Activity as ActivityModel, Trip as TripModel
-from ..schemas.schemas import ActivityCreate, ActivityUpdate
+from sqlalchemy import func, or_, update
+from typing import List, Optional, Dict, Tuple
+from datetime import date, timedelta
+from decimal import Decimal
+from collections import OrderedDict
+from itertools import groupby
+import threading
+from ..models.models import Activity as ActivityModel, Expense as ExpenseModel, Trip as TripModel
+from ..core.database import commit_keep_loaded, update_returning
+from ..schemas.schemas import (
+    ActivityCreate, ActivityUpdate, ActivityCosts, DistanceMatrix, CalendarDay, ActivityCalendarPage
+)
+from ..utils.dates import day_range
+from ..utils.geo import bounding_box, covering_geohashes, distance_matrix_km, geohash_encode, haversine_km, np
+
+# Cache ma trận khoảng cách theo chuyến đi: trip_id -> (phiên bản dữ liệu hoạt động, ma trận float32).
+# Giới hạn theo tổng số ô ma trận (~4 byte/ô) thay vì số chuyến đi: một chuyến 1.000 hoạt động đã là 1 triệu ô
+DISTANCE_CACHE_MAX_CELLS = 16_000_000
+DISTANCE_DECIMALS = 3
+_distance_cache: "OrderedDict[int, Tuple[Tuple, Dict]]" = OrderedDict()
+_distance_cache_cells = 0
+_distance_cache_lock = threading.Lock()
+
+def clear_distance_cache(trip_id: Optional[int] = None) -> None:
+    global _distance_cache_cells
+    with _distance_cache_lock:
+        if trip_id is None:
+            _distance_cache.clear()
+            _distance_cache_cells = 0
+        else:
+            entry = _distance_cache.pop(trip_id, None)
+            if entry is not None:
+                _distance_cache_cells -= len(entry[1]["ids"]) ** 2
+
+def _matrix_to_lists(matrix, positions: Optional[List[int]] = None) -> List[List[float]]:
+    """Chuyển ma trận trong cache (float32 hoặc list) thành list số thực đã làm tròn cho response"""
+    if np is not None and isinstance(matrix, np.ndarray):
+        if positions is not None:
+            matrix = matrix[np.ix_(positions, positions)]
+        return np.round(matrix.astype(np.float64), DISTANCE_DECIMALS).tolist()
+    if positions is None:
+        return matrix
+    return [[matrix[i][j] for j in positions] for i in positions]
+
+def _geohash_of(latitude, longitude) -> Optional[str]:
+    if latitude is None or longitude is None:
+        return None
+    return geohash_encode(float(latitude), float(longitude))
 
 class ActivityService:
     def __init__(self, db: Session):
@@ -26,47 +70,83 @@ class ActivityService:
             date=activity.date,
             location=activity.location,
             latitude=activity.latitude,
-            longitude=activity.longitude
+            longitude=activity.longitude,
+            geohash=_geohash_of(activity.latitude, activity.longitude)
         )
         
         self.db.add(db_activity)
-        self.db.commit()
-        self.db.refresh(db_activity)
+        commit_keep_loaded(self.db)
+        clear_distance_cache(trip_id)
         return db_activity
     
-    def get_activities_by_trip(self, trip_id: int, date_filter: Optional[date] = None) -> List[ActivityModel]:
-        """Lấy danh sách hoạt động của chuyến đi"""
+    def get_activities_by_trip(
+        self,
+        trip_id: int,
+        date_filter: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> List[ActivityModel]:
+        """Lấy danh sách hoạt động của chuyến đi (một ngày, hoặc từ date_filter đến date_to)"""
+        if date_filter and not date_to:
+            date_to = date_filter
+        return self._query_activities(trip_id, date_filter, date_to).all()
+    
+    def _query_activities(self, trip_id: int, date_from: Optional[date], date_to: Optional[date]):
+        """Hoạt động trong khoảng ngày (mỗi đầu có thể bỏ trống), sắp theo thời gian"""
+        # So sánh khoảng trên cột date thay vì gọi hàm trên cột, để dùng index (trip_id, date)
         query = self.db.query(ActivityModel).filter(ActivityModel.trip_id == trip_id)
-        
-        if date_filter:
-            query = query.filter(ActivityModel.date.date() == date_filter)
-        
-        return query.order_by(ActivityModel.date.asc()).all()
+        if date_from:
+            query = query.filter(ActivityModel.date >= day_range(date_from)[0])
+        if date_to:
+            query = query.filter(ActivityModel.date < day_range(date_to)[1])
+        return query.order_by(ActivityModel.date.asc(), ActivityModel.id.asc())
     
     def get_activity(self, activity_id: int) -> Optional[ActivityModel]:
         """Lấy thông tin hoạt động theo ID"""
         return self.db.query(ActivityModel).filter(ActivityModel.id == activity_id).first()
     
-    def update_activity(self, activity_id: int, activity_update: ActivityUpdate) -> Optional[ActivityModel]:
+    def update_activity(self, activity_id: int, trip_id: int, activity_update: ActivityUpdate) -> Optional[ActivityModel]:
         """Cập nhật thông tin hoạt động"""
-        db_activity = self.get_activity(activity_id)
-        if not db_activity:
-            return None
-        
         update_data = activity_update.dict(exclude_unset=True)
         
         # Kiểm tra ngày hoạt động nếu có cập nhật
         if 'date' in update_data:
-            trip = self.db.query(TripModel).filter(TripModel.id == db_activity.trip_id).first()
+            trip = self.db.query(TripModel.start_date, TripModel.end_date).filter(TripModel.id == trip_id).first()
+            if not trip:
+                return None
             if update_data['date'].date() < trip.start_date.date() or update_data['date'].date() > trip.end_date.date():
                 raise ValueError("Ngày hoạt động phải trong thời gian chuyến đi")
         
-        for field, value in update_data.items():
-            setattr(db_activity, field, value)
+        if 'latitude' in update_data or 'longitude' in update_data:
+            if 'latitude' in update_data and 'longitude' in update_data:
+                coordinates = update_data['latitude'], update_data['longitude']
+            else:
+                # Chỉ đổi một tọa độ: khóa dòng khi đọc tọa độ còn lại để geohash
+                # không lệch nếu tọa độ kia bị cập nhật đồng thời
+                current = self.db.query(ActivityModel.latitude, ActivityModel.longitude).filter(
+                    ActivityModel.id == activity_id,
+                    ActivityModel.trip_id == trip_id
+                ).with_for_update().first()
+                if not current:
+                    self.db.rollback()
+                    return None
+                coordinates = (
+                    update_data.get('latitude', current.latitude),
+                    update_data.get('longitude', current.longitude)
+                )
+            update_data['geohash'] = _geohash_of(*coordinates)
         
-        db_activity.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(db_activity)
+        db_activity = update_returning(
+            self.db,
+            ActivityModel,
+            update_data,
+            ActivityModel.id == activity_id,
+            ActivityModel.trip_id == trip_id
+        )
+        if not db_activity:
+            self.db.rollback()
+            return None
+        commit_keep_loaded(self.db)
+        clear_distance_cache(trip_id)
         return db_activity
     
     def delete_activity(self, activity_id: int, trip_id: int) -> bool:
@@ -81,52 +161,244 @@ class ActivityService:
         
         self.db.delete(db_activity)
         self.db.commit()
+        clear_distance_cache(trip_id)
         return True
     
-    def get_activities_grouped_by_date(self, trip_id: int) -> Dict[str, List[ActivityModel]]:
+    def get_activities_grouped_by_date(
+        self,
+        trip_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None
+    ) -> Dict[str, List[ActivityModel]]:
         """Lấy hoạt động nhóm theo ngày"""
-        activities = self.get_activities_by_trip(trip_id)
+        # Kết quả đã sắp theo thời gian nên các hoạt động cùng ngày nằm liền nhau
+        activities = self._query_activities(trip_id, date_from, date_to).all()
+        return {
+            day.isoformat(): list(day_activities)
+            for day, day_activities in groupby(activities, key=lambda activity: activity.date.date())
+        }
+    
+    def get_activity_costs(self, trip_id: int, activity_ids: Optional[List[int]] = None) -> Dict[int, ActivityCosts]:
+        """Tổng chi phí theo hoạt động (chung, riêng, theo người trả) bằng một truy vấn gom nhóm"""
+        if activity_ids is not None and not activity_ids:
+            return {}
+        
+        query = self.db.query(
+            ExpenseModel.activity_id,
+            ExpenseModel.is_shared,
+            ExpenseModel.paid_by,
+            func.coalesce(func.sum(ExpenseModel.base_amount), 0),
+            func.count(ExpenseModel.id)
+        ).filter(
+            ExpenseModel.trip_id == trip_id,
+            ExpenseModel.activity_id.isnot(None)
+        )
+        if activity_ids is not None:
+            query = query.filter(ExpenseModel.activity_id.in_(activity_ids))
+        rows = query.group_by(ExpenseModel.activity_id, ExpenseModel.is_shared, ExpenseModel.paid_by).all()
+        
+        costs: Dict[int, ActivityCosts] = {}
+        for activity_id, is_shared, paid_by, total, count in rows:
+            total = Decimal(str(total))
+            activity_costs = costs.setdefault(activity_id, ActivityCosts(by_payer={}))
+            activity_costs.expense_count += count
+            activity_costs.total += total
+            if is_shared:
+                activity_costs.shared_total += total
+            else:
+                activity_costs.private_total += total
+            activity_costs.by_payer[paid_by] = activity_costs.by_payer.get(paid_by, Decimal("0")) + total
+        return costs
+    
+    def get_activity_calendar(
+        self,
+        trip_id: int,
+        cursor: Optional[date] = None,
+        days: int = 14,
+        include_activities: bool = False
+    ) -> Optional[ActivityCalendarPage]:
+        """Lấy một cửa sổ ngày của chuyến đi kèm số hoạt động mỗi ngày (phân trang theo ngày)"""
+        trip = self.db.query(TripModel.start_date, TripModel.end_date).filter(TripModel.id == trip_id).first()
+        if not trip:
+            return None
+        
+        first_day = max(cursor or trip.start_date.date(), trip.start_date.date())
+        last_day = min(first_day + timedelta(days=days - 1), trip.end_date.date())
+        if first_day > last_day:
+            return ActivityCalendarPage(days=[])
+        range_start, range_end = day_range(first_day, last_day)
+        
+        # Đếm theo ngày trên khoảng (trip_id, date), chỉ đọc index
+        activity_day = func.date(ActivityModel.date).label('activity_day')
+        counts = dict(self.db.query(activity_day, func.count(ActivityModel.id)).filter(
+            ActivityModel.trip_id == trip_id,
+            ActivityModel.date >= range_start,
+            ActivityModel.date < range_end
+        ).group_by(activity_day).all())
+        
         grouped = {}
+        if include_activities:
+            grouped = self.get_activities_grouped_by_date(trip_id, first_day, last_day)
         
-        for activity in activities:
-            date_key = activity.date.strftime("%Y-%m-%d")
-            if date_key not in grouped:
-                grouped[date_key] = []
-            grouped[date_key].append(activity)
+        calendar_days = []
+        day = first_day
+        while day <= last_day:
+            # model_construct: giữ nguyên đối tượng ORM, route tự serialize (không validate lại từng hoạt động)
+            calendar_days.append(CalendarDay.model_construct(
+                day=day,
+                activity_count=counts.get(day, 0),
+                activities=grouped.get(day.isoformat(), []) if include_activities else None
+            ))
+            day += timedelta(days=1)
         
-        return grouped
+        next_day = last_day + timedelta(days=1)
+        return ActivityCalendarPage(
+            days=calendar_days,
+            next_cursor=next_day if next_day <= trip.end_date.date() else None
+        )
     
     def get_activities_by_location(self, trip_id: int, latitude: float, longitude: float, radius_km: float = 1.0) -> List[ActivityModel]:
         """Lấy hoạt động gần một vị trí cụ thể"""
-        # Sử dụng công thức Haversine để tính khoảng cách
-        # Đây là implementation đơn giản, có thể cải thiện bằng PostGIS nếu cần
-        activities = self.get_activities_by_trip(trip_id)
-        nearby_activities = []
-        
-        for activity in activities:
-            if activity.latitude and activity.longitude:
-                distance = self._calculate_distance(
-                    float(activity.latitude), float(activity.longitude),
-                    latitude, longitude
-                )
-                if distance <= radius_km:
-                    nearby_activities.append(activity)
+        return [activity for activity, _ in self.find_nearby_activities(latitude, longitude, radius_km, trip_ids=[trip_id])]
+    
+    def find_nearby_activities(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float = 1.0,
+        trip_ids: Optional[List[int]] = None,
+        limit: int = 50
+    ) -> List[Tuple[ActivityModel, float]]:
+        """Tìm hoạt động trong bán kính radius_km (một, nhiều hoặc tất cả chuyến đi), sắp xếp theo khoảng cách"""
+        query = self.db.query(ActivityModel)
+        if trip_ids is not None:
+            query = query.filter(ActivityModel.trip_id.in_(trip_ids))
+        
+        # Lọc thô bằng index: tiền tố geohash của các ô quanh điểm cần tìm, sau đó hình chữ nhật bao
+        cells = covering_geohashes(latitude, longitude, radius_km)
+        if cells is not None:
+            query = query.filter(or_(*[ActivityModel.geohash.like(f"{cell}%") for cell in cells]))
+        
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        query = query.filter(ActivityModel.latitude.between(min_lat, max_lat))
+        if min_lon is not None:
+            query = query.filter(ActivityModel.longitude.between(min_lon, max_lon))
+        
+        # Chỉ các ứng viên còn lại mới tính khoảng cách chính xác
+        nearby = []
+        for activity in query.all():
+            distance = haversine_km(latitude, longitude, float(activity.latitude), float(activity.longitude))
+            if distance <= radius_km:
+                nearby.append((activity, distance))
+        
+        nearby.sort(key=lambda item: item[1])
+        return nearby[:limit]
+    
+    def get_distance_matrix(
+        self,
+        trip_id: int,
+        day: Optional[date] = None,
+        activity_ids: Optional[List[int]] = None
+    ) -> DistanceMatrix:
+        """Ma trận khoảng cách (km) giữa các hoạt động có tọa độ, lọc theo ngày hoặc danh sách id"""
+        data = self._get_trip_distances(trip_id)
+        ids, days, matrix = data["ids"], data["days"], data["matrix"]
+        
+        if day is None and activity_ids is None:
+            return DistanceMatrix(activity_ids=ids, distances_km=_matrix_to_lists(matrix))
         
-        return nearby_activities
+        wanted = set(activity_ids) if activity_ids is not None else None
+        positions = [
+            i for i, activity_id in enumerate(ids)
+            if (day is None or days[i] == day) and (wanted is None or activity_id in wanted)
+        ]
+        return DistanceMatrix(
+            activity_ids=[ids[i] for i in positions],
+            distances_km=_matrix_to_lists(matrix, positions),
+            skipped_ids=sorted(wanted - set(ids)) if wanted is not None else []
+        )
     
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Tính khoảng cách giữa 2 điểm bằng công thức Haversine (km)"""
-        import math
+    def _get_trip_distances(self, trip_id: int) -> Dict:
+        """Ma trận khoảng cách của cả chuyến đi, tính lại chỉ khi dữ liệu hoạt động thay đổi"""
+        # Phiên bản: số hoạt động, lần cập nhật cuối, id lớn nhất và checksum tọa độ/ngày (phát hiện thay đổi
+        # từ instance khác, kể cả hai lần sửa trong cùng một giây mà updated_at không phân biệt được)
+        checksum = func.sum(func.crc32(func.concat_ws(
+            "|", ActivityModel.id, ActivityModel.latitude, ActivityModel.longitude, ActivityModel.date
+        )))
+        version = tuple(self.db.query(
+            func.count(ActivityModel.id),
+            func.max(ActivityModel.updated_at),
+            func.max(ActivityModel.id),
+            checksum
+        ).filter(ActivityModel.trip_id == trip_id).one())
         
-        R = 6371  # Bán kính trái đất (km)
+        with _distance_cache_lock:
+            cached = _distance_cache.get(trip_id)
+            if cached is not None and cached[0] == version:
+                _distance_cache.move_to_end(trip_id)
+                return cached[1]
         
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
+        rows = self.db.query(
+            ActivityModel.id,
+            ActivityModel.date,
+            ActivityModel.latitude,
+            ActivityModel.longitude
+        ).filter(
+            ActivityModel.trip_id == trip_id,
+            ActivityModel.latitude.isnot(None),
+            ActivityModel.longitude.isnot(None)
+        ).order_by(ActivityModel.date, ActivityModel.id).all()
         
-        a = (math.sin(delta_lat / 2) ** 2 +
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        data = {
+            "ids": [row.id for row in rows],
+            "days": [row.date.date() for row in rows],
+            "matrix": distance_matrix_km(
+                [float(row.latitude) for row in rows],
+                [float(row.longitude) for row in rows],
+                decimals=DISTANCE_DECIMALS,
+                as_array=True
+            )
+        }
+        cells = len(rows) ** 2
+        if cells > DISTANCE_CACHE_MAX_CELLS:
+            return data  # Ma trận quá lớn để giữ trong cache
         
-        return R * c
+        global _distance_cache_cells
+        with _distance_cache_lock:
+            previous = _distance_cache.pop(trip_id, None)
+            if previous is not None:
+                _distance_cache_cells -= len(previous[1]["ids"]) ** 2
+            _distance_cache[trip_id] = (version, data)
+            _distance_cache_cells += cells
+            while _distance_cache_cells > DISTANCE_CACHE_MAX_CELLS:
+                _, (_, evicted) = _distance_cache.popitem(last=False)
+                _distance_cache_cells -= len(evicted["ids"]) ** 2
+        return data
+    
+    def count_activities_missing_coordinates(self, trip_id: int) -> int:
+        """Số hoạt động có địa điểm nhưng chưa có tọa độ"""
+        return self.db.query(func.count(ActivityModel.id)).filter(
+            ActivityModel.trip_id == trip_id,
+            ActivityModel.location.isnot(None),
+            ActivityModel.location != "",
+            ActivityModel.latitude.is_(None)
+        ).scalar()
+    
+    def backfill_geohashes(self, batch_size: int = 500) -> int:
+        """Tính geohash cho các hoạt động có tọa độ nhưng chưa có geohash"""
+        updated = 0
+        while True:
+            rows = self.db.query(ActivityModel.id, ActivityModel.latitude, ActivityModel.longitude).filter(
+                ActivityModel.geohash.is_(None),
+                ActivityModel.latitude.isnot(None),
+                ActivityModel.longitude.isnot(None)
+            ).limit(batch_size).all()
+            if not rows:
+                return updated
+            
+            self.db.execute(update(ActivityModel), [
+                {"id": activity_id, "geohash": geohash_encode(float(latitude), float(longitude))}
+                for activity_id, latitude, longitude in rows
+            ])
+            self.db.commit()
+            updated += len(rows)
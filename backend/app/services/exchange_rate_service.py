@@ -0,0 +1,247 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+import bisect
+import csv
+import logging
+from ..core.config import settings
+from ..models.models import ExchangeRate as ExchangeRateModel, CurrencyEnum
+
+logger = logging.getLogger(__name__)
+
+# Tỷ giá được lưu theo USD: rate = số đơn vị tiền tệ đổi được 1 USD
+PIVOT_CURRENCY = CurrencyEnum.USD
+RATE_PRECISION = Decimal("0.00000001")
+
+# Cache trong bộ nhớ: (tiền tệ, ngày) -> tỷ giá so với USD đã được xác định
+_rate_cache: Dict[Tuple[CurrencyEnum, date], Decimal] = {}
+_provider = None
+
+class ExchangeRateProvider(ABC):
+    """Nguồn tỷ giá có thể thay thế (file, API...)"""
+
+    @abstractmethod
+    def get_rates(self, on: date) -> Dict[CurrencyEnum, Decimal]:
+        """Trả về tỷ giá so với USD có hiệu lực vào ngày `on`"""
+
+    def get_rates_between(self, date_from: date, date_to: date) -> Dict[date, Dict[CurrencyEnum, Decimal]]:
+        """Tỷ giá của mọi ngày trong khoảng; nguồn có API theo khoảng ngày nên ghi đè để chỉ gọi một lần"""
+        rates = {}
+        day = date_from
+        while day <= date_to:
+            rates[day] = self.get_rates(day)
+            day += timedelta(days=1)
+        return rates
+
+class FileExchangeRateProvider(ExchangeRateProvider):
+    """Đọc tỷ giá từ file CSV cục bộ với các cột date,currency,rate"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._series: Optional[Dict[CurrencyEnum, List[Tuple[date, Decimal]]]] = None
+
+    def read_rows(self) -> List[Tuple[date, CurrencyEnum, Decimal]]:
+        """Đọc toàn bộ dòng tỷ giá trong file"""
+        rows = []
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                try:
+                    rows.append((
+                        date.fromisoformat(record["date"].strip()),
+                        CurrencyEnum(record["currency"].strip().upper()),
+                        Decimal(record["rate"].strip())
+                    ))
+                except (KeyError, ValueError, InvalidOperation) as e:
+                    raise ValueError(f"Dòng tỷ giá không hợp lệ ({self.path}:{line_no}): {e}")
+        return rows
+
+    def get_rates(self, on: date) -> Dict[CurrencyEnum, Decimal]:
+        if self._series is None:
+            series: Dict[CurrencyEnum, List[Tuple[date, Decimal]]] = {}
+            for rate_date, currency, rate in self.read_rows():
+                series.setdefault(currency, []).append((rate_date, rate))
+            for points in series.values():
+                points.sort()
+            self._series = series
+
+        rates = {}
+        for currency, points in self._series.items():
+            # Tỷ giá gần nhất không sau ngày cần tra
+            idx = bisect.bisect_right(points, (on, Decimal("Infinity"))) - 1
+            if idx >= 0:
+                rates[currency] = points[idx][1]
+        return rates
+
+def set_exchange_rate_provider(provider: Optional[ExchangeRateProvider]) -> None:
+    """Thay nguồn tỷ giá mặc định (ví dụ khi tích hợp API tỷ giá)"""
+    global _provider
+    _provider = provider
+    clear_rate_cache()
+
+def get_exchange_rate_provider() -> Optional[ExchangeRateProvider]:
+    global _provider
+    if _provider is None and settings.exchange_rates_file:
+        _provider = FileExchangeRateProvider(settings.exchange_rates_file)
+    return _provider
+
+def clear_rate_cache() -> None:
+    _rate_cache.clear()
+
+class ExchangeRateService:
+    def __init__(self, db: Session):
+        self.db = db
+        # Các (tiền tệ, ngày) đã biết là chưa có tỷ giá, chỉ ghi nhớ trong phạm vi một request
+        self._misses = set()
+
+    def get_rate(self, from_currency: CurrencyEnum, to_currency: CurrencyEnum, on: date) -> Optional[Decimal]:
+        """Lấy tỷ giá quy đổi from_currency -> to_currency vào ngày `on` (None nếu chưa có dữ liệu)"""
+        if from_currency == to_currency:
+            return Decimal("1")
+
+        from_rate = self._get_pivot_rate(from_currency, on)
+        to_rate = self._get_pivot_rate(to_currency, on)
+        if from_rate is None or to_rate is None:
+            return None
+        return (to_rate / from_rate).quantize(RATE_PRECISION)
+
+    def resolve_exchange_rate(
+        self,
+        currency: CurrencyEnum,
+        base_currency: CurrencyEnum,
+        on: date,
+        provided_rate: Optional[Decimal] = None
+    ) -> Decimal:
+        """Xác định tỷ giá cho chi phí: ưu tiên tỷ giá người dùng nhập, nếu không thì tra bảng tỷ giá"""
+        if provided_rate is not None:
+            return provided_rate
+
+        rate = self.get_rate(currency, base_currency, on)
+        if rate is None:
+            raise ValueError(
+                f"Chưa có tỷ giá {currency.value}/{base_currency.value} cho ngày {on.isoformat()}, vui lòng nhập tỷ giá"
+            )
+        return rate
+
+    def preload(self, currencies: Iterable[CurrencyEnum], date_from: date, date_to: date) -> None:
+        """Nạp sẵn tỷ giá của nhiều ngày vào cache bằng một lượt truy vấn (dùng cho nhập hàng loạt)"""
+        currencies = {currency for currency in currencies if currency != PIVOT_CURRENCY}
+        if not currencies or date_to < date_from:
+            return
+
+        rows = self.db.query(
+            ExchangeRateModel.currency,
+            ExchangeRateModel.rate_date,
+            ExchangeRateModel.rate
+        ).filter(
+            ExchangeRateModel.currency.in_(currencies),
+            ExchangeRateModel.rate_date <= date_to
+        ).order_by(ExchangeRateModel.currency, ExchangeRateModel.rate_date).all()
+
+        series: Dict[CurrencyEnum, List[Tuple[date, Decimal]]] = {}
+        for currency, rate_date, rate in rows:
+            series.setdefault(currency, []).append((rate_date, rate))
+
+        missing = []
+        for currency in currencies:
+            points = series.get(currency, [])
+            day = date_from
+            while day <= date_to:
+                idx = bisect.bisect_right(points, (day, Decimal("Infinity"))) - 1
+                if idx >= 0:
+                    _rate_cache[(currency, day)] = points[idx][1]
+                elif (currency, day) not in _rate_cache:
+                    missing.append((currency, day))
+                day += timedelta(days=1)
+
+        if missing:
+            # Một lần gọi nguồn tỷ giá cho cả khoảng ngày còn thiếu, một câu lệnh ghi cho mọi tỷ giá lấy được
+            fetched = self._fetch_range_from_provider(
+                min(day for _, day in missing),
+                max(day for _, day in missing)
+            )
+            found = []
+            for currency, day in missing:
+                rate = fetched.get(day, {}).get(currency)
+                if rate is not None:
+                    _rate_cache[(currency, day)] = rate
+                    found.append((day, currency, rate))
+                else:
+                    self._misses.add((currency, day))
+            self._store_fetched_rates(found)
+
+    def load_rates(self, rows: Iterable[Tuple[date, CurrencyEnum, Decimal]]) -> int:
+        """Ghi tỷ giá vào bảng exchange_rates (ghi đè tỷ giá cùng ngày) và làm mới cache"""
+        count = 0
+        for rate_date, currency, rate in rows:
+            if rate <= 0:
+                raise ValueError("Tỷ giá phải lớn hơn 0")
+            existing = self.db.query(ExchangeRateModel).filter(
+                ExchangeRateModel.currency == currency,
+                ExchangeRateModel.rate_date == rate_date
+            ).first()
+            if existing:
+                existing.rate = rate
+            else:
+                self.db.add(ExchangeRateModel(currency=currency, rate_date=rate_date, rate=rate))
+            count += 1
+
+        self.db.commit()
+        clear_rate_cache()
+        return count
+
+    def _get_pivot_rate(self, currency: CurrencyEnum, on: date) -> Optional[Decimal]:
+        """Tỷ giá so với USD: cache -> bảng exchange_rates -> nguồn tỷ giá"""
+        if currency == PIVOT_CURRENCY:
+            return Decimal("1")
+
+        key = (currency, on)
+        if key in _rate_cache:
+            return _rate_cache[key]
+        if key in self._misses:
+            return None
+
+        row = self.db.query(ExchangeRateModel.rate).filter(
+            ExchangeRateModel.currency == currency,
+            ExchangeRateModel.rate_date <= on
+        ).order_by(ExchangeRateModel.rate_date.desc()).first()
+        rate = row[0] if row else None
+
+        if rate is None:
+            rate = self._fetch_from_provider(currency, on)
+        if rate is not None:
+            _rate_cache[key] = rate
+        else:
+            self._misses.add(key)
+        return rate
+
+    def _fetch_from_provider(self, currency: CurrencyEnum, on: date) -> Optional[Decimal]:
+        rate = self._fetch_range_from_provider(on, on).get(on, {}).get(currency)
+        if rate is not None:
+            self._store_fetched_rates([(on, currency, rate)])
+        return rate
+
+    def _fetch_range_from_provider(self, date_from: date, date_to: date) -> Dict[date, Dict[CurrencyEnum, Decimal]]:
+        provider = get_exchange_rate_provider()
+        if provider is None:
+            return {}
+
+        try:
+            return provider.get_rates_between(date_from, date_to)
+        except Exception as e:
+            logger.warning(f"Không lấy được tỷ giá từ nguồn {type(provider).__name__}: {e}")
+            return {}
+
+    def _store_fetched_rates(self, rows: List[Tuple[date, CurrencyEnum, Decimal]]) -> None:
+        """Lưu tỷ giá lấy từ nguồn bằng một câu lệnh INSERT ... ON DUPLICATE KEY UPDATE"""
+        if not rows:
+            return
+        table = ExchangeRateModel.__table__
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(rate=stmt.inserted.rate)
+        self.db.execute(stmt, [
+            {"currency": currency, "rate_date": rate_date, "rate": rate}
+            for rate_date, currency, rate in rows
+        ])
@@ -0,0 +1,73 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from typing import Iterator, List
+import csv
+import io
+import json
+from ..models.models import Expense as ExpenseModel, TripMember as TripMemberModel
+
+EXPORT_COLUMNS = [
+    "id", "date", "description", "amount", "currency", "exchange_rate",
+    "category", "is_shared", "paid_by", "paid_by_name", "activity_id"
+]
+
+class ExpenseExportService:
+    # Số dòng lấy mỗi lần từ server-side cursor và ghi thành một phần của response
+    CHUNK_SIZE = 1000
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def export_expenses(self, conditions: List, fmt: str) -> Iterator[str]:
+        """Xuất chi phí theo luồng (CSV hoặc NDJSON) với các điều kiện lọc cho trước"""
+        # Chỉ chọn cột cần thiết, không dựng ORM object cho từng dòng
+        stmt = select(
+            ExpenseModel.id,
+            ExpenseModel.date,
+            ExpenseModel.description,
+            ExpenseModel.amount,
+            ExpenseModel.currency,
+            ExpenseModel.exchange_rate,
+            ExpenseModel.category,
+            ExpenseModel.is_shared,
+            ExpenseModel.paid_by,
+            TripMemberModel.name,
+            ExpenseModel.activity_id
+        ).join(
+            TripMemberModel, TripMemberModel.id == ExpenseModel.paid_by
+        ).where(*conditions).order_by(ExpenseModel.date.desc(), ExpenseModel.id.desc())
+
+        result = self.db.execute(stmt.execution_options(stream_results=True, yield_per=self.CHUNK_SIZE))
+        write_rows = self._write_csv if fmt == "csv" else self._write_ndjson
+
+        if fmt == "csv":
+            yield self._write_csv([EXPORT_COLUMNS])
+        for rows in result.partitions():
+            yield write_rows([self._to_values(row) for row in rows])
+
+    def _to_values(self, row) -> List:
+        expense_id, day, description, amount, currency, exchange_rate, category, is_shared, paid_by, paid_by_name, activity_id = row
+        return [
+            expense_id,
+            day.isoformat(),
+            description,
+            str(amount),
+            currency.value,
+            str(exchange_rate),
+            category.value if category else None,
+            bool(is_shared),
+            paid_by,
+            paid_by_name,
+            activity_id
+        ]
+
+    def _write_csv(self, rows: List[List]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+    def _write_ndjson(self, rows: List[List]) -> str:
+        return "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, values)), ensure_ascii=False) + "\n"
+            for values in rows
+        )
@@ -0,0 +1,241 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from pydantic import ValidationError
+from typing import List, Optional, Dict
+from datetime import datetime
+from decimal import Decimal
+import codecs
+import csv
+import json
+from ..models.models import (
+    Expense as ExpenseModel,
+    Trip as TripModel,
+    Activity as ActivityModel,
+    CurrencyEnum
+)
+from ..schemas.schemas import ExpenseCreate, ImportResult, ImportRowError
+from .exchange_rate_service import ExchangeRateService
+from .expense_service import calculate_base_amount
+from .expense_rollup_service import ExpenseRollupService, rollup_key
+from .member_directory import MemberDirectory
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+class ExpenseImportService:
+    # Dữ liệu được đưa vào từng phần qua feed(); dòng hợp lệ được gom lô và chèn bằng
+    # INSERT nhiều dòng, nên bộ nhớ phụ thuộc kích thước lô chứ không phụ thuộc kích thước file
+    BATCH_SIZE = 500
+    MAX_REPORTED_ERRORS = 1000
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def start_import(self, trip_id: int, fmt: str) -> None:
+        """Chuẩn bị phiên nhập: tải chuyến đi và danh sách thành viên một lần duy nhất"""
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError("Định dạng nhập không hỗ trợ (chỉ hỗ trợ csv hoặc ndjson)")
+
+        trip = self.db.query(TripModel).filter(TripModel.id == trip_id).first()
+        if not trip:
+            raise ValueError("Chuyến đi không tồn tại")
+
+        members = MemberDirectory(self.db).get_members(trip_id).values()
+        activity_ids = self.db.query(ActivityModel.id).filter(ActivityModel.trip_id == trip_id).all()
+
+        self.trip_id = trip_id
+        self.format = fmt
+        self.start_day = trip.start_date.date()
+        self.end_day = trip.end_date.date()
+        self.member_ids = {member.id for member in members}
+        self.member_ids_by_name = {member.name.strip().lower(): member.id for member in members}
+        self.activity_ids = {activity_id for (activity_id,) in activity_ids}
+        
+        # Nạp sẵn tỷ giá cho cả khoảng thời gian chuyến đi, các dòng sau chỉ tra cache
+        self.trip_currency = trip.currency
+        self.exchange_rates = ExchangeRateService(self.db)
+        self.exchange_rates.preload(CurrencyEnum, self.start_day, self.end_day)
+
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._pending = ""
+        self._record = ""
+        self._record_start = 0
+        self._line_no = 0
+        self._header: Optional[List[str]] = None
+        self._batch: List[Dict] = []
+        self._imported = 0
+        self._failed = 0
+        self._errors: List[ImportRowError] = []
+
+    def feed(self, chunk: bytes) -> None:
+        """Nhận thêm một phần dữ liệu và xử lý các dòng đã hoàn chỉnh"""
+        self._pending += self._decoder.decode(chunk)
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            self._consume_line(line)
+
+    def finish(self) -> ImportResult:
+        """Xử lý phần dữ liệu còn lại, chèn lô cuối và commit toàn bộ phiên nhập"""
+        self._pending += self._decoder.decode(b"", final=True)
+        if self._pending:
+            self._consume_line(self._pending)
+            self._pending = ""
+        if self._record:
+            # Bản ghi CSV còn dở (thiếu dấu nháy đóng)
+            self._record_error(self._record_start, "Dòng CSV không hợp lệ: thiếu dấu nháy đóng")
+            self._record = ""
+
+        try:
+            self._flush_batch()
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        return ImportResult(
+            imported=self._imported,
+            failed=self._failed,
+            errors=self._errors
+        )
+
+    def _consume_line(self, line: str) -> None:
+        self._line_no += 1
+        line = line.rstrip("\r")
+
+        if self.format == "ndjson":
+            if line.strip():
+                self._handle_ndjson(self._line_no, line)
+            return
+
+        # CSV: một bản ghi có thể trải trên nhiều dòng nếu có trường chứa xuống dòng trong dấu nháy
+        if self._record:
+            self._record += "\n" + line
+        else:
+            self._record = line
+            self._record_start = self._line_no
+        if self._record.count('"') % 2 == 1:
+            return
+
+        record, self._record = self._record, ""
+        if record.strip():
+            self._handle_csv(self._record_start, record)
+
+    def _handle_csv(self, row_no: int, record: str) -> None:
+        values = next(csv.reader([record]))
+        if self._header is None:
+            self._header = [name.strip().lower() for name in values]
+            if "amount" not in self._header:
+                raise ValueError("Dòng tiêu đề CSV phải có các cột description, amount, currency, date, paid_by")
+            return
+
+        if len(values) != len(self._header):
+            self._record_error(row_no, "Số cột không khớp với dòng tiêu đề")
+            return
+        self._handle_row(row_no, dict(zip(self._header, values)))
+
+    def _handle_ndjson(self, row_no: int, line: str) -> None:
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            self._record_error(row_no, f"JSON không hợp lệ: {e.msg}")
+            return
+        if not isinstance(row, dict):
+            self._record_error(row_no, "Mỗi dòng NDJSON phải là một object")
+            return
+        self._handle_row(row_no, {str(key).lower(): value for key, value in row.items()})
+
+    def _handle_row(self, row_no: int, row: Dict) -> None:
+        try:
+            expense = self._validate_row(row)
+            exchange_rate = self.exchange_rates.resolve_exchange_rate(
+                expense.currency,
+                self.trip_currency,
+                expense.date.date(),
+                expense.exchange_rate if 'exchange_rate' in expense.model_fields_set else None
+            )
+        except ValueError as e:
+            self._record_error(row_no, str(e))
+            return
+
+        self._batch.append({
+            "trip_id": self.trip_id,
+            "activity_id": expense.activity_id,
+            "paid_by": expense.paid_by,
+            "description": expense.description,
+            "amount": expense.amount,
+            "currency": expense.currency,
+            "exchange_rate": exchange_rate,
+            "base_amount": calculate_base_amount(expense.amount, exchange_rate),
+            "category": expense.category,
+            "is_shared": expense.is_shared,
+            "date": expense.date
+        })
+        if len(self._batch) >= self.BATCH_SIZE:
+            self._flush_batch()
+
+    def _validate_row(self, row: Dict) -> ExpenseCreate:
+        """Kiểm tra một dòng dựa trên dữ liệu chuyến đi đã tải sẵn"""
+        data = {
+            key: value.strip() if isinstance(value, str) else value
+            for key, value in row.items()
+            if value is not None and value != ""
+        }
+
+        paid_by = data.get("paid_by")
+        if isinstance(paid_by, str) and not paid_by.isdigit():
+            # Cho phép nhập tên thành viên thay cho ID
+            data["paid_by"] = self.member_ids_by_name.get(paid_by.lower())
+            if data["paid_by"] is None:
+                raise ValueError(f"Không tìm thấy thành viên '{paid_by}' trong chuyến đi này")
+        if isinstance(data.get("date"), str):
+            data["date"] = _parse_datetime(data["date"])
+
+        try:
+            expense = ExpenseCreate(**data)
+        except ValidationError as e:
+            raise ValueError("; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+
+        if expense.paid_by not in self.member_ids:
+            raise ValueError("Thành viên trả tiền không tồn tại trong chuyến đi này")
+        if expense.activity_id is not None and expense.activity_id not in self.activity_ids:
+            raise ValueError("Hoạt động không tồn tại trong chuyến đi này")
+        if expense.date.date() < self.start_day or expense.date.date() > self.end_day:
+            raise ValueError("Ngày chi phí phải trong thời gian chuyến đi")
+
+        return expense
+
+    def _flush_batch(self) -> None:
+        """Chèn lô hiện tại bằng một câu lệnh INSERT nhiều dòng"""
+        if not self._batch:
+            return
+        self.db.execute(insert(ExpenseModel), self._batch)
+        
+        # Cập nhật bảng tổng hợp theo ngày cho cả lô bằng một câu lệnh
+        deltas = {}
+        for row in self._batch:
+            key = rollup_key(self.trip_id, row["date"], row["category"], row["paid_by"], row["is_shared"])
+            total, count = deltas.get(key, (Decimal("0"), 0))
+            deltas[key] = (total + row["base_amount"], count + 1)
+        ExpenseRollupService(self.db).apply_many(deltas)
+        
+        self._imported += len(self._batch)
+        self._batch = []
+
+    def _record_error(self, row_no: int, message: str) -> None:
+        self._failed += 1
+        if len(self._errors) < self.MAX_REPORTED_ERRORS:
+            self._errors.append(ImportRowError(row=row_no, error=message))
+
+def _parse_datetime(value: str) -> datetime:
+    """Chuyển chuỗi ngày từ bảng tính (ISO hoặc dd/mm/yyyy) thành datetime"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in ("%d/%m/%Y %H:%M", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Ngày không hợp lệ: '{value}'")
@@ -0,0 +1,185 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, delete, literal
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+from decimal import Decimal
+from ..models.models import (
+    Expense as ExpenseModel,
+    ExpenseDailyRollup as ExpenseDailyRollupModel,
+    ExpenseCategoryEnum
+)
+
+# Khóa tổng hợp: (trip_id, ngày, danh mục, người trả, chi phí chung)
+RollupKey = Tuple[int, date, ExpenseCategoryEnum, int, bool]
+# Cột của expenses quyết định dòng tổng hợp mà chi phí thuộc về (cùng với base_amount là giá trị được cộng dồn)
+ROLLUP_KEY_FIELDS = {"date", "category", "paid_by", "is_shared"}
+ROLLUP_COLUMNS = ["trip_id", "day", "category", "paid_by", "is_shared", "total", "expense_count"]
+
+def rollup_key(trip_id: int, expense_date, category: Optional[ExpenseCategoryEnum], paid_by: int, is_shared: bool) -> RollupKey:
+    """Tạo khóa tổng hợp từ các giá trị của một chi phí"""
+    return (
+        trip_id,
+        expense_date.date() if hasattr(expense_date, 'date') else expense_date,
+        category or ExpenseCategoryEnum.OTHER,
+        paid_by,
+        bool(is_shared)
+    )
+
+class ExpenseRollupService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def apply(self, key: RollupKey, total: Decimal, count: int) -> None:
+        """Cộng dồn thay đổi (có thể âm) vào một dòng tổng hợp"""
+        self.apply_many({key: (total, count)})
+
+    def apply_many(self, deltas: Dict[RollupKey, Tuple[Decimal, int]]) -> None:
+        """Cộng dồn nhiều thay đổi bằng một câu lệnh INSERT ... ON DUPLICATE KEY UPDATE"""
+        deltas = {key: value for key, value in deltas.items() if value[1] != 0 or value[0] != 0}
+        if not deltas:
+            return
+
+        table = ExpenseDailyRollupModel.__table__
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            total=table.c.total + stmt.inserted.total,
+            expense_count=table.c.expense_count + stmt.inserted.expense_count
+        )
+        self.db.execute(stmt, [
+            {
+                "trip_id": trip_id,
+                "day": day,
+                "category": category,
+                "paid_by": paid_by,
+                "is_shared": is_shared,
+                "total": total,
+                "expense_count": count
+            }
+            for (trip_id, day, category, paid_by, is_shared), (total, count) in deltas.items()
+        ])
+
+        # Dọn các dòng không còn chi phí nào
+        if any(count < 0 for _, count in deltas.values()):
+            trip_ids = {key[0] for key in deltas}
+            self.db.execute(delete(ExpenseDailyRollupModel).where(
+                ExpenseDailyRollupModel.trip_id.in_(trip_ids),
+                ExpenseDailyRollupModel.expense_count <= 0
+            ))
+
+    def add_expense(self, expense: ExpenseModel) -> None:
+        """Ghi nhận một chi phí mới vào bảng tổng hợp"""
+        self.apply(self._key_of(expense), Decimal(str(expense.base_amount or 0)), 1)
+
+    def remove_expense(self, expense: ExpenseModel) -> None:
+        """Gỡ một chi phí khỏi bảng tổng hợp"""
+        self.apply(self._key_of(expense), -Decimal(str(expense.base_amount or 0)), -1)
+
+    def reassign_payer(self, trip_id: int, from_member_id: int, to_member_id: int) -> None:
+        """Chuyển các dòng tổng hợp của một người trả sang người khác (khi gộp thành viên)"""
+        rows = self.db.query(ExpenseDailyRollupModel).filter(
+            ExpenseDailyRollupModel.trip_id == trip_id,
+            ExpenseDailyRollupModel.paid_by == from_member_id
+        ).all()
+        if not rows:
+            return
+        deltas = {
+            (trip_id, row.day, row.category, to_member_id, bool(row.is_shared)): (Decimal(str(row.total)), row.expense_count)
+            for row in rows
+        }
+        self.db.execute(delete(ExpenseDailyRollupModel).where(
+            ExpenseDailyRollupModel.trip_id == trip_id,
+            ExpenseDailyRollupModel.paid_by == from_member_id
+        ).execution_options(synchronize_session=False))
+        self.apply_many(deltas)
+
+    def add_expenses(self, trip_id: int, *conditions) -> None:
+        """Cộng các chi phí khớp điều kiện vào bảng tổng hợp (sau UPDATE hàng loạt)"""
+        self._apply_expenses(trip_id, conditions, 1)
+
+    def remove_expenses(self, trip_id: int, *conditions) -> None:
+        """Trừ các chi phí khớp điều kiện khỏi bảng tổng hợp (trước UPDATE/DELETE hàng loạt)"""
+        self._apply_expenses(trip_id, conditions, -1)
+
+    def rebuild(self, trip_id: Optional[int] = None) -> None:
+        """Tính lại bảng tổng hợp từ bảng expenses (cho một chuyến đi hoặc toàn bộ)"""
+        delete_stmt = delete(ExpenseDailyRollupModel)
+        if trip_id is not None:
+            delete_stmt = delete_stmt.where(ExpenseDailyRollupModel.trip_id == trip_id)
+        self.db.execute(delete_stmt)
+
+        grouped = self._grouped_expenses()
+        if trip_id is not None:
+            grouped = grouped.where(ExpenseModel.trip_id == trip_id)
+
+        self.db.execute(ExpenseDailyRollupModel.__table__.insert().from_select(ROLLUP_COLUMNS, grouped))
+
+    def find_drift(self, trip_id: Optional[int] = None) -> List[int]:
+        """So sánh tổng tiền và số chi phí theo từng khóa tổng hợp với bảng expenses, trả về các chuyến đi bị lệch"""
+        grouped = self._grouped_expenses()
+        rollups = select(
+            ExpenseDailyRollupModel.trip_id,
+            ExpenseDailyRollupModel.day,
+            ExpenseDailyRollupModel.category,
+            ExpenseDailyRollupModel.paid_by,
+            ExpenseDailyRollupModel.is_shared,
+            ExpenseDailyRollupModel.total,
+            ExpenseDailyRollupModel.expense_count
+        )
+        if trip_id is not None:
+            grouped = grouped.where(ExpenseModel.trip_id == trip_id)
+            rollups = rollups.where(ExpenseDailyRollupModel.trip_id == trip_id)
+
+        def by_key(rows) -> Dict[tuple, Tuple[Decimal, int]]:
+            return {
+                (row[0], str(row[1]), row[2] or ExpenseCategoryEnum.OTHER, row[3], bool(row[4])): (Decimal(str(row[5] or 0)), int(row[6]))
+                for row in rows
+            }
+
+        expected = by_key(self.db.execute(grouped).all())
+        actual = by_key(self.db.execute(rollups).all())
+        return sorted({key[0] for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key)})
+
+    def _apply_expenses(self, trip_id: int, conditions, sign: int) -> None:
+        # Một câu INSERT ... SELECT ... GROUP BY ... ON DUPLICATE KEY UPDATE: chi phí tỉ lệ với số dòng tổng hợp bị ảnh hưởng.
+        # SELECT gom nhóm được bọc thành bảng dẫn xuất vì MySQL chỉ cho vế UPDATE tham chiếu cột của SELECT như vậy;
+        # vế UPDATE viết tay vì on_duplicate_key_update() thêm "AS new" sau SELECT trên MySQL 8 (sai cú pháp với INSERT ... SELECT)
+        delta = self._grouped_expenses(sign).where(*conditions).subquery('rollup_delta')
+        table = ExpenseDailyRollupModel.__table__
+        self.db.execute(table.insert().from_select(ROLLUP_COLUMNS, select(delta).suffix_with(
+            f"ON DUPLICATE KEY UPDATE total = {table.name}.total + {delta.name}.rollup_total, "
+            f"expense_count = {table.name}.expense_count + {delta.name}.rollup_count",
+            dialect="mysql"
+        )))
+
+        if sign < 0:
+            self.db.execute(delete(ExpenseDailyRollupModel).where(
+                ExpenseDailyRollupModel.trip_id == trip_id,
+                ExpenseDailyRollupModel.expense_count <= 0
+            ))
+
+    def _grouped_expenses(self, sign: int = 1):
+        """SELECT gom nhóm chi phí theo khóa tổng hợp (sign=-1: tổng và số lượng mang dấu âm)"""
+        total = func.coalesce(func.sum(ExpenseModel.base_amount), 0)
+        count = func.count(ExpenseModel.id)
+        if sign < 0:
+            total, count = -total, -count
+
+        # Gom nhóm theo alias để biểu thức trong SELECT và GROUP BY là một (tham số bind không bị lặp)
+        return select(
+            ExpenseModel.trip_id,
+            func.date(ExpenseModel.date).label('rollup_day'),
+            func.coalesce(
+                ExpenseModel.category,
+                literal(ExpenseCategoryEnum.OTHER, ExpenseModel.category.type)
+            ).label('rollup_category'),
+            ExpenseModel.paid_by,
+            ExpenseModel.is_shared,
+            total.label('rollup_total'),
+            count.label('rollup_count')
+        ).group_by(
+            ExpenseModel.trip_id, 'rollup_day', 'rollup_category', ExpenseModel.paid_by, ExpenseModel.is_shared
+        )
+
+    def _key_of(self, expense: ExpenseModel) -> RollupKey:
+        return rollup_key(expense.trip_id, expense.date, expense.category, expense.paid_by, expense.is_shared)
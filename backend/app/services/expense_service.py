@@ -1,16 +1,41 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional, Dict
+from sqlalchemy import func, case, literal
+from sqlalchemy.dialects.mysql import match
+from typing import List, Optional, Dict, Tuple
 from datetime import date, datetime
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+import re
+from ..core.database import commit_keep_loaded
 from ..models.models import (
     Expense as ExpenseModel, 
     Trip as TripModel, 
-    TripMember as TripMemberModel,
+    Activity as ActivityModel,
     ExpenseCategory as ExpenseCategoryModel,
+    ExpenseDailyRollup as ExpenseDailyRollupModel,
     ExpenseCategoryEnum
 )
-from ..schemas.schemas import ExpenseCreate, ExpenseUpdate, ExpenseCategoryCreate
+from ..schemas.schemas import (
+    ExpenseCreate,
+    ExpenseUpdate,
+    ExpenseBatchSelection,
+    ExpenseBatchResult,
+    ExpenseListTotals,
+    ExpenseCategoryCreate,
+    ExpenseAnalytics,
+    ExpenseBreakdown,
+    MemberExpenseBreakdown
+)
+from .exchange_rate_service import ExchangeRateService
+from .expense_rollup_service import ExpenseRollupService, ROLLUP_KEY_FIELDS
+from .member_directory import MemberDirectory
+from .receipt_service import ReceiptService
+
+# Độ dài từ tối thiểu của FULLTEXT index (innodb_ft_min_token_size mặc định là 3)
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+def calculate_base_amount(amount: Decimal, exchange_rate: Decimal) -> Decimal:
+    """Quy đổi số tiền về tiền tệ chính của chuyến đi (làm tròn 2 chữ số)"""
+    return (Decimal(str(amount)) * Decimal(str(exchange_rate))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 class ExpenseService:
     def __init__(self, db: Session):
@@ -23,24 +48,21 @@ class ExpenseService:
         if not trip:
             raise ValueError("Chuyến đi không tồn tại")
         
-        # Kiểm tra thành viên trả tiền có tồn tại không
-        member = self.db.query(TripMemberModel).filter(
-            TripMemberModel.id == expense.paid_by,
-            TripMemberModel.trip_id == trip_id
-        ).first()
-        if not member:
+        # Kiểm tra thành viên trả tiền có tồn tại không (qua danh bạ thành viên của request)
+        if MemberDirectory(self.db).get_member(trip_id, expense.paid_by) is None:
             raise ValueError("Thành viên trả tiền không tồn tại trong chuyến đi này")
         
         # Kiểm tra ngày chi phí có trong thời gian chuyến đi không
         if expense.date.date() < trip.start_date.date() or expense.date.date() > trip.end_date.date():
             raise ValueError("Ngày chi phí phải trong thời gian chuyến đi")
         
-        # Tính tỷ giá quy đổi nếu khác tiền tệ chính
-        exchange_rate = expense.exchange_rate
-        if expense.currency != trip.currency:
-            # Ở đây có thể tích hợp API tỷ giá thực tế
-            # Hiện tại sử dụng tỷ giá người dùng nhập
-            pass
+        # Tính tỷ giá quy đổi về tiền tệ chính: dùng tỷ giá người dùng nhập, nếu không có thì tra bảng tỷ giá
+        exchange_rate = ExchangeRateService(self.db).resolve_exchange_rate(
+            expense.currency,
+            trip.currency,
+            expense.date.date(),
+            expense.exchange_rate if 'exchange_rate' in expense.model_fields_set else None
+        )
         
         db_expense = ExpenseModel(
             trip_id=trip_id,
@@ -50,14 +72,15 @@ class ExpenseService:
             amount=expense.amount,
             currency=expense.currency,
             exchange_rate=exchange_rate,
+            base_amount=calculate_base_amount(expense.amount, exchange_rate),
             category=expense.category,
             is_shared=expense.is_shared,
             date=expense.date
         )
         
         self.db.add(db_expense)
-        self.db.commit()
-        self.db.refresh(db_expense)
+        ExpenseRollupService(self.db).add_expense(db_expense)
+        commit_keep_loaded(self.db)
         return db_expense
     
     def get_expenses_by_trip(
@@ -69,35 +92,110 @@ class ExpenseService:
         paid_by: Optional[int] = None,
         date_from: Optional[date] = None,
         date_to: Optional[date] = None,
-        is_shared: Optional[bool] = None
-    ) -> List[ExpenseModel]:
-        """Lấy danh sách chi phí với bộ lọc"""
-        query = self.db.query(ExpenseModel).filter(ExpenseModel.trip_id == trip_id)
+        is_shared: Optional[bool] = None,
+        q: Optional[str] = None,
+        with_totals: bool = False
+    ) -> Tuple[List[ExpenseModel], Optional[ExpenseListTotals]]:
+        """Lấy danh sách chi phí với bộ lọc (kèm tổng số dòng và tổng tiền nếu with_totals)"""
+        conditions = self.build_expense_filters(
+            trip_id,
+            category=category,
+            paid_by=paid_by,
+            date_from=date_from,
+            date_to=date_to,
+            is_shared=is_shared,
+            q=q
+        )
+        order = (ExpenseModel.date.desc(), ExpenseModel.id.desc())
+        
+        if not with_totals:
+            expenses = self.db.query(ExpenseModel).filter(*conditions).order_by(*order).offset(skip).limit(limit).all()
+            return expenses, None
+        
+        # Window function được tính trên toàn bộ dòng khớp bộ lọc trước LIMIT: trang và tổng trong cùng một câu lệnh
+        rows = self.db.query(
+            ExpenseModel,
+            func.count().over().label('total_count'),
+            func.sum(ExpenseModel.base_amount).over().label('total_amount')
+        ).filter(*conditions).order_by(*order).offset(skip).limit(limit).all()
+        
+        if rows:
+            total_count, total_amount = rows[0].total_count, rows[0].total_amount
+        else:
+            # Trang rỗng (skip vượt quá số dòng) không mang theo giá trị window, tính riêng
+            total_count, total_amount = self.db.query(
+                func.count(ExpenseModel.id),
+                func.sum(ExpenseModel.base_amount)
+            ).filter(*conditions).one()
+        
+        return [row[0] for row in rows], ExpenseListTotals(
+            total_count=total_count,
+            total_amount=total_amount or Decimal("0")
+        )
+    
+    def build_expense_filters(
+        self,
+        trip_id: int,
+        category: Optional[ExpenseCategoryEnum] = None,
+        paid_by: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        is_shared: Optional[bool] = None,
+        q: Optional[str] = None
+    ) -> List:
+        """Tạo danh sách điều kiện lọc chi phí (dùng chung cho danh sách, xuất file...)"""
+        conditions = [ExpenseModel.trip_id == trip_id]
         
         if category:
-            query = query.filter(ExpenseModel.category == category)
+            conditions.append(ExpenseModel.category == category)
         
         if paid_by:
-            query = query.filter(ExpenseModel.paid_by == paid_by)
+            conditions.append(ExpenseModel.paid_by == paid_by)
         
         if date_from:
-            query = query.filter(ExpenseModel.date >= datetime.combine(date_from, datetime.min.time()))
+            conditions.append(ExpenseModel.date >= datetime.combine(date_from, datetime.min.time()))
         
         if date_to:
-            query = query.filter(ExpenseModel.date <= datetime.combine(date_to, datetime.max.time()))
+            conditions.append(ExpenseModel.date <= datetime.combine(date_to, datetime.max.time()))
         
         if is_shared is not None:
-            query = query.filter(ExpenseModel.is_shared == is_shared)
+            conditions.append(ExpenseModel.is_shared == is_shared)
+        
+        if q:
+            conditions.extend(self._build_text_filters(q))
+        
+        return conditions
+    
+    def _build_text_filters(self, q: str) -> List:
+        """Lọc theo mô tả: từ đủ dài đi qua FULLTEXT index, từ quá ngắn lọc bằng LIKE trên các dòng còn lại"""
+        # Chỉ giữ ký tự chữ/số để người dùng không chèn được toán tử của boolean mode
+        tokens = re.findall(r"\w+", q.lower())
+        long_tokens = [token for token in tokens if len(token) >= FULLTEXT_MIN_TOKEN_SIZE]
+        short_tokens = [token for token in tokens if len(token) < FULLTEXT_MIN_TOKEN_SIZE]
         
-        return query.order_by(ExpenseModel.date.desc()).offset(skip).limit(limit).all()
+        conditions = []
+        if long_tokens:
+            # Mọi từ đều phải xuất hiện, cho phép khớp tiền tố ("gra" khớp "Grab")
+            conditions.append(match(
+                ExpenseModel.description,
+                against=" ".join(f"+{token}*" for token in long_tokens)
+            ).in_boolean_mode())
+        for token in short_tokens:
+            conditions.append(ExpenseModel.description.contains(token, autoescape=True))
+        return conditions
     
     def get_expense(self, expense_id: int) -> Optional[ExpenseModel]:
         """Lấy thông tin chi phí theo ID"""
         return self.db.query(ExpenseModel).filter(ExpenseModel.id == expense_id).first()
     
-    def update_expense(self, expense_id: int, expense_update: ExpenseUpdate) -> Optional[ExpenseModel]:
+    def update_expense(self, expense_id: int, trip_id: int, expense_update: ExpenseUpdate) -> Optional[ExpenseModel]:
         """Cập nhật thông tin chi phí"""
-        db_expense = self.get_expense(expense_id)
+        # Vẫn đọc dòng hiện tại: bảng tổng hợp cần giá trị cũ để trừ ra. Khóa dòng (SELECT ... FOR UPDATE)
+        # để hai lần cập nhật đồng thời không cùng trừ một giá trị cũ
+        db_expense = self.db.query(ExpenseModel).filter(
+            ExpenseModel.id == expense_id,
+            ExpenseModel.trip_id == trip_id
+        ).with_for_update().populate_existing().first()
         if not db_expense:
             return None
         
@@ -105,84 +203,298 @@ class ExpenseService:
         
         # Kiểm tra thành viên trả tiền nếu có cập nhật
         if 'paid_by' in update_data:
-            member = self.db.query(TripMemberModel).filter(
-                TripMemberModel.id == update_data['paid_by'],
-                TripMemberModel.trip_id == db_expense.trip_id
-            ).first()
-            if not member:
+            if MemberDirectory(self.db).get_member(db_expense.trip_id, update_data['paid_by']) is None:
                 raise ValueError("Thành viên trả tiền không tồn tại trong chuyến đi này")
         
         # Kiểm tra ngày chi phí nếu có cập nhật
+        trip = None
         if 'date' in update_data:
             trip = self.db.query(TripModel).filter(TripModel.id == db_expense.trip_id).first()
             if update_data['date'].date() < trip.start_date.date() or update_data['date'].date() > trip.end_date.date():
                 raise ValueError("Ngày chi phí phải trong thời gian chuyến đi")
         
+        # Tra lại tỷ giá khi đổi tiền tệ hoặc ngày mà người dùng không nhập tỷ giá mới
+        if ('currency' in update_data or 'date' in update_data) and 'exchange_rate' not in update_data:
+            if trip is None:
+                trip = self.db.query(TripModel).filter(TripModel.id == db_expense.trip_id).first()
+            update_data['exchange_rate'] = ExchangeRateService(self.db).resolve_exchange_rate(
+                update_data.get('currency', db_expense.currency),
+                trip.currency,
+                update_data.get('date', db_expense.date).date()
+            )
+        
+        rollup_service = ExpenseRollupService(self.db)
+        rollup_service.remove_expense(db_expense)
+        
         for field, value in update_data.items():
             setattr(db_expense, field, value)
         
-        db_expense.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(db_expense)
+        if 'amount' in update_data or 'exchange_rate' in update_data:
+            db_expense.base_amount = calculate_base_amount(db_expense.amount, db_expense.exchange_rate)
+        db_expense.updated_at = func.now()
+        
+        rollup_service.add_expense(db_expense)
+        
+        commit_keep_loaded(self.db)
         return db_expense
     
     def delete_expense(self, expense_id: int, trip_id: int) -> bool:
         """Xóa chi phí"""
+        # Khóa dòng giống update_expense: giá trị trừ khỏi bảng tổng hợp phải là giá trị mới nhất
         db_expense = self.db.query(ExpenseModel).filter(
             ExpenseModel.id == expense_id,
             ExpenseModel.trip_id == trip_id
-        ).first()
+        ).with_for_update().populate_existing().first()
         
         if not db_expense:
             return False
         
+        receipt_service = ReceiptService(self.db)
+        receipt_keys = receipt_service.collect_receipt_keys(ExpenseModel.id == expense_id)
+        ExpenseRollupService(self.db).remove_expense(db_expense)
         self.db.delete(db_expense)
         self.db.commit()
+        receipt_service.delete_unused_files(receipt_keys)
         return True
     
-    def get_expense_summary(self, trip_id: int) -> Dict:
-        """Lấy tóm tắt chi phí theo danh mục và ngày"""
-        # Chi phí theo danh mục
-        category_expenses = self.db.query(
-            ExpenseModel.category,
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate).label('total')
+    def batch_update_expenses(self, trip_id: int, selection: ExpenseBatchSelection, patch: ExpenseUpdate) -> ExpenseBatchResult:
+        """Cập nhật hàng loạt chi phí bằng một câu lệnh UPDATE trong một transaction"""
+        trip = self.db.query(TripModel).filter(TripModel.id == trip_id).first()
+        if not trip:
+            raise ValueError("Chuyến đi không tồn tại")
+        
+        update_data = patch.dict(exclude_unset=True)
+        if not update_data:
+            raise ValueError("Không có thông tin nào để cập nhật")
+        
+        # Kiểm tra một lần cho cả lô thay vì cho từng chi phí
+        if update_data.get('paid_by') is not None:
+            if MemberDirectory(self.db).get_member(trip_id, update_data['paid_by']) is None:
+                raise ValueError("Thành viên trả tiền không tồn tại trong chuyến đi này")
+        
+        if update_data.get('activity_id') is not None:
+            activity_exists = self.db.query(ActivityModel.id).filter(
+                ActivityModel.id == update_data['activity_id'],
+                ActivityModel.trip_id == trip_id
+            ).first()
+            if not activity_exists:
+                raise ValueError("Hoạt động không tồn tại trong chuyến đi này")
+        
+        if update_data.get('date') is not None:
+            if update_data['date'].date() < trip.start_date.date() or update_data['date'].date() > trip.end_date.date():
+                raise ValueError("Ngày chi phí phải trong thời gian chuyến đi")
+        
+        # Các cột NOT NULL không được gán None
+        for field in ('description', 'amount', 'currency', 'exchange_rate', 'date', 'paid_by'):
+            if field in update_data and update_data[field] is None:
+                raise ValueError(f"Trường {field} không được để trống")
+        
+        conditions = self._build_batch_conditions(trip_id, selection)
+        values = {getattr(ExpenseModel, field): value for field, value in update_data.items()}
+        
+        # Tỷ giá mới phụ thuộc (tiền tệ, ngày) của từng dòng nên được tính thành biểu thức CASE
+        if ('currency' in update_data or 'date' in update_data) and 'exchange_rate' not in update_data:
+            values[ExpenseModel.exchange_rate] = self._batch_exchange_rate(trip, conditions, update_data)
+        
+        # Biểu thức chỉ tham chiếu cột không bị cập nhật nên không phụ thuộc thứ tự gán trong câu UPDATE
+        if 'amount' in update_data or ExpenseModel.exchange_rate in values:
+            amount_expr = literal(update_data['amount']) if 'amount' in update_data else ExpenseModel.amount
+            rate_expr = values.get(ExpenseModel.exchange_rate, ExpenseModel.exchange_rate)
+            values[ExpenseModel.base_amount] = func.round(amount_expr * rate_expr, 2)
+        
+        rollup_service = ExpenseRollupService(self.db)
+        touches_rollup = bool(ROLLUP_KEY_FIELDS & update_data.keys()) or ExpenseModel.base_amount in values
+        try:
+            if touches_rollup:
+                # Khóa và cố định tập dòng trước khi cập nhật: bộ lọc có thể không còn khớp sau UPDATE.
+                # Bảng tổng hợp được trừ giá trị cũ rồi cộng giá trị mới chỉ trên các dòng này
+                expense_ids = [expense_id for (expense_id,) in self.db.query(ExpenseModel.id).filter(*conditions).with_for_update().all()]
+                if not expense_ids:
+                    self.db.rollback()
+                    return ExpenseBatchResult(affected=0)
+                conditions = [ExpenseModel.trip_id == trip_id, ExpenseModel.id.in_(expense_ids)]
+                rollup_service.remove_expenses(trip_id, *conditions)
+            
+            affected = self.db.query(ExpenseModel).filter(*conditions).update(values, synchronize_session=False)
+            
+            if touches_rollup:
+                rollup_service.add_expenses(trip_id, *conditions)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        return ExpenseBatchResult(affected=affected)
+    
+    def batch_delete_expenses(self, trip_id: int, selection: ExpenseBatchSelection) -> ExpenseBatchResult:
+        """Xóa hàng loạt chi phí bằng một câu lệnh DELETE trong một transaction"""
+        trip_exists = self.db.query(TripModel.id).filter(TripModel.id == trip_id).first()
+        if not trip_exists:
+            raise ValueError("Chuyến đi không tồn tại")
+        
+        conditions = self._build_batch_conditions(trip_id, selection)
+        receipt_service = ReceiptService(self.db)
+        
+        try:
+            # Hóa đơn bị xóa theo ON DELETE CASCADE, nên lấy khóa file trước khi xóa
+            receipt_keys = receipt_service.collect_receipt_keys(*conditions)
+            ExpenseRollupService(self.db).remove_expenses(trip_id, *conditions)
+            affected = self.db.query(ExpenseModel).filter(*conditions).delete(synchronize_session=False)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        receipt_service.delete_unused_files(receipt_keys)
+        return ExpenseBatchResult(affected=affected)
+    
+    def _build_batch_conditions(self, trip_id: int, selection: ExpenseBatchSelection) -> List:
+        """Điều kiện chọn chi phí cho thao tác hàng loạt: theo danh sách id và/hoặc bộ lọc"""
+        if not selection.ids and selection.filter is None:
+            raise ValueError("Cần chọn chi phí theo danh sách id hoặc bộ lọc")
+        
+        expense_filter = selection.filter.dict() if selection.filter is not None else {}
+        conditions = self.build_expense_filters(trip_id, **expense_filter)
+        if selection.ids:
+            conditions.append(ExpenseModel.id.in_(selection.ids))
+        return conditions
+    
+    def _batch_exchange_rate(self, trip: TripModel, conditions: List, update_data: Dict):
+        """Tra tỷ giá cho từng cặp (tiền tệ, ngày) sau cập nhật và dựng biểu thức CASE tương ứng"""
+        new_currency = update_data.get('currency')
+        new_day = update_data['date'].date() if 'date' in update_data else None
+        
+        # Chỉ phân nhánh theo cột không bị cập nhật
+        if new_currency is not None and new_day is not None:
+            keys = [None]
+        elif new_currency is not None:
+            keys = [day for (day,) in self.db.query(func.date(ExpenseModel.date)).filter(*conditions).distinct().all()]
+        else:
+            keys = [currency for (currency,) in self.db.query(ExpenseModel.currency).filter(*conditions).distinct().all()]
+        if not keys:
+            return ExpenseModel.exchange_rate
+        
+        exchange_rates = ExchangeRateService(self.db)
+        if new_day is None:
+            exchange_rates.preload([new_currency, trip.currency], min(keys), max(keys))
+        
+        rates = {}
+        for key in keys:
+            currency = new_currency if new_currency is not None else key
+            day = new_day if new_day is not None else key
+            rates[key] = exchange_rates.resolve_exchange_rate(currency, trip.currency, day)
+        
+        if keys == [None]:
+            return literal(rates[None])
+        
+        column = func.date(ExpenseModel.date) if new_day is None else ExpenseModel.currency
+        return case(
+            *[(column == key, rate) for key, rate in rates.items()],
+            else_=ExpenseModel.exchange_rate
+        )
+    
+    def get_expense_analytics(self, trip_id: int, include_activities: bool = True) -> ExpenseAnalytics:
+        """Thống kê chi phí theo nhiều chiều từ bảng tổng hợp theo ngày"""
+        # Bảng tổng hợp đã ở mức (ngày, danh mục, người trả, chi phí chung): số dòng tỉ lệ với số ngày, không phải số chi phí
+        rows = self.db.query(
+            ExpenseDailyRollupModel.category,
+            ExpenseDailyRollupModel.day,
+            ExpenseDailyRollupModel.paid_by,
+            ExpenseDailyRollupModel.is_shared,
+            ExpenseDailyRollupModel.total,
+            ExpenseDailyRollupModel.expense_count
         ).filter(
-            ExpenseModel.trip_id == trip_id,
-            ExpenseModel.is_shared == True
-        ).group_by(ExpenseModel.category).all()
-        
-        # Chi phí theo ngày
-        date_expenses = self.db.query(
-            func.date(ExpenseModel.date).label('date'),
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate).label('total')
+            ExpenseDailyRollupModel.trip_id == trip_id
+        ).all()
+        members = MemberDirectory(self.db).get_members(trip_id)
+        
+        # Theo hoạt động: không nằm trong khóa của bảng tổng hợp nên gom nhóm trực tiếp trên expenses
+        activity_rows = []
+        if include_activities:
+            activity_rows = self.db.query(
+                ExpenseModel.activity_id,
+                ExpenseModel.is_shared,
+                func.sum(ExpenseModel.base_amount),
+                func.count(ExpenseModel.id)
+            ).filter(
+                ExpenseModel.trip_id == trip_id,
+                ExpenseModel.activity_id.isnot(None)
+            ).group_by(ExpenseModel.activity_id, ExpenseModel.is_shared).all()
+        
+        overall = ExpenseBreakdown()
+        by_category: Dict[str, ExpenseBreakdown] = {}
+        by_date: Dict[str, ExpenseBreakdown] = {}
+        by_member: Dict[int, MemberExpenseBreakdown] = {}
+        by_category_date: Dict[str, Dict[str, ExpenseBreakdown]] = {}
+        by_activity: Dict[int, ExpenseBreakdown] = {}
+        
+        def add(bucket: ExpenseBreakdown, total: Decimal, count: int, is_shared: bool) -> None:
+            bucket.total += total
+            bucket.count += count
+            if is_shared:
+                bucket.shared_total += total
+        
+        for category, row_day, paid_by, is_shared, total, count in rows:
+            category_key = category.value if category else ExpenseCategoryEnum.OTHER.value
+            day_key = str(row_day)
+            total = Decimal(str(total or 0))
+            
+            for bucket in (
+                overall,
+                by_category.setdefault(category_key, ExpenseBreakdown()),
+                by_date.setdefault(day_key, ExpenseBreakdown()),
+                by_member.setdefault(paid_by, MemberExpenseBreakdown(name=members[paid_by].name if paid_by in members else "")),
+                by_category_date.setdefault(category_key, {}).setdefault(day_key, ExpenseBreakdown())
+            ):
+                add(bucket, total, count, is_shared)
+        
+        for activity_id, is_shared, total, count in activity_rows:
+            add(by_activity.setdefault(activity_id, ExpenseBreakdown()), Decimal(str(total or 0)), count, is_shared)
+        
+        return ExpenseAnalytics(
+            overall=overall,
+            by_category=by_category,
+            by_date=dict(sorted(by_date.items())),
+            by_member=by_member,
+            by_category_date=by_category_date,
+            by_activity=by_activity
+        )
+    
+    def get_expense_summary(self, trip_id: int) -> Dict:
+        """Lấy tóm tắt chi phí chung theo danh mục và ngày"""
+        # Một truy vấn trên bảng tổng hợp; giữ nguyên định dạng khóa cũ (vd. "ExpenseCategoryEnum.FOOD")
+        # vì TripSummary và frontend vẫn dùng
+        rows = self.db.query(
+            ExpenseDailyRollupModel.category,
+            ExpenseDailyRollupModel.day,
+            ExpenseDailyRollupModel.total
         ).filter(
-            ExpenseModel.trip_id == trip_id,
-            ExpenseModel.is_shared == True
-        ).group_by(func.date(ExpenseModel.date)).all()
+            ExpenseDailyRollupModel.trip_id == trip_id,
+            ExpenseDailyRollupModel.is_shared == True
+        ).all()
+        
+        by_category: Dict[str, float] = {}
+        by_date: Dict[str, float] = {}
+        for category, row_day, total in rows:
+            category_key = str(category)
+            by_category[category_key] = by_category.get(category_key, 0.0) + float(total or 0)
+            by_date[str(row_day)] = by_date.get(str(row_day), 0.0) + float(total or 0)
         
         return {
-            'by_category': {str(cat): float(total) for cat, total in category_expenses},
-            'by_date': {str(date): float(total) for date, total in date_expenses}
+            'by_category': by_category,
+            'by_date': dict(sorted(by_date.items()))
         }
     
     def get_expenses_by_member(self, trip_id: int) -> Dict:
         """Lấy chi phí theo từng thành viên"""
-        member_expenses = self.db.query(
-            TripMemberModel.id,
-            TripMemberModel.name,
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate).label('total_paid')
-        ).join(
-            ExpenseModel, TripMemberModel.id == ExpenseModel.paid_by
-        ).filter(
-            TripMemberModel.trip_id == trip_id
-        ).group_by(TripMemberModel.id, TripMemberModel.name).all()
+        analytics = self.get_expense_analytics(trip_id, include_activities=False)
         
         return {
             member_id: {
-                'name': name,
-                'total_paid': float(total_paid)
+                'name': bucket.name,
+                'total_paid': float(bucket.total)
             }
-            for member_id, name, total_paid in member_expenses
+            for member_id, bucket in analytics.by_member.items()
         }
     
     # Expense Categories
@@ -195,8 +507,7 @@ class ExpenseService:
         )
         
         self.db.add(db_category)
-        self.db.commit()
-        self.db.refresh(db_category)
+        commit_keep_loaded(self.db)
         return db_category
     
     def get_expense_categories(self, trip_id: int) -> List[ExpenseCategoryModel]:
@@ -0,0 +1,305 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import update
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+import csv
+import logging
+import threading
+import unicodedata
+import httpx
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.models import Activity as ActivityModel, GeocodeCache as GeocodeCacheModel
+from ..schemas.schemas import GeocodeResult
+from ..utils.geo import geohash_encode
+from .activity_service import clear_distance_cache
+
+logger = logging.getLogger(__name__)
+
+# Kết quả của nguồn tra cứu: (vĩ độ, kinh độ, địa chỉ đầy đủ)
+GeocodeMatch = Tuple[float, float, Optional[str]]
+
+COALESCE_WAIT_SECONDS = 15
+_provider = None
+
+class GeocodingError(RuntimeError):
+    """Không tra được tọa độ (nguồn lỗi, hết thời gian chờ, chưa cấu hình nguồn), khác với không tìm thấy địa điểm"""
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa chuỗi địa điểm làm khóa cache: cùng dạng Unicode, chữ thường, gộp khoảng trắng"""
+    parts = [" ".join(part.split()) for part in unicodedata.normalize("NFC", query).casefold().split(",")]
+    return ", ".join(part for part in parts if part).strip(" .")[:255]
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d"))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+class GeocodingProvider(ABC):
+    """Nguồn tra cứu tọa độ có thể thay thế (file địa danh, API...)"""
+    name = "custom"
+
+    @abstractmethod
+    def geocode(self, query: str) -> Optional[GeocodeMatch]:
+        """Trả về tọa độ của địa điểm, None nếu không tìm thấy; lỗi kết nối thì raise"""
+
+class GazetteerGeocodingProvider(GeocodingProvider):
+    """Tra cứu ngoại tuyến trong file CSV địa danh với các cột name,latitude,longitude[,address]"""
+    name = "gazetteer"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._places: Optional[Dict[str, GeocodeMatch]] = None
+        self._load_error: Optional[str] = None
+
+    def geocode(self, query: str) -> Optional[GeocodeMatch]:
+        if self._places is None:
+            # Lỗi đọc file được ghi nhớ: không đọc lại và ghi log ở mỗi lần tra cứu
+            if self._load_error is None:
+                try:
+                    self._places = self._load()
+                except (OSError, ValueError) as e:
+                    self._load_error = str(e)
+                    logger.error(f"Không đọc được file địa danh {self.path}: {e}")
+            if self._places is None:
+                raise GeocodingError(f"File địa danh không dùng được: {self._load_error}")
+
+        key = _strip_accents(normalize_query(query))
+        if key in self._places:
+            return self._places[key]
+        # "Chợ Bến Thành, Quận 1, TP.HCM": thử lần lượt từng phần, cụ thể nhất trước
+        for part in key.split(","):
+            part = part.strip()
+            if part in self._places:
+                return self._places[part]
+        return None
+
+    def _load(self) -> Dict[str, GeocodeMatch]:
+        places = {}
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                try:
+                    places[_strip_accents(normalize_query(record["name"]))] = (
+                        float(record["latitude"]),
+                        float(record["longitude"]),
+                        (record.get("address") or "").strip() or record["name"].strip()
+                    )
+                except (KeyError, ValueError, AttributeError) as e:
+                    raise ValueError(f"Dòng địa danh không hợp lệ ({self.path}:{line_no}): {e}")
+        return places
+
+class GoogleGeocodingProvider(GeocodingProvider):
+    """Google Geocoding API (cần GOOGLE_MAPS_API_KEY)"""
+    name = "google"
+    URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+    def __init__(self, api_key: str, timeout: float = 5.0):
+        self.api_key = api_key
+        self.client = httpx.Client(timeout=timeout)
+
+    def geocode(self, query: str) -> Optional[GeocodeMatch]:
+        response = self.client.get(self.URL, params={"address": query, "key": self.api_key, "language": "vi"})
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("status") == "ZERO_RESULTS":
+            return None
+        if data.get("status") != "OK":
+            raise RuntimeError(f"Google Geocoding trả về {data.get('status')}: {data.get('error_message', '')}")
+
+        result = data["results"][0]
+        location = result["geometry"]["location"]
+        return location["lat"], location["lng"], result.get("formatted_address")
+
+def set_geocoding_provider(provider: Optional[GeocodingProvider]) -> None:
+    """Thay nguồn tra cứu tọa độ mặc định"""
+    global _provider
+    _provider = provider
+
+def get_geocoding_provider() -> Optional[GeocodingProvider]:
+    global _provider
+    if _provider is None:
+        choice = settings.geocoding_provider.strip().lower()
+        if choice in ("", "google") and settings.google_maps_api_key:
+            _provider = GoogleGeocodingProvider(settings.google_maps_api_key)
+        elif choice in ("", "gazetteer") and settings.gazetteer_file:
+            _provider = GazetteerGeocodingProvider(settings.gazetteer_file)
+    return _provider
+
+class _InflightLookup:
+    """Một lượt tra cứu đang chạy; các request cùng khóa chờ kết quả thay vì gọi nguồn lần nữa"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[GeocodeResult] = None
+
+_inflight: Dict[str, _InflightLookup] = {}
+_inflight_lock = threading.Lock()
+
+class GeocodingService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def geocode(self, query: str) -> Optional[GeocodeResult]:
+        """Tra tọa độ của một địa điểm: cache trong database -> nguồn tra cứu (None nếu không tìm thấy)"""
+        key = normalize_query(query)
+        if not key:
+            raise ValueError("Địa điểm không được để trống")
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached if cached.found else None
+
+        with _inflight_lock:
+            lookup = _inflight.get(key)
+            is_leader = lookup is None
+            if is_leader:
+                lookup = _inflight[key] = _InflightLookup()
+
+        if not is_leader:
+            # Request khác đang tra đúng địa điểm này
+            if not lookup.done.wait(COALESCE_WAIT_SECONDS):
+                raise GeocodingError("Hết thời gian chờ tra cứu địa điểm")
+            if lookup.result is None:
+                raise GeocodingError("Không tra được tọa độ từ nguồn tra cứu")
+            return lookup.result if lookup.result.found else None
+
+        try:
+            lookup.result = self._lookup(key, query)
+        finally:
+            lookup.done.set()
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+        return lookup.result if lookup.result.found else None
+
+    def geocode_activities(
+        self,
+        activity_ids: Optional[List[int]] = None,
+        trip_id: Optional[int] = None,
+        batch_size: int = 200
+    ) -> int:
+        """Điền tọa độ cho các hoạt động có địa điểm nhưng chưa có tọa độ (mỗi địa điểm chỉ tra một lần)"""
+        query = self.db.query(ActivityModel.id, ActivityModel.trip_id, ActivityModel.location).filter(
+            ActivityModel.location.isnot(None),
+            ActivityModel.location != "",
+            ActivityModel.latitude.is_(None)
+        )
+        if activity_ids is not None:
+            query = query.filter(ActivityModel.id.in_(activity_ids))
+        if trip_id is not None:
+            query = query.filter(ActivityModel.trip_id == trip_id)
+
+        updated = 0
+        last_id = 0
+        while True:
+            rows = query.filter(ActivityModel.id > last_id).order_by(ActivityModel.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            by_location: Dict[str, List] = {}
+            for row in rows:
+                by_location.setdefault(normalize_query(row.location), []).append(row)
+
+            for location_rows in by_location.values():
+                try:
+                    result = self.geocode(location_rows[0].location)
+                except GeocodingError:
+                    continue  # Lỗi tạm thời: lần chạy sau sẽ thử lại
+                if result is None:
+                    continue
+                # Chỉ ghi khi người dùng chưa tự nhập tọa độ trong lúc đang tra cứu
+                updated += self.db.execute(
+                    update(ActivityModel).where(
+                        ActivityModel.id.in_([row.id for row in location_rows]),
+                        ActivityModel.latitude.is_(None)
+                    ).values(
+                        latitude=result.latitude,
+                        longitude=result.longitude,
+                        geohash=geohash_encode(float(result.latitude), float(result.longitude))
+                    )
+                ).rowcount
+            self.db.commit()
+
+            for affected_trip_id in {row.trip_id for row in rows}:
+                clear_distance_cache(affected_trip_id)
+        return updated
+
+    def _get_cached(self, key: str) -> Optional[GeocodeResult]:
+        row = self.db.query(GeocodeCacheModel).filter(
+            GeocodeCacheModel.query_key == key,
+            GeocodeCacheModel.expires_at > datetime.utcnow()
+        ).first()
+        if row is None:
+            return None
+        return self._to_result(row, cached=True)
+
+    def _lookup(self, key: str, query: str) -> GeocodeResult:
+        """Gọi nguồn tra cứu và lưu kết quả (kể cả "không tìm thấy") vào cache"""
+        provider = get_geocoding_provider()
+        if provider is None:
+            raise GeocodingError("Chưa cấu hình nguồn tra cứu tọa độ")
+
+        # Lỗi không được lưu cache để lần sau thử lại
+        try:
+            match = provider.geocode(query)
+        except GeocodingError:
+            raise
+        except Exception as e:
+            logger.warning(f"Không tra được tọa độ từ nguồn {type(provider).__name__}: {e}")
+            raise GeocodingError(f"Không tra được tọa độ từ nguồn tra cứu: {e}")
+
+        ttl_days = settings.geocode_cache_ttl_days if match else settings.geocode_miss_ttl_days
+        values = {
+            "provider": provider.name,
+            "found": match is not None,
+            "latitude": None,
+            "longitude": None,
+            "formatted_address": None,
+            "expires_at": datetime.utcnow() + timedelta(days=ttl_days)
+        }
+        if match:
+            latitude, longitude, formatted_address = match
+            values["latitude"] = Decimal(str(round(latitude, 8)))
+            values["longitude"] = Decimal(str(round(longitude, 8)))
+            values["formatted_address"] = formatted_address[:500] if formatted_address else None
+
+        row = self.db.query(GeocodeCacheModel).filter(GeocodeCacheModel.query_key == key).first()
+        if row is not None:
+            # Bản ghi đã hết hạn: làm mới
+            for field, value in values.items():
+                setattr(row, field, value)
+        else:
+            row = GeocodeCacheModel(query_key=key, **values)
+            try:
+                with self.db.begin_nested():
+                    self.db.add(row)
+            except IntegrityError:
+                pass  # Instance khác vừa lưu cùng địa điểm
+        self.db.commit()
+        return self._to_result(row, cached=False)
+
+    def _to_result(self, row: GeocodeCacheModel, cached: bool) -> GeocodeResult:
+        return GeocodeResult(
+            query=row.query_key,
+            found=bool(row.found),
+            latitude=row.latitude,
+            longitude=row.longitude,
+            formatted_address=row.formatted_address,
+            provider=row.provider,
+            cached=cached
+        )
+
+def geocode_activities_in_background(activity_ids: Optional[List[int]] = None, trip_id: Optional[int] = None) -> None:
+    """Tác vụ nền sau khi tạo/cập nhật hoạt động: điền tọa độ từ địa điểm (session riêng)"""
+    if get_geocoding_provider() is None:
+        return
+    with SessionLocal() as db:
+        try:
+            GeocodingService(db).geocode_activities(activity_ids=activity_ids, trip_id=trip_id)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Không điền được tọa độ cho hoạt động: {e}")
@@ -0,0 +1,98 @@
+from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+from datetime import datetime, time
+from ..core.config import settings
+from ..models.models import Activity as ActivityModel, Trip as TripModel
+from ..schemas.schemas import DayItinerary, ItineraryOptimization, ItineraryOptimizeRequest
+from ..utils.dates import day_range
+from ..utils.itinerary import optimize_route, route_length
+from .activity_service import ActivityService
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def get_optimizer_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.optimizer_workers)
+    return _executor
+
+class ItineraryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def optimize(self, trip_id: int, request: ItineraryOptimizeRequest) -> ItineraryOptimization:
+        """Đề xuất thứ tự tham quan ngắn nhất cho từng ngày (chỉ đề xuất, không ghi vào dữ liệu)"""
+        trip = self.db.query(TripModel.id).filter(TripModel.id == trip_id).first()
+        if not trip:
+            raise ValueError("Chuyến đi không tồn tại")
+
+        days = sorted(set(request.days))
+        range_start, range_end = day_range(days[0], days[-1])
+        activities = self.db.query(
+            ActivityModel.id,
+            ActivityModel.date,
+            ActivityModel.latitude,
+            ActivityModel.longitude
+        ).filter(
+            ActivityModel.trip_id == trip_id,
+            ActivityModel.date >= range_start,
+            ActivityModel.date < range_end
+        ).all()
+
+        starts_at = {activity.id: activity.date for activity in activities}
+        unrouted: Dict = {}
+        for activity in activities:
+            if activity.latitude is None or activity.longitude is None:
+                unrouted.setdefault(activity.date.date(), []).append(activity.id)
+
+        requested_fixed = set(request.fixed_activity_ids)
+        activity_service = ActivityService(self.db)
+        budget = request.time_budget_ms / 1000
+
+        jobs = []
+        for day in days:
+            matrix = activity_service.get_distance_matrix(trip_id, day=day)
+            ids = matrix.activity_ids
+            fixed = [self._is_fixed(starts_at[activity_id], activity_id, requested_fixed, request.respect_times) for activity_id in ids]
+            jobs.append((day, ids, matrix.distances_km, fixed))
+
+        # Nhiều ngày thì tối ưu song song trong process pool, một ngày thì chạy ngay trong request
+        routed_days = [job for job in jobs if len(job[1]) >= 3]
+        if len(routed_days) > 1:
+            executor = get_optimizer_executor()
+            futures = {
+                day: executor.submit(optimize_route, distances, fixed, request.keep_start, budget)
+                for day, _, distances, fixed in routed_days
+            }
+            orders = {day: future.result() for day, future in futures.items()}
+        else:
+            orders = {
+                day: optimize_route(distances, fixed, request.keep_start, budget)
+                for day, _, distances, fixed in routed_days
+            }
+
+        results = []
+        for day, ids, distances, _ in jobs:
+            order = orders.get(day, list(range(len(ids))))
+            original_km = route_length(range(len(ids)), distances)
+            optimized_km = route_length(order, distances)
+            results.append(DayItinerary(
+                day=day,
+                activity_ids=[ids[i] for i in order],
+                original_distance_km=round(original_km, 3),
+                optimized_distance_km=round(optimized_km, 3),
+                distance_saved_km=round(original_km - optimized_km, 3),
+                unrouted_ids=sorted(unrouted.get(day, []))
+            ))
+
+        return ItineraryOptimization(
+            days=results,
+            total_distance_saved_km=round(sum(result.distance_saved_km for result in results), 3)
+        )
+
+    def _is_fixed(self, starts_at: datetime, activity_id: int, requested_fixed: Set[int], respect_times: bool) -> bool:
+        """Hoạt động cố định: được chỉ định hoặc có giờ cụ thể (giờ 00:00 nghĩa là chưa xếp giờ)"""
+        if activity_id in requested_fixed:
+            return True
+        return respect_times and starts_at.time() != time.min
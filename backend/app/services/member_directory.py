@@ -0,0 +1,58 @@
+from sqlalchemy.orm import Session
+from typing import Dict, NamedTuple, Optional
+from datetime import datetime
+from decimal import Decimal
+from ..models.models import TripMember as TripMemberModel
+
+# Danh bạ thành viên theo chuyến đi, dùng chung cho kiểm tra chi phí, nhập chi phí và serialize.
+# Chỉ nhớ trong phạm vi một session (một request): trên serverless mỗi instance có bộ nhớ riêng,
+# cache dùng chung giữa các request sẽ trả về tên/hệ số cũ sau khi instance khác sửa thành viên.
+_SESSION_KEY = "member_directory"
+
+class MemberEntry(NamedTuple):
+    # Cùng tên thuộc tính với TripMemberModel nên dùng được với serialize_member
+    id: int
+    trip_id: int
+    name: str
+    email: Optional[str]
+    factor: Decimal
+    is_admin: bool
+    created_at: datetime
+
+def invalidate_member_directory(db: Session, trip_id: Optional[int] = None) -> None:
+    """Xóa danh bạ đã đọc trong session sau khi ghi thành viên"""
+    directory = db.info.get(_SESSION_KEY)
+    if directory is None:
+        return
+    if trip_id is None:
+        directory.clear()
+    else:
+        directory.pop(trip_id, None)
+
+class MemberDirectory:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_members(self, trip_id: int) -> Dict[int, MemberEntry]:
+        """Thành viên của chuyến đi theo id (theo thứ tự id; chỉ đọc, không sửa dict trả về)"""
+        directory = self.db.info.setdefault(_SESSION_KEY, {})
+        members = directory.get(trip_id)
+        if members is None:
+            members = directory[trip_id] = self._load(trip_id)
+        return members
+
+    def get_member(self, trip_id: int, member_id: int) -> Optional[MemberEntry]:
+        """Tra một thành viên của chuyến đi"""
+        return self.get_members(trip_id).get(member_id)
+
+    def _load(self, trip_id: int) -> Dict[int, MemberEntry]:
+        rows = self.db.query(
+            TripMemberModel.id,
+            TripMemberModel.trip_id,
+            TripMemberModel.name,
+            TripMemberModel.email,
+            TripMemberModel.factor,
+            TripMemberModel.is_admin,
+            TripMemberModel.created_at
+        ).filter(TripMemberModel.trip_id == trip_id).order_by(TripMemberModel.id).all()
+        return {row.id: MemberEntry(*row) for row in rows}
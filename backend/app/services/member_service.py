@@ -1,7 +1,33 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from ..models.models import TripMember as TripMemberModel, Trip as TripModel
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Tuple
+from decimal import Decimal
+from ..models.models import TripMember as TripMemberModel, Trip as TripModel, Expense as ExpenseModel
 from ..schemas.schemas import TripMemberCreate, TripMemberUpdate
+from ..core.database import commit_keep_loaded, update_returning
+from .expense_rollup_service import ExpenseRollupService
+from .member_directory import invalidate_member_directory
+
+MAX_MEMBER_FACTOR = Decimal("5")  # Giới hạn hệ số giống schema TripMemberBase
+
+# Unique key (trip_id, name) và (trip_id, email) được thêm lúc khởi động và có thể thất bại trên dữ liệu cũ;
+# khi chưa xác nhận được cả hai key thì kiểm tra trùng bằng truy vấn trước khi ghi
+_unique_keys_enforced = False
+
+def set_member_unique_keys_enforced(enforced: bool) -> None:
+    """Ghi nhận database đã có đủ unique key cho tên/email thành viên (gọi khi khởi động)"""
+    global _unique_keys_enforced
+    _unique_keys_enforced = enforced
+
+def _member_conflict_message(error: IntegrityError) -> Optional[str]:
+    """Thông báo lỗi theo unique key bị vi phạm (tên constraint trên MySQL, tên cột trên SQLite)"""
+    detail = str(error.orig)
+    if "unique_name_per_trip" in detail or "trip_members.name" in detail:
+        return "Tên thành viên đã tồn tại trong chuyến đi này"
+    if "unique_email_per_trip" in detail or "trip_members.email" in detail:
+        return "Email đã được sử dụng trong chuyến đi này"
+    return None
 
 class MemberService:
     def __init__(self, db: Session):
@@ -9,44 +35,97 @@ class MemberService:
     
     def create_member(self, trip_id: int, member: TripMemberCreate) -> TripMemberModel:
         """Tạo thành viên mới cho chuyến đi"""
-        # Kiểm tra chuyến đi có tồn tại không
-        trip = self.db.query(TripModel).filter(TripModel.id == trip_id).first()
+        return self.create_members(trip_id, [member])[0]
+    
+    def create_members(self, trip_id: int, members: List[TripMemberCreate]) -> List[TripMemberModel]:
+        """Thêm nhiều thành viên trong một transaction (tên/email trùng được phát hiện qua unique key)"""
+        # Một truy vấn: chuyến đi có tồn tại không và đã có thành viên nào chưa
+        has_members = select(TripMemberModel.id).where(TripMemberModel.trip_id == TripModel.id).exists()
+        trip = self.db.query(TripModel.id, has_members.label('has_members')).filter(TripModel.id == trip_id).first()
         if not trip:
             raise ValueError("Chuyến đi không tồn tại")
         
-        # Kiểm tra tên thành viên đã tồn tại chưa
-        existing_member = self.db.query(TripMemberModel).filter(
-            TripMemberModel.trip_id == trip_id,
-            TripMemberModel.name == member.name
-        ).first()
-        if existing_member:
-            raise ValueError("Tên thành viên đã tồn tại trong chuyến đi này")
+        # Trùng lặp ngay trong danh sách gửi lên (so sánh không phân biệt hoa thường như collation của MySQL)
+        names, emails = set(), set()
+        for member in members:
+            if member.name.casefold() in names:
+                raise ValueError("Tên thành viên đã tồn tại trong chuyến đi này")
+            names.add(member.name.casefold())
+            if member.email:
+                if member.email.casefold() in emails:
+                    raise ValueError("Email đã được sử dụng trong chuyến đi này")
+                emails.add(member.email.casefold())
         
-        # Kiểm tra email đã tồn tại chưa (nếu có)
-        if member.email:
-            existing_email = self.db.query(TripMemberModel).filter(
-                TripMemberModel.trip_id == trip_id,
-                TripMemberModel.email == member.email
-            ).first()
-            if existing_email:
-                raise ValueError("Email đã được sử dụng trong chuyến đi này")
+        self._check_member_conflicts(
+            trip_id,
+            [member.name for member in members],
+            [member.email for member in members if member.email]
+        )
+        
+        # Chuyến đi chưa có thành viên nào thì thành viên đầu tiên sẽ là admin
+        db_members = [
+            TripMemberModel(
+                trip_id=trip_id,
+                name=member.name,
+                email=member.email or None,
+                factor=member.factor,
+                is_admin=not trip.has_members and index == 0
+            )
+            for index, member in enumerate(members)
+        ]
         
-        # Kiểm tra xem đã có admin chưa, nếu chưa thì thành viên đầu tiên sẽ là admin
-        member_count = self.db.query(TripMemberModel).filter(TripMemberModel.trip_id == trip_id).count()
-        is_admin = member_count == 0
+        # Lấy id ngay sau khi INSERT; không đọc lại theo tên vì collation của MySQL có thể trả về tên khác chữ
+        try:
+            self.db.add_all(db_members)
+            self.db.flush()
+            member_ids = [db_member.id for db_member in db_members]
+            self.db.commit()
+        except IntegrityError as e:
+            self._raise_member_conflict(e)
+        invalidate_member_directory(self.db, trip_id)
         
-        db_member = TripMemberModel(
-            trip_id=trip_id,
-            name=member.name,
-            email=member.email,
-            factor=member.factor,
-            is_admin=is_admin
+        # Một truy vấn theo id nạp lại các cột do server sinh cho toàn bộ thành viên vừa thêm
+        self.db.query(TripMemberModel).filter(TripMemberModel.id.in_(member_ids)).populate_existing().all()
+        return db_members
+    
+    def get_members_by_names(self, trip_id: int, names: List[str]) -> List[TripMemberModel]:
+        """Lấy thành viên của chuyến đi theo tên (dùng unique key (trip_id, name))"""
+        return self.db.query(TripMemberModel).filter(
+            TripMemberModel.trip_id == trip_id,
+            TripMemberModel.name.in_(names)
+        ).all()
+    
+    def _check_member_conflicts(
+        self,
+        trip_id: int,
+        names: List[str],
+        emails: List[str],
+        exclude_member_id: Optional[int] = None
+    ) -> None:
+        """Kiểm tra trùng tên/email bằng truy vấn khi database chưa có unique key"""
+        if _unique_keys_enforced or not (names or emails):
+            return
+        query = self.db.query(TripMemberModel.name, TripMemberModel.email).filter(
+            TripMemberModel.trip_id == trip_id,
+            or_(TripMemberModel.name.in_(names), TripMemberModel.email.in_(emails))
         )
+        if exclude_member_id is not None:
+            query = query.filter(TripMemberModel.id != exclude_member_id)
         
-        self.db.add(db_member)
-        self.db.commit()
-        self.db.refresh(db_member)
-        return db_member
+        conflicts = query.all()
+        wanted_names = {name.casefold() for name in names}
+        if any(name.casefold() in wanted_names for name, _ in conflicts):
+            raise ValueError("Tên thành viên đã tồn tại trong chuyến đi này")
+        if conflicts:
+            raise ValueError("Email đã được sử dụng trong chuyến đi này")
+    
+    def _raise_member_conflict(self, error: IntegrityError) -> None:
+        """Rollback; vi phạm unique key được chuyển thành thông báo lỗi tương ứng"""
+        self.db.rollback()
+        message = _member_conflict_message(error)
+        if message is None:
+            raise error
+        raise ValueError(message)
     
     def get_members_by_trip(self, trip_id: int) -> List[TripMemberModel]:
         """Lấy danh sách thành viên của chuyến đi"""
@@ -56,39 +135,34 @@ class MemberService:
         """Lấy thông tin thành viên theo ID"""
         return self.db.query(TripMemberModel).filter(TripMemberModel.id == member_id).first()
     
-    def update_member(self, member_id: int, member_update: TripMemberUpdate) -> Optional[TripMemberModel]:
+    def update_member(self, member_id: int, trip_id: int, member_update: TripMemberUpdate) -> Optional[TripMemberModel]:
         """Cập nhật thông tin thành viên"""
-        db_member = self.get_member(member_id)
-        if not db_member:
-            return None
-        
         update_data = member_update.dict(exclude_unset=True)
+        if 'email' in update_data:
+            update_data['email'] = update_data['email'] or None
+        self._check_member_conflicts(
+            trip_id,
+            [update_data['name']] if update_data.get('name') else [],
+            [update_data['email']] if update_data.get('email') else [],
+            exclude_member_id=member_id
+        )
         
-        # Kiểm tra tên không trùng với thành viên khác
-        if 'name' in update_data:
-            existing_member = self.db.query(TripMemberModel).filter(
-                TripMemberModel.trip_id == db_member.trip_id,
-                TripMemberModel.name == update_data['name'],
-                TripMemberModel.id != member_id
-            ).first()
-            if existing_member:
-                raise ValueError("Tên thành viên đã tồn tại trong chuyến đi này")
-        
-        # Kiểm tra email không trùng với thành viên khác
-        if 'email' in update_data and update_data['email']:
-            existing_email = self.db.query(TripMemberModel).filter(
-                TripMemberModel.trip_id == db_member.trip_id,
-                TripMemberModel.email == update_data['email'],
-                TripMemberModel.id != member_id
-            ).first()
-            if existing_email:
-                raise ValueError("Email đã được sử dụng trong chuyến đi này")
-        
-        for field, value in update_data.items():
-            setattr(db_member, field, value)
-        
-        self.db.commit()
-        self.db.refresh(db_member)
+        # Tên/email trùng với thành viên khác được phát hiện qua unique key
+        try:
+            db_member = update_returning(
+                self.db,
+                TripMemberModel,
+                update_data,
+                TripMemberModel.id == member_id,
+                TripMemberModel.trip_id == trip_id
+            )
+            if not db_member:
+                self.db.rollback()
+                return None
+            commit_keep_loaded(self.db)
+        except IntegrityError as e:
+            self._raise_member_conflict(e)
+        invalidate_member_directory(self.db, trip_id)
         return db_member
     
     def delete_member(self, member_id: int, trip_id: int) -> bool:
@@ -112,19 +186,81 @@ class MemberService:
         
         self.db.delete(db_member)
         self.db.commit()
+        invalidate_member_directory(self.db, trip_id)
         return True
     
+    def merge_members(
+        self,
+        trip_id: int,
+        member_id: int,
+        into_member_id: int,
+        factor_policy: str = "keep"
+    ) -> Optional[Tuple[TripMemberModel, int]]:
+        """Gộp thành viên trùng vào một thành viên khác: chuyển chi phí, gộp hệ số rồi xóa thành viên trùng"""
+        if member_id == into_member_id:
+            raise ValueError("Không thể gộp thành viên với chính nó")
+        
+        # Khóa cả hai thành viên theo thứ tự id ngay đầu transaction: hai lượt gộp ngược chiều nhau
+        # chờ nhau thay vì deadlock, và hệ số/email đọc được không bị thay đổi trước khi ghi
+        members = {
+            member.id: member
+            for member in self.db.query(TripMemberModel).filter(
+                TripMemberModel.id.in_([member_id, into_member_id]),
+                TripMemberModel.trip_id == trip_id
+            ).order_by(TripMemberModel.id).with_for_update().all()
+        }
+        duplicate, kept = members.get(member_id), members.get(into_member_id)
+        if duplicate is None or kept is None:
+            self.db.rollback()
+            return None
+        
+        try:
+            # Một câu lệnh UPDATE cho toàn bộ chi phí, không phụ thuộc số lượng
+            moved = self.db.execute(
+                update(ExpenseModel).where(
+                    ExpenseModel.trip_id == trip_id,
+                    ExpenseModel.paid_by == member_id
+                ).values(paid_by=into_member_id).execution_options(synchronize_session=False)
+            ).rowcount
+            
+            factor = Decimal(str(kept.factor))
+            if factor_policy == "sum":
+                factor = min(factor + Decimal(str(duplicate.factor)), MAX_MEMBER_FACTOR)
+            elif factor_policy == "max":
+                factor = max(factor, Decimal(str(duplicate.factor)))
+            
+            email = kept.email or duplicate.email
+            is_admin = kept.is_admin or duplicate.is_admin
+            
+            # Xóa trước để email của thành viên trùng không vi phạm unique key khi chuyển sang
+            self.db.delete(duplicate)
+            self.db.flush()
+            kept.factor = factor
+            kept.email = email
+            kept.is_admin = is_admin
+            
+            # Bảng tổng hợp theo ngày có khóa theo người trả: chuyển các dòng của thành viên trùng sang
+            ExpenseRollupService(self.db).reassign_payer(trip_id, member_id, into_member_id)
+            commit_keep_loaded(self.db)
+        except IntegrityError as e:
+            self._raise_member_conflict(e)
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        invalidate_member_directory(self.db, trip_id)
+        return kept, moved
+    
     def join_trip(self, trip_id: int, member: TripMemberCreate) -> TripMemberModel:
         """Tham gia chuyến đi"""
         return self.create_member(trip_id, member)
     
     def set_admin(self, member_id: int, is_admin: bool) -> Optional[TripMemberModel]:
         """Thiết lập quyền admin cho thành viên"""
-        db_member = self.get_member(member_id)
+        db_member = update_returning(self.db, TripMemberModel, {"is_admin": is_admin}, TripMemberModel.id == member_id)
         if not db_member:
+            self.db.rollback()
             return None
-        
-        db_member.is_admin = is_admin
-        self.db.commit()
-        self.db.refresh(db_member)
+        commit_keep_loaded(self.db)
+        invalidate_member_directory(self.db, db_member.trip_id)
         return db_member
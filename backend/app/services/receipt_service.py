@@ -0,0 +1,185 @@
+from sqlalchemy.orm import Session
+from multipart.multipart import MultipartParser, parse_options_header
+from typing import Dict, Iterable, List, Optional, Set
+from ..core.config import settings
+from ..models.models import Expense as ExpenseModel, Receipt as ReceiptModel
+from .receipt_store import get_receipt_store, ReceiptWriter
+from .receipt_thumbnails import thumbnail_key
+
+ALLOWED_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif", "image/heic", "application/pdf")
+
+class ReceiptService:
+    # Dữ liệu upload được đưa vào từng phần qua feed() và ghi thẳng xuống nơi lưu trữ,
+    # bộ nhớ dùng cho mỗi upload không phụ thuộc kích thước file
+    MAX_FILES_PER_UPLOAD = 10
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.store = get_receipt_store()
+        self._writer: Optional[ReceiptWriter] = None
+        self._files: List[Dict] = []
+
+    def get_receipts(self, trip_id: int, expense_id: int) -> List[ReceiptModel]:
+        """Lấy danh sách hóa đơn của chi phí"""
+        return self.db.query(ReceiptModel).join(ExpenseModel).filter(
+            ReceiptModel.expense_id == expense_id,
+            ExpenseModel.trip_id == trip_id
+        ).order_by(ReceiptModel.id).all()
+
+    def get_receipt(self, trip_id: int, expense_id: int, receipt_id: int) -> Optional[ReceiptModel]:
+        """Lấy hóa đơn theo ID (kiểm tra thuộc chi phí và chuyến đi)"""
+        return self.db.query(ReceiptModel).join(ExpenseModel).filter(
+            ReceiptModel.id == receipt_id,
+            ReceiptModel.expense_id == expense_id,
+            ExpenseModel.trip_id == trip_id
+        ).first()
+
+    def delete_receipt(self, trip_id: int, expense_id: int, receipt_id: int) -> bool:
+        """Xóa hóa đơn; file chỉ bị xóa khi không còn hóa đơn nào dùng chung nội dung"""
+        receipt = self.get_receipt(trip_id, expense_id, receipt_id)
+        if not receipt:
+            return False
+
+        key = receipt.sha256
+        self.db.delete(receipt)
+        self.db.commit()
+
+        self.delete_unused_files([key])
+        return True
+
+    def collect_receipt_keys(self, *expense_conditions) -> Set[str]:
+        """Khóa file của các hóa đơn thuộc những chi phí sắp bị xóa (gọi trước khi xóa)"""
+        rows = self.db.query(ReceiptModel.sha256).join(ExpenseModel).filter(*expense_conditions).distinct().all()
+        return {key for (key,) in rows}
+
+    def delete_unused_files(self, keys: Iterable[str]) -> None:
+        """Xóa file (và ảnh thu nhỏ) không còn hóa đơn nào tham chiếu (gọi sau khi commit)"""
+        keys = set(keys)
+        if not keys:
+            return
+        still_used = {
+            key for (key,) in self.db.query(ReceiptModel.sha256).filter(ReceiptModel.sha256.in_(keys)).distinct().all()
+        }
+        for key in keys - still_used:
+            self.store.delete(key)
+            self.store.delete(thumbnail_key(key))
+
+    def start_upload(self, trip_id: int, expense_id: int, content_type: str) -> None:
+        """Chuẩn bị phiên upload multipart cho một chi phí"""
+        expense_exists = self.db.query(ExpenseModel.id).filter(
+            ExpenseModel.id == expense_id,
+            ExpenseModel.trip_id == trip_id
+        ).first()
+        if not expense_exists:
+            raise ValueError("Chi phí không tồn tại trong chuyến đi này")
+
+        mime_type, params = parse_options_header(content_type or "")
+        if mime_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Yêu cầu upload phải ở dạng multipart/form-data")
+
+        self.expense_id = expense_id
+        self.max_size = settings.max_receipt_size_mb * 1024 * 1024
+        self._files: List[Dict] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        """Nhận thêm một phần dữ liệu của request"""
+        self._parser.write(chunk)
+
+    def finish(self) -> List[ReceiptModel]:
+        """Kết thúc upload, ghi các hóa đơn vào database"""
+        self._parser.finalize()
+        if self._writer is not None:
+            self.abort()
+            raise ValueError("Dữ liệu multipart không đầy đủ")
+        if not self._files:
+            raise ValueError("Không có file nào được tải lên")
+
+        # Cùng nội dung đã được đính kèm vào chi phí này thì dùng lại (một truy vấn cho cả lần upload)
+        receipts = {
+            receipt.sha256: receipt
+            for receipt in self.db.query(ReceiptModel).filter(
+                ReceiptModel.expense_id == self.expense_id,
+                ReceiptModel.sha256.in_({file["sha256"] for file in self._files})
+            )
+        }
+        for file in self._files:
+            if file["sha256"] in receipts:
+                continue
+            receipt = ReceiptModel(
+                expense_id=self.expense_id,
+                filename=file["filename"],
+                content_type=file["content_type"],
+                size=file["size"],
+                sha256=file["sha256"],
+                has_thumbnail=self.store.exists(thumbnail_key(file["sha256"]))
+            )
+            self.db.add(receipt)
+            receipts[file["sha256"]] = receipt
+
+        self.db.commit()
+        return list(receipts.values())
+
+    def abort(self) -> None:
+        """Hủy upload: rollback, xóa file đang ghi dở và các file đã ghi xong mà không hóa đơn nào dùng"""
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+        self.db.rollback()
+        files, self._files = self._files, []
+        self.delete_unused_files(file["sha256"] for file in files)
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = disposition.get(b"filename")
+        if filename is None:
+            return  # Trường form thường, bỏ qua
+
+        content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1").strip().lower()
+        if content_type not in ALLOWED_CONTENT_TYPES:
+            raise ValueError(f"Định dạng file không hỗ trợ: {content_type}")
+        if len(self._files) >= self.MAX_FILES_PER_UPLOAD:
+            raise ValueError(f"Chỉ được tải lên tối đa {self.MAX_FILES_PER_UPLOAD} file mỗi lần")
+
+        self._current = {
+            "filename": filename.decode("utf-8", errors="replace")[:255] or "receipt",
+            "content_type": content_type
+        }
+        self._writer = self.store.open_writer(self.max_size)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writer is not None:
+            self._writer.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._writer is None:
+            return
+        sha256, size = self._writer.commit()
+        self._writer = None
+        if size:
+            self._files.append({**self._current, "sha256": sha256, "size": size})
@@ -0,0 +1,109 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+import hashlib
+import os
+import tempfile
+from ..core.config import settings
+
+class ReceiptWriter(ABC):
+    """Ghi một file theo từng phần, tính sha256 trong lúc ghi"""
+
+    @abstractmethod
+    def write(self, chunk: bytes) -> None:
+        """Ghi thêm một phần nội dung"""
+
+    @abstractmethod
+    def commit(self) -> Tuple[str, int]:
+        """Hoàn tất file, trả về (sha256, kích thước); nội dung đã có sẵn thì không lưu thêm"""
+
+    @abstractmethod
+    def abort(self) -> None:
+        """Hủy file đang ghi"""
+
+class ReceiptStore(ABC):
+    """Nơi lưu file hóa đơn có thể thay thế; khóa lưu trữ là sha256 của nội dung"""
+
+    @abstractmethod
+    def open_writer(self, max_size: int) -> ReceiptWriter:
+        """Mở writer cho một file mới (tối đa max_size byte)"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """File với khóa này đã được lưu chưa"""
+
+    @abstractmethod
+    def path(self, key: str, create_dirs: bool = False) -> str:
+        """Đường dẫn cục bộ của file (dùng cho tạo ảnh thu nhỏ và tải xuống); create_dirs để chuẩn bị ghi"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Xóa file nếu có"""
+
+class _LocalDiskWriter(ReceiptWriter):
+    def __init__(self, store: "LocalDiskReceiptStore", max_size: int):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        os.makedirs(store.temp_dir, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=store.temp_dir)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise ValueError(f"File vượt quá dung lượng cho phép ({self.max_size // (1024 * 1024)} MB)")
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self) -> Tuple[str, int]:
+        self.file.close()
+        key = self.hasher.hexdigest()
+        target = self.store.path(key, create_dirs=True)
+        if os.path.exists(target):
+            os.remove(self.temp_path)
+        else:
+            os.replace(self.temp_path, target)
+        return key, self.size
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+class LocalDiskReceiptStore(ReceiptStore):
+    """Lưu file trên đĩa cục bộ: <root>/<2 ký tự đầu của khóa>/<khóa>"""
+
+    def __init__(self, root: str):
+        # Thư mục chỉ được tạo khi ghi file đầu tiên (hệ thống file chỉ đọc vẫn đọc/liệt kê được)
+        self.root = os.path.abspath(root)
+        self.temp_dir = os.path.join(self.root, "tmp")
+
+    def open_writer(self, max_size: int) -> ReceiptWriter:
+        return _LocalDiskWriter(self, max_size)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def path(self, key: str, create_dirs: bool = False) -> str:
+        directory = os.path.join(self.root, key[:2])
+        if create_dirs:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, key)
+
+    def delete(self, key: str) -> None:
+        if self.exists(key):
+            os.remove(self.path(key))
+
+_store: Optional[ReceiptStore] = None
+
+def set_receipt_store(store: Optional[ReceiptStore]) -> None:
+    """Thay nơi lưu hóa đơn mặc định"""
+    global _store
+    _store = store
+
+def get_receipt_store() -> ReceiptStore:
+    global _store
+    if _store is None:
+        _store = LocalDiskReceiptStore(settings.receipts_dir)
+    return _store
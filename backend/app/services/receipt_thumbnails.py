@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import logging
+import os
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.models import Receipt as ReceiptModel
+from .receipt_store import get_receipt_store
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow là tùy chọn, thiếu thì bỏ qua ảnh thu nhỏ
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def thumbnail_key(key: str) -> str:
+    return f"{key}.thumb"
+
+def get_thumbnail_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.thumbnail_workers)
+    return _executor
+
+def render_thumbnail(source_path: str, target_path: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> bool:
+    """Tạo ảnh thu nhỏ JPEG (chạy trong process riêng, không chiếm CPU của request)"""
+    if Image is None:
+        return False
+    temp_path = f"{target_path}.{os.getpid()}.tmp"
+    with Image.open(source_path) as image:
+        image.thumbnail(size)
+        image.convert("RGB").save(temp_path, "JPEG", quality=80)
+    os.replace(temp_path, target_path)
+    return True
+
+def generate_thumbnails(receipt_ids: List[int]) -> None:
+    """Tác vụ nền sau khi upload: tạo ảnh thu nhỏ cho các hóa đơn dạng ảnh
+
+    Hàm đồng bộ nên Starlette chạy trong threadpool: truy vấn DB và chờ process pool không chặn event loop.
+    """
+    if Image is None or not receipt_ids:
+        return
+
+    store = get_receipt_store()
+    with SessionLocal() as db:
+        receipts = db.query(ReceiptModel).filter(
+            ReceiptModel.id.in_(receipt_ids),
+            ReceiptModel.content_type.in_(THUMBNAIL_CONTENT_TYPES)
+        ).all()
+
+        for receipt in receipts:
+            key = thumbnail_key(receipt.sha256)
+            try:
+                # Nội dung trùng đã có ảnh thu nhỏ thì dùng lại
+                if not store.exists(key):
+                    created = get_thumbnail_executor().submit(
+                        render_thumbnail,
+                        store.path(receipt.sha256),
+                        store.path(key, create_dirs=True)
+                    ).result()
+                    if not created:
+                        continue
+                receipt.has_thumbnail = True
+            except Exception as e:
+                logger.warning(f"Không tạo được ảnh thu nhỏ cho hóa đơn {receipt.id}: {e}")
+        db.commit()
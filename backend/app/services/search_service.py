@@ -0,0 +1,80 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.mysql import match
+from typing import List
+from ..models.models import Trip as TripModel, Activity as ActivityModel
+from ..schemas.schemas import SearchHit, SearchResults
+
+class SearchService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def search(self, q: str, skip: int = 0, limit: int = 20) -> SearchResults:
+        """Tìm kiếm chuyến đi và hoạt động theo từ khóa (xếp hạng theo độ liên quan)"""
+        query_text = q.strip()
+        if not query_text:
+            raise ValueError("Từ khóa tìm kiếm không được để trống")
+
+        # Mỗi nguồn chỉ cần lấy tối đa skip + limit kết quả tốt nhất, sau đó trộn theo điểm
+        window = skip + limit
+        hits = self._search_trips(query_text, window) + self._search_activities(query_text, window)
+        hits.sort(key=lambda hit: hit.score, reverse=True)
+
+        return SearchResults(
+            query=query_text,
+            skip=skip,
+            limit=limit,
+            items=hits[skip:window]
+        )
+
+    def _search_trips(self, q: str, limit: int) -> List[SearchHit]:
+        """Tìm chuyến đi qua FULLTEXT index (name, destination, description)"""
+        score = match(
+            TripModel.name, TripModel.destination, TripModel.description,
+            against=q
+        ).in_natural_language_mode()
+
+        rows = self.db.query(
+            TripModel.id,
+            TripModel.name,
+            TripModel.destination,
+            score.label('score')
+        ).filter(score).order_by(score.desc()).limit(limit).all()
+
+        return [
+            SearchHit(
+                kind='trip',
+                id=trip_id,
+                trip_id=trip_id,
+                title=name,
+                subtitle=destination,
+                score=float(row_score)
+            )
+            for trip_id, name, destination, row_score in rows
+        ]
+
+    def _search_activities(self, q: str, limit: int) -> List[SearchHit]:
+        """Tìm hoạt động qua FULLTEXT index (name, location)"""
+        score = match(
+            ActivityModel.name, ActivityModel.location,
+            against=q
+        ).in_natural_language_mode()
+
+        rows = self.db.query(
+            ActivityModel.id,
+            ActivityModel.trip_id,
+            ActivityModel.name,
+            ActivityModel.location,
+            score.label('score')
+        ).filter(score).order_by(score.desc()).limit(limit).all()
+
+        return [
+            SearchHit(
+                kind='activity',
+                id=activity_id,
+                trip_id=trip_id,
+                title=name,
+                subtitle=location,
+                score=float(row_score)
+            )
+            for activity_id, trip_id, name, location, row_score in rows
+        ]
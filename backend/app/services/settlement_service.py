@@ -5,9 +5,10 @@ from decimal import Decimal, ROUND_HALF_UP
 from ..models.models import (
     Trip as TripModel,
     TripMember as TripMemberModel,
-    Expense as ExpenseModel
+    ExpenseDailyRollup as ExpenseDailyRollupModel
 )
 from ..schemas.schemas import TripSummary, MemberBalance, Settlement
+from .expense_service import ExpenseService
 
 class SettlementService:
     def __init__(self, db: Session):
@@ -20,8 +21,10 @@ class SettlementService:
         if not trip:
             raise ValueError("Chuyến đi không tồn tại")
         
-        # Lấy danh sách thành viên
-        members = self.db.query(TripMemberModel).filter(TripMemberModel.trip_id == trip_id).all()
+        # Lấy danh sách thành viên trực tiếp từ DB (hệ số phải luôn mới nhất khi quyết toán)
+        members = self.db.query(
+            TripMemberModel.id, TripMemberModel.name, TripMemberModel.factor
+        ).filter(TripMemberModel.trip_id == trip_id).all()
         if not members:
             raise ValueError("Chuyến đi chưa có thành viên")
         
@@ -35,9 +38,10 @@ class SettlementService:
         # Tính cách giải quyết nợ
         settlements = self._calculate_settlements(member_balances, trip.rounding_rule)
         
-        # Thống kê chi phí theo danh mục và ngày
-        expense_by_category = self._get_expense_by_category(trip_id)
-        expense_by_date = self._get_expense_by_date(trip_id)
+        # Thống kê chi phí chung theo danh mục và ngày (đọc từ bảng tổng hợp qua ExpenseService)
+        expense_summary = ExpenseService(self.db).get_expense_summary(trip_id)
+        expense_by_category = expense_summary['by_category']
+        expense_by_date = expense_summary['by_date']
         
         return TripSummary(
             trip=trip,
@@ -52,18 +56,18 @@ class SettlementService:
     def _calculate_total_expenses(self, trip_id: int) -> Decimal:
         """Tính tổng chi phí của chuyến đi"""
         result = self.db.query(
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate)
-        ).filter(ExpenseModel.trip_id == trip_id).scalar()
+            func.sum(ExpenseDailyRollupModel.total)
+        ).filter(ExpenseDailyRollupModel.trip_id == trip_id).scalar()
         
         return Decimal(str(result)) if result else Decimal('0')
     
     def _calculate_total_shared_expenses(self, trip_id: int) -> Decimal:
         """Tính tổng chi phí chung của chuyến đi"""
         result = self.db.query(
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate)
+            func.sum(ExpenseDailyRollupModel.total)
         ).filter(
-            ExpenseModel.trip_id == trip_id,
-            ExpenseModel.is_shared == True
+            ExpenseDailyRollupModel.trip_id == trip_id,
+            ExpenseDailyRollupModel.is_shared == True
         ).scalar()
         
         return Decimal(str(result)) if result else Decimal('0')
@@ -86,18 +90,20 @@ class SettlementService:
         # Tính chi phí trên một đơn vị (Cost Per Factor)
         cost_per_factor = total_shared_expenses / total_factor if total_factor > 0 else Decimal('0')
         
+        # Tổng tiền chi phí chung mỗi thành viên đã trả (một truy vấn trên bảng tổng hợp)
+        paid_by_member = dict(self.db.query(
+            ExpenseDailyRollupModel.paid_by,
+            func.sum(ExpenseDailyRollupModel.total)
+        ).filter(
+            ExpenseDailyRollupModel.trip_id == trip_id,
+            ExpenseDailyRollupModel.is_shared == True
+        ).group_by(ExpenseDailyRollupModel.paid_by).all())
+        
         member_balances = []
         
         for member in members:
             # Tính số tiền đã trả
-            total_paid_result = self.db.query(
-                func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate)
-            ).filter(
-                ExpenseModel.trip_id == trip_id,
-                ExpenseModel.paid_by == member.id,
-                ExpenseModel.is_shared == True
-            ).scalar()
-            
+            total_paid_result = paid_by_member.get(member.id)
             total_paid = Decimal(str(total_paid_result)) if total_paid_result else Decimal('0')
             
             # Tính số tiền phải trả (Member Owes)
@@ -176,30 +182,6 @@ class SettlementService:
         rounded = (amount / rounding_rule).quantize(Decimal('1'), rounding=ROUND_HALF_UP) * rounding_rule
         return rounded
     
-    def _get_expense_by_category(self, trip_id: int) -> Dict[str, float]:
-        """Lấy chi phí theo danh mục"""
-        result = self.db.query(
-            ExpenseModel.category,
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate).label('total')
-        ).filter(
-            ExpenseModel.trip_id == trip_id,
-            ExpenseModel.is_shared == True
-        ).group_by(ExpenseModel.category).all()
-        
-        return {str(category): float(total) for category, total in result}
-    
-    def _get_expense_by_date(self, trip_id: int) -> Dict[str, float]:
-        """Lấy chi phí theo ngày"""
-        result = self.db.query(
-            func.date(ExpenseModel.date).label('date'),
-            func.sum(ExpenseModel.amount * ExpenseModel.exchange_rate).label('total')
-        ).filter(
-            ExpenseModel.trip_id == trip_id,
-            ExpenseModel.is_shared == True
-        ).group_by(func.date(ExpenseModel.date)).all()
-        
-        return {str(date): float(total) for date, total in result}
-    
     def get_member_debt_summary(self, trip_id: int, member_id: int) -> Dict:
         """Lấy tóm tắt nợ của một thành viên cụ thể"""
         trip_summary = self.calculate_trip_summary(trip_id)
@@ -1,8 +1,19 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func, select
 from typing import List, Optional
-from ..models.models import Trip as TripModel, TripMember as TripMemberModel
-from ..schemas.schemas import TripCreate, TripUpdate
+from decimal import Decimal
+from ..models.models import (
+    Trip as TripModel,
+    TripMember as TripMemberModel,
+    Activity as ActivityModel,
+    Expense as ExpenseModel,
+    ExpenseDailyRollup as ExpenseDailyRollupModel
+)
+from ..schemas.schemas import TripCreate, TripUpdate, TripOverview, TripOverviewPage
 from datetime import datetime
+from ..core.database import commit_keep_loaded, update_returning
+from .member_directory import invalidate_member_directory
+from .receipt_service import ReceiptService
 
 class TripService:
     def __init__(self, db: Session):
@@ -23,14 +34,73 @@ class TripService:
         )
         
         self.db.add(db_trip)
-        self.db.commit()
-        self.db.refresh(db_trip)
+        commit_keep_loaded(self.db)
         return db_trip
     
     def get_trips(self, skip: int = 0, limit: int = 100) -> List[TripModel]:
         """Lấy danh sách chuyến đi"""
         return self.db.query(TripModel).offset(skip).limit(limit).all()
     
+    def get_trips_overview(self, cursor: Optional[int] = None, limit: int = 20) -> TripOverviewPage:
+        """Lấy một trang chuyến đi kèm thống kê (phân trang theo cursor, mới nhất trước)"""
+        # Subquery tương quan theo trip_id: mỗi thống kê dùng index trip_id và chỉ tính cho các chuyến đi trong trang
+        member_count = select(func.count(TripMemberModel.id)).where(
+            TripMemberModel.trip_id == TripModel.id
+        ).correlate(TripModel).scalar_subquery()
+        activity_count = select(func.count(ActivityModel.id)).where(
+            ActivityModel.trip_id == TripModel.id
+        ).correlate(TripModel).scalar_subquery()
+        # Số lượng và tổng chi phí đọc từ bảng tổng hợp theo ngày thay vì quét expenses
+        expense_count = select(
+            func.coalesce(func.sum(ExpenseDailyRollupModel.expense_count), 0)
+        ).where(
+            ExpenseDailyRollupModel.trip_id == TripModel.id
+        ).correlate(TripModel).scalar_subquery()
+        total_expenses = select(
+            func.coalesce(func.sum(ExpenseDailyRollupModel.total), 0)
+        ).where(
+            ExpenseDailyRollupModel.trip_id == TripModel.id
+        ).correlate(TripModel).scalar_subquery()
+        total_shared_expenses = select(
+            func.coalesce(func.sum(ExpenseDailyRollupModel.total), 0)
+        ).where(
+            ExpenseDailyRollupModel.trip_id == TripModel.id,
+            ExpenseDailyRollupModel.is_shared == True
+        ).correlate(TripModel).scalar_subquery()
+        
+        query = self.db.query(
+            TripModel,
+            member_count.label('member_count'),
+            activity_count.label('activity_count'),
+            expense_count.label('expense_count'),
+            total_expenses.label('total_expenses'),
+            total_shared_expenses.label('total_shared_expenses')
+        )
+        if cursor is not None:
+            query = query.filter(TripModel.id < cursor)
+        
+        # Lấy dư một dòng để biết còn trang tiếp theo hay không
+        rows = query.order_by(TripModel.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        items = [
+            TripOverview(
+                trip=trip,
+                member_count=members or 0,
+                activity_count=activities or 0,
+                expense_count=expenses or 0,
+                total_expenses=Decimal(str(total)),
+                total_shared_expenses=Decimal(str(shared_total))
+            )
+            for trip, members, activities, expenses, total, shared_total in rows
+        ]
+        
+        return TripOverviewPage(
+            items=items,
+            next_cursor=rows[-1][0].id if has_more else None
+        )
+    
     def get_trip(self, trip_id: int) -> Optional[TripModel]:
         """Lấy thông tin chuyến đi theo ID"""
         return self.db.query(TripModel).filter(TripModel.id == trip_id).first()
@@ -41,29 +111,21 @@ class TripService:
     
     def update_trip(self, trip_id: int, trip_update: TripUpdate) -> Optional[TripModel]:
         """Cập nhật thông tin chuyến đi"""
-        db_trip = self.get_trip(trip_id)
+        update_data = trip_update.dict(exclude_unset=True)
+        db_trip = update_returning(self.db, TripModel, update_data, TripModel.id == trip_id)
         if not db_trip:
+            self.db.rollback()
             return None
-        
-        update_data = trip_update.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_trip, field, value)
-        
-        db_trip.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(db_trip)
+        commit_keep_loaded(self.db)
         return db_trip
     
     def update_invite_code(self, trip_id: int, invite_code: str) -> Optional[TripModel]:
         """Cập nhật mã mời"""
-        db_trip = self.get_trip(trip_id)
+        db_trip = update_returning(self.db, TripModel, {"invite_code": invite_code}, TripModel.id == trip_id)
         if not db_trip:
+            self.db.rollback()
             return None
-        
-        db_trip.invite_code = invite_code
-        db_trip.updated_at = datetime.utcnow()
-        self.db.commit()
-        self.db.refresh(db_trip)
+        commit_keep_loaded(self.db)
         return db_trip
     
     def delete_trip(self, trip_id: int) -> bool:
@@ -72,8 +134,12 @@ class TripService:
         if not db_trip:
             return False
         
+        receipt_service = ReceiptService(self.db)
+        receipt_keys = receipt_service.collect_receipt_keys(ExpenseModel.trip_id == trip_id)
         self.db.delete(db_trip)
         self.db.commit()
+        invalidate_member_directory(self.db, trip_id)
+        receipt_service.delete_unused_files(receipt_keys)
         return True
     
     def validate_trip_dates(self, start_date: datetime, end_date: datetime) -> bool:
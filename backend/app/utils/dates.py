@@ -0,0 +1,7 @@
+from typing import Optional, Tuple
+from datetime import date, datetime, time, timedelta
+
+def day_range(first: date, last: Optional[date] = None) -> Tuple[datetime, datetime]:
+    """Khoảng nửa mở [đầu ngày first, đầu ngày sau last) để so sánh trực tiếp trên cột datetime (dùng được index)"""
+    last = last or first
+    return datetime.combine(first, time.min), datetime.combine(last + timedelta(days=1), time.min)
@@ -0,0 +1,140 @@
+from typing import List, Optional, Sequence, Tuple
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn, thiếu thì tính bằng vòng lặp Python
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32  # Độ dài một độ vĩ (và một độ kinh ở xích đạo)
+
+GEOHASH_PRECISION = 9  # Ô ~4.8m x 4.8m, đủ để lọc tiền tố ở mọi bán kính
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Khoảng cách giữa 2 điểm theo công thức Haversine (km)"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Mã hóa tọa độ thành geohash: các điểm gần nhau có chung tiền tố"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Bit chẵn chia kinh độ, bit lẻ chia vĩ độ
+
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """Kích thước ô geohash (độ vĩ, độ kinh) ở độ chính xác cho trước"""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lon_bits
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+def covering_geohashes(latitude: float, longitude: float, radius_km: float) -> Optional[List[str]]:
+    """Các tiền tố geohash (ô chứa tâm và 8 ô lân cận) phủ kín vòng tròn bán kính radius_km
+
+    Trả về None khi bán kính lớn hơn cả ô độ chính xác 1 (không lọc được theo tiền tố).
+    """
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_span, lon_span = geohash_cell_size(candidate)
+        # Ô phải lớn hơn bán kính theo cả hai chiều thì 3x3 ô mới phủ hết vòng tròn
+        if lat_span * KM_PER_DEGREE < radius_km or lon_span * KM_PER_DEGREE * cos_lat < radius_km:
+            break
+        precision = candidate
+    if precision == 0:
+        return None
+
+    lat_span, lon_span = geohash_cell_size(precision)
+    cells = set()
+    for dlat in (-lat_span, 0.0, lat_span):
+        for dlon in (-lon_span, 0.0, lon_span):
+            lat = min(max(latitude + dlat, -90.0), 90.0)
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(lat, lon, precision))
+    return sorted(cells)
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """Hình chữ nhật (min_lat, max_lat, min_lon, max_lon) bao vòng tròn bán kính radius_km
+
+    min_lon/max_lon là None khi hình chữ nhật vượt qua kinh tuyến 180 hoặc chứa cực.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    min_lat = latitude - delta_lat
+    max_lat = latitude + delta_lat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+
+    delta_lon = radius_km / (KM_PER_DEGREE * math.cos(math.radians(latitude)))
+    min_lon = longitude - delta_lon
+    max_lon = longitude + delta_lon
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, min_lon, max_lon
+
+def distance_matrix_km(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    decimals: int = 3,
+    as_array: bool = False
+):
+    """Ma trận khoảng cách Haversine (km) giữa mọi cặp điểm, tính theo mảng nếu có NumPy
+
+    as_array=True trả về mảng float32 của NumPy (gọn cho cache); không có NumPy thì vẫn là list lồng nhau.
+    """
+    n = len(latitudes)
+    if n == 0:
+        return np.zeros((0, 0), dtype=np.float32) if as_array and np is not None else []
+
+    if np is not None:
+        lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+        lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+        sin_dlat = np.sin((lat[:, None] - lat[None, :]) / 2)
+        sin_dlon = np.sin((lon[:, None] - lon[None, :]) / 2)
+        cos_lat = np.cos(lat)
+        a = sin_dlat ** 2 + np.outer(cos_lat, cos_lat) * sin_dlon ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        if as_array:
+            return distances.astype(np.float32)
+        return np.round(distances, decimals).tolist()
+
+    # Không có NumPy: tính trước sin/cos của từng điểm, chỉ tính nửa ma trận (đối xứng)
+    lat = [math.radians(value) for value in latitudes]
+    lon = [math.radians(value) for value in longitudes]
+    cos_lat = [math.cos(value) for value in lat]
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        row = matrix[i]
+        for j in range(i + 1, n):
+            a = (math.sin((lat[j] - lat[i]) / 2) ** 2 +
+                 cos_lat[i] * cos_lat[j] * math.sin((lon[j] - lon[i]) / 2) ** 2)
+            distance = round(2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a))), decimals)
+            row[j] = distance
+            matrix[j][i] = distance
+    return matrix
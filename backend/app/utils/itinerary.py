@@ -0,0 +1,132 @@
+from typing import List, Optional, Sequence
+import time
+
+# Tối ưu thứ tự các điểm trong một ngày (đường đi mở, không quay về điểm đầu).
+# Ràng buộc: các hoạt động cố định giữ nguyên thứ tự tương đối với nhau; nếu keep_start thì điểm đầu giữ nguyên.
+
+def route_length(order: Sequence[int], matrix: Sequence[Sequence[float]]) -> float:
+    """Tổng quãng đường đi qua các điểm theo thứ tự cho trước"""
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+def optimize_route(
+    matrix: Sequence[Sequence[float]],
+    fixed: Sequence[bool],
+    keep_start: bool = True,
+    time_budget: float = 0.2
+) -> List[int]:
+    """Nearest neighbour rồi cải thiện bằng 2-opt / Or-opt đến khi hết thời gian; không bao giờ tệ hơn thứ tự ban đầu"""
+    n = len(matrix)
+    original = list(range(n))
+    if n < 3:
+        return original
+
+    deadline = time.monotonic() + time_budget
+    order = _nearest_neighbour(matrix, fixed, keep_start, deadline)
+    first = 1 if keep_start else 0
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = _two_opt(order, matrix, fixed, first, deadline)
+        improved = _or_opt(order, matrix, fixed, first, deadline) or improved
+
+    if route_length(order, matrix) < route_length(original, matrix) - 1e-9:
+        return order
+    return original
+
+def _nearest_neighbour(matrix, fixed, keep_start: bool, deadline: float) -> List[int]:
+    n = len(matrix)
+    fixed_positions = [i for i in range(n) if fixed[i]]
+    starts = [0] if keep_start else [i for i in range(n) if not fixed[i]] + fixed_positions[:1]
+
+    best: Optional[List[int]] = None
+    best_length = float("inf")
+    for start in starts:
+        order = _greedy_from(matrix, fixed, fixed_positions, start)
+        length = route_length(order, matrix)
+        if length < best_length:
+            best, best_length = order, length
+        if time.monotonic() >= deadline:
+            break
+    return best
+
+def _greedy_from(matrix, fixed, fixed_positions: List[int], start: int) -> List[int]:
+    """Luôn đi tới điểm gần nhất trong số các điểm tự do và điểm cố định kế tiếp"""
+    n = len(matrix)
+    order = [start]
+    free = {i for i in range(n) if not fixed[i] and i != start}
+    pending_fixed = [i for i in fixed_positions if i != start]
+
+    while free or pending_fixed:
+        current = order[-1]
+        candidates = list(free)
+        if pending_fixed:
+            candidates.append(pending_fixed[0])
+        nxt = min(candidates, key=lambda i: matrix[current][i])
+        if pending_fixed and nxt == pending_fixed[0]:
+            pending_fixed.pop(0)
+        else:
+            free.discard(nxt)
+        order.append(nxt)
+    return order
+
+def _edge(matrix, a: Optional[int], b: Optional[int]) -> float:
+    return 0.0 if a is None or b is None else matrix[a][b]
+
+def _two_opt(order: List[int], matrix, fixed, first: int, deadline: float) -> bool:
+    """Đảo ngược một đoạn nếu làm ngắn quãng đường (đoạn chứa tối đa một điểm cố định)"""
+    n = len(order)
+    improved = False
+    for i in range(first, n - 1):
+        if time.monotonic() >= deadline:
+            break
+        prev = order[i - 1] if i > 0 else None
+        fixed_in_segment = 1 if fixed[order[i]] else 0
+        for j in range(i + 1, n):
+            fixed_in_segment += 1 if fixed[order[j]] else 0
+            if fixed_in_segment > 1:
+                break
+            nxt = order[j + 1] if j + 1 < n else None
+            delta = (_edge(matrix, prev, order[j]) + _edge(matrix, order[i], nxt)
+                     - _edge(matrix, prev, order[i]) - _edge(matrix, order[j], nxt))
+            if delta < -1e-9:
+                order[i:j + 1] = reversed(order[i:j + 1])
+                improved = True
+    return improved
+
+def _or_opt(order: List[int], matrix, fixed, first: int, deadline: float) -> bool:
+    """Chuyển một chuỗi 1-3 điểm tự do sang vị trí khác (giữ chiều hoặc đảo chiều)"""
+    improved = False
+    for length in (1, 2, 3):
+        i = first
+        while i + length <= len(order):
+            if time.monotonic() >= deadline:
+                return improved
+            chain = order[i:i + length]
+            if any(fixed[point] for point in chain):
+                i += 1
+                continue
+
+            prev = order[i - 1] if i > 0 else None
+            nxt = order[i + length] if i + length < len(order) else None
+            removal_gain = (_edge(matrix, prev, chain[0]) + _edge(matrix, chain[-1], nxt)
+                            - _edge(matrix, prev, nxt))
+            rest = order[:i] + order[i + length:]
+
+            best = None
+            for k in range(max(first, 0), len(rest) + 1):
+                if k == i:
+                    continue  # Vị trí cũ
+                before = rest[k - 1] if k > 0 else None
+                after = rest[k] if k < len(rest) else None
+                for candidate in (chain, chain[::-1]):
+                    cost = (_edge(matrix, before, candidate[0]) + _edge(matrix, candidate[-1], after)
+                            - _edge(matrix, before, after))
+                    if cost - removal_gain < -1e-9 and (best is None or cost < best[0]):
+                        best = (cost, k, candidate)
+
+            if best is not None:
+                _, k, candidate = best
+                order[:] = rest[:k] + list(candidate) + rest[k:]
+                improved = True
+            i += 1
+    return improved
@@ -14,7 +14,7 @@ load_dotenv('.env.local')
 from sqlalchemy import create_engine, text
 from app.core.config import settings
 from app.core.database import Base, ca_cert_path
-from app.models.models import Trip, TripMember, Activity, Expense, ExpenseCategory
+from app.models.models import Trip, TripMember, Activity, Expense, ExpenseCategory, ExchangeRate, ExpenseDailyRollup
 
 def create_database_tables():
     """Tạo tất cả database tables"""
@@ -97,12 +97,145 @@ def check_database_status():
         print(f"❌ Lỗi khi kiểm tra database: {e}")
         return False
 
+def backfill_derived_columns():
+    """Tính lại các cột dẫn xuất còn thiếu (expenses.base_amount)"""
+    try:
+        from app.core.database import SessionLocal
+        
+        print("🔁 Đang backfill expenses.base_amount...")
+        db = SessionLocal()
+        try:
+            result = db.execute(text(
+                "UPDATE expenses SET base_amount = ROUND(amount * exchange_rate, 2) WHERE base_amount IS NULL"
+            ))
+            db.commit()
+        finally:
+            db.close()
+        print(f"✅ Đã cập nhật {result.rowcount} chi phí")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi backfill: {e}")
+        return False
+
+def rebuild_expense_rollups(trip_id=None, check_only=False):
+    """Đối chiếu bảng tổng hợp chi phí theo ngày với bảng expenses (tổng tiền, số chi phí) và dựng lại chuyến đi bị lệch"""
+    try:
+        from app.core.database import SessionLocal
+        from app.services.expense_rollup_service import ExpenseRollupService
+        
+        target = f"chuyến đi {trip_id}" if trip_id else "tất cả chuyến đi"
+        print(f"📊 Đang đối chiếu bảng tổng hợp chi phí cho {target}...")
+        db = SessionLocal()
+        try:
+            rollup_service = ExpenseRollupService(db)
+            drifted = rollup_service.find_drift(trip_id)
+            if not drifted:
+                print("✅ Bảng tổng hợp khớp với dữ liệu chi phí")
+                return True
+            
+            print(f"⚠️ Bảng tổng hợp lệch ở {len(drifted)} chuyến đi: {', '.join(map(str, drifted))}")
+            if check_only:
+                return False
+            
+            for drifted_trip_id in drifted:
+                rollup_service.rebuild(drifted_trip_id)
+            db.commit()
+            
+            remaining = rollup_service.find_drift(trip_id)
+        finally:
+            db.close()
+        
+        if remaining:
+            print(f"❌ Vẫn lệch sau khi dựng lại: {', '.join(map(str, remaining))}")
+            return False
+        print("✅ Dựng lại bảng tổng hợp thành công")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi dựng lại bảng tổng hợp: {e}")
+        return False
+
+def load_exchange_rates(path: str):
+    """Nạp tỷ giá từ file CSV (date,currency,rate) vào bảng exchange_rates"""
+    try:
+        from app.core.database import SessionLocal
+        from app.services.exchange_rate_service import ExchangeRateService, FileExchangeRateProvider
+        
+        print(f"💱 Đang nạp tỷ giá từ {path}...")
+        rows = FileExchangeRateProvider(path).read_rows()
+        db = SessionLocal()
+        try:
+            count = ExchangeRateService(db).load_rates(rows)
+        finally:
+            db.close()
+        print(f"✅ Đã nạp {count} tỷ giá")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi nạp tỷ giá: {e}")
+        return False
+
+def backfill_activity_geohashes():
+    """Tính geohash cho các hoạt động có tọa độ nhưng chưa có geohash"""
+    try:
+        from app.core.database import SessionLocal
+        from app.services.activity_service import ActivityService
+        
+        print("🗺️ Đang backfill activities.geohash...")
+        db = SessionLocal()
+        try:
+            count = ActivityService(db).backfill_geohashes()
+        finally:
+            db.close()
+        print(f"✅ Đã cập nhật {count} hoạt động")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi backfill geohash: {e}")
+        return False
+
+def geocode_activity_locations(trip_id=None):
+    """Điền tọa độ cho các hoạt động có địa điểm nhưng chưa có tọa độ"""
+    try:
+        from app.core.database import SessionLocal
+        from app.services.geocoding_service import GeocodingService, get_geocoding_provider
+        
+        if get_geocoding_provider() is None:
+            print("❌ Chưa cấu hình nguồn tra cứu (GOOGLE_MAPS_API_KEY hoặc GAZETTEER_FILE)")
+            return False
+        
+        print("📍 Đang tra tọa độ cho activities.location...")
+        db = SessionLocal()
+        try:
+            count = GeocodingService(db).geocode_activities(trip_id=trip_id)
+        finally:
+            db.close()
+        print(f"✅ Đã cập nhật {count} hoạt động")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lỗi khi tra tọa độ: {e}")
+        return False
+
 if __name__ == "__main__":
     print("🚀 TripEasy Database Setup")
     print("=" * 50)
     
     if len(sys.argv) > 1 and sys.argv[1] == "check":
         success = check_database_status()
+    elif len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        success = backfill_derived_columns()
+    elif len(sys.argv) > 1 and sys.argv[1] == "geohash":
+        success = backfill_activity_geohashes()
+    elif len(sys.argv) > 1 and sys.argv[1] == "geocode":
+        success = geocode_activity_locations(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif len(sys.argv) > 2 and sys.argv[1] == "rollups" and sys.argv[2] == "check":
+        success = rebuild_expense_rollups(int(sys.argv[3]) if len(sys.argv) > 3 else None, check_only=True)
+    elif len(sys.argv) > 1 and sys.argv[1] == "rollups":
+        success = rebuild_expense_rollups(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif len(sys.argv) > 2 and sys.argv[1] == "rates":
+        success = load_exchange_rates(sys.argv[2])
     else:
         success = create_database_tables()
     
@@ -0,0 +1,5 @@
+import os
+
+# Settings bắt buộc các biến này khi import app; engine mặc định không kết nối cho tới khi được dùng
+for name in ("DATABASE_HOST", "DATABASE_USER", "DATABASE_PASSWORD", "SECRET_KEY"):
+    os.environ.setdefault(name, "unused")
@@ -0,0 +1,128 @@
+"""Serializer viết tay trong app/schemas/serializers.py phải cho ra đúng JSON mà schema Pydantic tương ứng xuất ra
+
+Các route danh sách trả FastJSONResponse trực tiếp nên response_model không còn được kiểm tra lúc chạy.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from app.core.responses import dumps
+from app.models.models import Trip, TripMember, Activity, Expense, CurrencyEnum, ExpenseCategoryEnum
+from app.schemas import schemas
+from app.schemas.serializers import (
+    serialize_trip,
+    serialize_member,
+    serialize_activity,
+    serialize_activity_with_costs,
+    serialize_expense,
+    serialize_expenses,
+    serialize_trip_details
+)
+from app.services.member_directory import MemberEntry
+
+CREATED_AT = datetime(2025, 9, 20, 8, 30, 15, 123456)
+
+def _as_json(data):
+    """JSON mà client nhận được từ FastJSONResponse"""
+    return json.loads(dumps(data))
+
+def _schema_json(schema, obj):
+    return schema.model_validate(obj).model_dump(mode="json")
+
+def _trip():
+    trip = Trip(
+        id=7,
+        name="Đà Lạt",
+        description=None,
+        destination="Lâm Đồng",
+        start_date=datetime(2025, 10, 1),
+        end_date=datetime(2025, 10, 5, 23, 59),
+        currency=CurrencyEnum.VND,
+        child_factor=Decimal("0.50"),
+        rounding_rule=1000,
+        invite_code="ABC123",
+        created_at=CREATED_AT,
+        updated_at=CREATED_AT
+    )
+    an = TripMember(id=1, trip_id=7, name="An", email="an@example.com", factor=Decimal("1.00"), is_admin=True, created_at=CREATED_AT)
+    binh = TripMember(id=2, trip_id=7, name="Bình", email=None, factor=Decimal("0.50"), is_admin=False, created_at=CREATED_AT)
+    activity = Activity(
+        id=3,
+        trip_id=7,
+        name="Đồi chè",
+        description="Săn mây",
+        date=datetime(2025, 10, 2, 5, 0),
+        location="Cầu Đất",
+        latitude=Decimal("11.87654321"),
+        longitude=Decimal("108.55000000"),
+        created_at=CREATED_AT,
+        updated_at=CREATED_AT
+    )
+    no_location = Activity(
+        id=4, trip_id=7, name="Chợ đêm", description=None, date=datetime(2025, 10, 2, 19, 0),
+        location=None, latitude=None, longitude=None, created_at=CREATED_AT, updated_at=CREATED_AT
+    )
+    expenses = [
+        Expense(
+            id=10, trip_id=7, activity_id=3, paid_by=1, paid_by_member=an, description="Cà phê",
+            amount=Decimal("45000.00"), currency=CurrencyEnum.VND, exchange_rate=Decimal("1.00000000"),
+            base_amount=Decimal("45000.00"), category=ExpenseCategoryEnum.FOOD, is_shared=True,
+            date=datetime(2025, 10, 2, 6, 0), created_at=CREATED_AT, updated_at=CREATED_AT
+        ),
+        Expense(
+            id=11, trip_id=7, activity_id=None, paid_by=2, paid_by_member=binh, description="Taxi",
+            amount=Decimal("12.50"), currency=CurrencyEnum.USD, exchange_rate=Decimal("25350.12345678"),
+            base_amount=Decimal("316876.54"), category=ExpenseCategoryEnum.TRANSPORT, is_shared=False,
+            date=datetime(2025, 10, 3, 21, 15), created_at=CREATED_AT, updated_at=CREATED_AT
+        ),
+    ]
+    trip.members = [an, binh]
+    trip.activities = [activity, no_location]
+    trip.expenses = expenses
+    return trip
+
+def test_serialize_trip_matches_schema():
+    trip = _trip()
+    assert _as_json(serialize_trip(trip)) == _schema_json(schemas.Trip, trip)
+
+def test_serialize_member_matches_schema():
+    for member in _trip().members:
+        assert _as_json(serialize_member(member)) == _schema_json(schemas.TripMember, member)
+
+def test_serialize_member_directory_entry_matches_schema():
+    member = _trip().members[0]
+    entry = MemberEntry(**{field: getattr(member, field) for field in MemberEntry._fields})
+    assert _as_json(serialize_member(entry)) == _schema_json(schemas.TripMember, member)
+
+def test_serialize_activity_matches_schema():
+    for activity in _trip().activities:
+        assert _as_json(serialize_activity(activity)) == _schema_json(schemas.Activity, activity)
+
+def test_serialize_activity_with_costs_matches_schema():
+    costs = {
+        3: schemas.ActivityCosts(
+            expense_count=2,
+            total=Decimal("361876.54"),
+            shared_total=Decimal("45000.00"),
+            private_total=Decimal("316876.54"),
+            by_payer={1: Decimal("45000.00"), 2: Decimal("316876.54")}
+        )
+    }
+    for activity in _trip().activities:
+        expected = _schema_json(schemas.ActivityWithCosts, {
+            **_schema_json(schemas.Activity, activity),
+            "costs": costs.get(activity.id) or schemas.ActivityCosts()
+        })
+        assert _as_json(serialize_activity_with_costs(activity, costs)) == expected
+
+def test_serialize_expenses_matches_schema():
+    trip = _trip()
+    members = {member.id: serialize_member(member) for member in trip.members}
+    assert _as_json(serialize_expenses(trip.expenses, members)) == [
+        _schema_json(schemas.Expense, expense) for expense in trip.expenses
+    ]
+    # Không truyền sẵn thành viên: lấy từ quan hệ paid_by_member
+    assert _as_json(serialize_expense(trip.expenses[1], {})) == _schema_json(schemas.Expense, trip.expenses[1])
+
+def test_serialize_trip_details_matches_schema():
+    trip = _trip()
+    assert _as_json(serialize_trip_details(trip)) == _schema_json(schemas.TripWithDetails, trip)
@@ -20,7 +20,8 @@ CREATE TABLE trips (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_invite_code (invite_code),
-    INDEX idx_dates (start_date, end_date)
+    INDEX idx_dates (start_date, end_date),
+    FULLTEXT INDEX ft_trips_search (name, destination, description)
 );
 
 -- Bảng trip_members (Thành viên chuyến đi)
@@ -33,8 +34,6 @@ CREATE TABLE trip_members (
     is_admin BOOLEAN DEFAULT FALSE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE,
-    INDEX idx_trip_id (trip_id),
-    INDEX idx_email (email),
     UNIQUE KEY unique_name_per_trip (trip_id, name),
     UNIQUE KEY unique_email_per_trip (trip_id, email)
 );
@@ -49,11 +48,13 @@ CREATE TABLE activities (
     location VARCHAR(500),
     latitude DECIMAL(10,8),
     longitude DECIMAL(11,8),
+    geohash VARCHAR(12),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE,
-    INDEX idx_trip_date (trip_id, date),
-    INDEX idx_location (latitude, longitude)
+    INDEX idx_activities_trip_date (trip_id, date),
+    INDEX idx_activities_geohash (geohash),
+    FULLTEXT INDEX ft_activities_search (name, location)
 );
 
 -- Bảng expenses (Chi phí)
@@ -65,7 +66,8 @@ CREATE TABLE expenses (
     description VARCHAR(500) NOT NULL,
     amount DECIMAL(15,2) NOT NULL,
     currency ENUM('VND', 'USD', 'EUR', 'JPY', 'KRW', 'THB') NOT NULL,
-    exchange_rate DECIMAL(10,4) DEFAULT 1.0,
+    exchange_rate DECIMAL(18,8) DEFAULT 1.0,
+    base_amount DECIMAL(20,2),
     category ENUM('food', 'transport', 'accommodation', 'entertainment', 'shopping', 'other') DEFAULT 'other',
     is_shared BOOLEAN DEFAULT TRUE,
     date DATETIME NOT NULL,
@@ -74,10 +76,10 @@ CREATE TABLE expenses (
     FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE,
     FOREIGN KEY (activity_id) REFERENCES activities(id) ON DELETE SET NULL,
     FOREIGN KEY (paid_by) REFERENCES trip_members(id) ON DELETE CASCADE,
-    INDEX idx_trip_date (trip_id, date),
-    INDEX idx_paid_by (paid_by),
-    INDEX idx_category (category),
-    INDEX idx_shared (is_shared)
+    INDEX idx_expenses_trip_date (trip_id, date),
+    INDEX idx_expenses_trip_payer_shared (trip_id, paid_by, is_shared),
+    INDEX idx_expenses_trip_category (trip_id, category),
+    FULLTEXT INDEX ft_expenses_description (description)
 );
 
 -- Bảng expense_categories (Danh mục chi phí tùy chỉnh)
@@ -88,14 +90,63 @@ CREATE TABLE expense_categories (
     color VARCHAR(7) DEFAULT '#6B7280',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE,
-    INDEX idx_trip_id (trip_id),
     UNIQUE KEY unique_category_per_trip (trip_id, name)
 );
 
--- Tạo các indexes bổ sung để tối ưu performance
-CREATE INDEX idx_expenses_amount ON expenses(amount);
-CREATE INDEX idx_expenses_exchange_rate ON expenses(exchange_rate);
-CREATE INDEX idx_members_factor ON trip_members(factor);
+-- Bảng expense_daily_rollups (Tổng hợp chi phí theo ngày, cập nhật tăng dần khi ghi chi phí)
+CREATE TABLE expense_daily_rollups (
+    trip_id INT NOT NULL,
+    day DATE NOT NULL,
+    category ENUM('food', 'transport', 'accommodation', 'entertainment', 'shopping', 'other') NOT NULL,
+    paid_by INT NOT NULL,
+    is_shared BOOLEAN NOT NULL,
+    total DECIMAL(20,2) NOT NULL DEFAULT 0,
+    expense_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (trip_id, day, category, paid_by, is_shared),
+    FOREIGN KEY (trip_id) REFERENCES trips(id) ON DELETE CASCADE
+);
+
+-- Bảng exchange_rates (Tỷ giá theo ngày, rate = số đơn vị tiền tệ đổi được 1 USD)
+CREATE TABLE exchange_rates (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    currency ENUM('VND', 'USD', 'EUR', 'JPY', 'KRW', 'THB') NOT NULL,
+    rate_date DATE NOT NULL,
+    rate DECIMAL(20,10) NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY unique_currency_date (currency, rate_date)
+);
+
+-- Bảng receipts (Hóa đơn đính kèm chi phí, file lưu theo sha256 nên nội dung trùng chỉ lưu một lần)
+CREATE TABLE receipts (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    expense_id INT NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    content_type VARCHAR(100) NOT NULL,
+    size INT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    has_thumbnail BOOLEAN DEFAULT FALSE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (expense_id) REFERENCES expenses(id) ON DELETE CASCADE,
+    UNIQUE KEY unique_receipt_per_expense (expense_id, sha256),
+    INDEX idx_receipts_sha256 (sha256)
+);
+
+-- Bảng geocode_cache (Kết quả tra cứu tọa độ theo chuỗi địa điểm đã chuẩn hóa, có thời hạn)
+CREATE TABLE geocode_cache (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    query_key VARCHAR(255) NOT NULL,
+    provider VARCHAR(50) NOT NULL,
+    found BOOLEAN NOT NULL DEFAULT FALSE,
+    latitude DECIMAL(10,8),
+    longitude DECIMAL(11,8),
+    formatted_address VARCHAR(500),
+    expires_at DATETIME NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY unique_geocode_query (query_key)
+);
+
+-- Các indexes được khai báo cùng bảng và khớp với app/models/models.py
+-- (kiểm tra kế hoạch truy vấn: python setup_database.py explain <trip_id>)
 
 -- Thêm dữ liệu mẫu (optional)
 -- INSERT INTO trips (name, description, destination, start_date, end_date, currency, invite_code) 
@@ -107,21 +158,18 @@ CREATE INDEX idx_members_factor ON trip_members(factor);
 -- FLUSH PRIVILEGES;
 
 -- Views để thống kê nhanh
+-- Dùng subquery tương quan thay cho LEFT JOIN nhiều bảng để tránh nhân bản dòng (SUM bị cộng lặp)
 CREATE VIEW trip_statistics AS
 SELECT 
     t.id,
     t.name,
     t.destination,
-    COUNT(DISTINCT tm.id) as member_count,
-    COUNT(DISTINCT a.id) as activity_count,
-    COUNT(DISTINCT e.id) as expense_count,
-    COALESCE(SUM(e.amount * e.exchange_rate), 0) as total_expenses,
-    COALESCE(SUM(CASE WHEN e.is_shared = TRUE THEN e.amount * e.exchange_rate ELSE 0 END), 0) as total_shared_expenses
-FROM trips t
-LEFT JOIN trip_members tm ON t.id = tm.trip_id
-LEFT JOIN activities a ON t.id = a.trip_id
-LEFT JOIN expenses e ON t.id = e.trip_id
-GROUP BY t.id, t.name, t.destination;
+    (SELECT COUNT(*) FROM trip_members tm WHERE tm.trip_id = t.id) as member_count,
+    (SELECT COUNT(*) FROM activities a WHERE a.trip_id = t.id) as activity_count,
+    (SELECT COUNT(*) FROM expenses e WHERE e.trip_id = t.id) as expense_count,
+    (SELECT COALESCE(SUM(e.base_amount), 0) FROM expenses e WHERE e.trip_id = t.id) as total_expenses,
+    (SELECT COALESCE(SUM(e.base_amount), 0) FROM expenses e WHERE e.trip_id = t.id AND e.is_shared = TRUE) as total_shared_expenses
+FROM trips t;
 
 -- Trigger để tự động cập nhật updated_at
 DELIMITER //
@@ -169,12 +217,12 @@ BEGIN
     WHERE id = p_member_id AND trip_id = p_trip_id;
     
     -- Tính tổng tiền đã trả
-    SELECT COALESCE(SUM(amount * exchange_rate), 0) INTO v_total_paid
+    SELECT COALESCE(SUM(base_amount), 0) INTO v_total_paid
     FROM expenses 
     WHERE trip_id = p_trip_id AND paid_by = p_member_id AND is_shared = TRUE;
     
     -- Tính tổng chi phí chung
-    SELECT COALESCE(SUM(amount * exchange_rate), 0) INTO v_total_shared
+    SELECT COALESCE(SUM(base_amount), 0) INTO v_total_shared
     FROM expenses 
     WHERE trip_id = p_trip_id AND is_shared = TRUE;
     